@@ -42,10 +42,14 @@ setup(
         'sigma.parser',
         'sigma.parser.modifiers',
         ],
+    package_data={
+        'sigma.backends': ['index.json'],
+        },
     python_requires='~=3.8',
     install_requires=['PyYAML', 'pymisp', 'progressbar2', 'ruamel.yaml'],
     extras_require={
         'test': ['coverage', 'yamllint', 'attackcti'],
+        'batch': ['numpy'],
     },
     data_files=[
         ('etc/sigma', [ str(p) for p in Path('config/').glob('*.yml') ]),
@@ -58,6 +62,7 @@ setup(
             'sigma2attack = sigma.sigma2attack:main',
             'sigma_similarity = sigma.sigma_similarity:main',
             'sigma_uuid = sigma.sigma_uuid:main',
+            'sigma_match = sigma.sigma_match:main',
         ],
     },
 )
@@ -28,7 +28,7 @@ from sigma.config.mapping import (
 from sigma.parser.condition import SigmaAggregationParser, SigmaConditionParser, SigmaConditionTokenizer
 
 from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
-from sigma.backends.base import SingleTextQueryBackend
+from sigma.backends.base import SingleTextQueryBackend, RuleState
 
 from sigma.parser.modifiers.base import SigmaTypeModifier
 from sigma.parser.modifiers.transform import SigmaContainsModifier, SigmaStartswithModifier, SigmaEndswithModifier
@@ -39,6 +39,7 @@ class AzureLogAnalyticsBackend(SingleTextQueryBackend):
     """Converts Sigma rule into Azure Log Analytics Queries."""
     identifier = "ala"
     active = True
+    coalesce_value_lists = True
     options = SingleTextQueryBackend.options + (
         ("sysmon", False, "Generate Sysmon event queries for generic rules", None),
         (
@@ -67,6 +68,14 @@ class AzureLogAnalyticsBackend(SingleTextQueryBackend):
         SigmaRegularExpressionModifier: "matches regex \"(?i)%s\"",
         SigmaContainsModifier: "contains \"%s\""
     }
+    category = RuleState()
+    product = RuleState()
+    service = RuleState()
+    table = RuleState()
+    eventid = RuleState()
+    tableAggJoinFields = RuleState()
+    tableAggTimeField = RuleState()
+    _agg_var = RuleState()
 
     # _WIN_SECURITY_EVENT_MAP = {
     #     "Image": "NewProcessName",
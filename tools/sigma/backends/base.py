@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
+import threading
 
 import sigma
 import yaml
@@ -22,8 +23,59 @@ import re
 
 from sigma.backends.exceptions import NotSupportedError
 from .mixins import RulenameCommentMixin, QuoteCharMixin
+from sigma.parser.condition import ConditionAND, ConditionOR, ConditionNOT, ConditionNULLValue, ConditionNotNULLValue, NodeSubexpression, SigmaSearchValueAsIs
 from sigma.parser.modifiers.base import SigmaTypeModifier
 
+activeContexts = threading.local()      # conversion contexts of the current thread as dict from backend object ids to contexts
+
+class ConversionContext:
+    """
+    Conversion of one rule by a backend. State of the converted rule is kept in the context instead of the
+    backend object for backend attributes declared as RuleState. Contexts are bound to the thread that
+    converts the rule, therefore one backend object can convert rules in multiple threads concurrently
+    with BaseBackend.convert().
+    """
+    active = 0                  # number of conversions in progress in all threads, RuleState attributes are plain attributes if zero
+    activeLock = threading.Lock()
+
+    def __init__(self, backend, sigmaparser):
+        self.backend = backend
+        self.sigmaparser = sigmaparser
+        self.state = dict()
+
+class RuleState:
+    """
+    Backend attribute that holds state of the currently converted rule. Values assigned while a rule is
+    converted with BaseBackend.convert() are stored in the conversion context, values assigned outside of a
+    conversion (e.g. in the constructor) are the initial values of all following conversions.
+    """
+    __slots__ = ("name", "default")
+
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, backend, owner=None):
+        if ConversionContext.active and backend is not None:
+            context = backend.context
+            if context is not None and self.name in context.state:
+                return context.state[self.name]
+        try:
+            return backend.__dict__[self.name]
+        except KeyError:
+            return self.default
+        except AttributeError:      # access from class
+            return self
+
+    def __set__(self, backend, value):
+        context = backend.context if ConversionContext.active else None
+        if context is None:
+            backend.__dict__[self.name] = value
+        else:
+            context.state[self.name] = value
+
 class BackendOptions(dict):
     """
     Object containing all the options that should be passed to the backend.
@@ -88,12 +140,35 @@ class BaseBackend:
     identifier = "base"
     active = False
     index_field = None    # field name that is used to address indices
+    coalesce_value_lists = False    # condition optimizer merges OR'ed values of the same field into a value list, requires list support for all fields and value types
+    coalesce_mixed_wildcards = True # values with and without wildcards may be merged into one value list
     file_list = None
     options = tuple()     # a list of tuples with following elements: option name, default value, help text, target attribute name (option name if None)
     config_required = True
     default_config = None
     mapExpression = ""
     ymlFileName = None
+    overrides = None      # compiled overrides from configuration, built on first use by getOverrides()
+    # Parse tree node types and the names of the methods that generate them, used by generateNode(). Subclasses
+    # register handlers for further node types or replace handlers by extending or replacing this dict.
+    nodeHandlers = {
+            ConditionAND: "generateANDNode",
+            ConditionOR: "generateORNode",
+            ConditionNOT: "generateNOTNode",
+            ConditionNULLValue: "generateNULLValueNode",
+            ConditionNotNULLValue: "generateNotNULLValueNode",
+            NodeSubexpression: "generateSubexpressionNode",
+            SigmaSearchValueAsIs: "generateValueAsIsNode",
+            tuple: "generateMapItemNode",
+            str: "generateValueNode",
+            int: "generateValueNode",
+            list: "generateListNode",
+            SigmaTypeModifier: "generateTypedValueNode",
+            }
+    nodeHandlersWithoutOverrides = frozenset(("generateValueAsIsNode",))     # handlers whose results are not changed by overrides
+    overrides_per_node = False  # apply overrides to the result of each node instead of once to the query of the search
+    nodeDispatch = None   # node type -> (bound handler method, apply overrides), built on first use by getNodeHandler()
+    nodeDepth = RuleState(0)    # nesting of generateNode() calls, overrides are applied when the outermost call returns
 
     def __init__(self, sigmaconfig, backend_options=dict()):
         """
@@ -116,6 +191,40 @@ class BaseBackend:
     def setYmlFileName(self, filename):
         self.ymlFileName = filename
 
+    @property
+    def context(self):
+        """Conversion context of the rule converted by this backend in the current thread or None"""
+        try:
+            return activeContexts.contexts.get(id(self))
+        except AttributeError:
+            return None
+
+    def convert(self, sigmaparser):
+        """
+        Generate query for rule like generate() in a new conversion context that is bound to the current
+        thread. Rules can be converted concurrently in multiple threads by one backend object with this
+        method, if the backend keeps its per-rule state in RuleState attributes. In contrast to generate(),
+        state of previously converted rules isn't visible in the conversion.
+        """
+        try:
+            contexts = activeContexts.contexts
+        except AttributeError:
+            contexts = activeContexts.contexts = dict()
+        key = id(self)
+        outer = contexts.get(key)
+        contexts[key] = ConversionContext(self, sigmaparser)
+        with ConversionContext.activeLock:
+            ConversionContext.active += 1
+        try:
+            return self.generate(sigmaparser)
+        finally:
+            with ConversionContext.activeLock:
+                ConversionContext.active -= 1
+            if outer is None:
+                del contexts[key]
+            else:
+                contexts[key] = outer
+
     def generate(self, sigmaparser):
         """Method is called for each sigma rule and receives the parsed rule (SigmaParser)"""
         if len(sigmaparser.condparsed) > 1:
@@ -142,49 +251,80 @@ class BaseBackend:
         #result = self.applyOverrides(result)
         return result
 
-    def applyOverrides(self, query):
-        try:
-            if 'overrides' in self.sigmaconfig.config and isinstance(query, str):
+    def getOverrides(self):
+        """
+        Return overrides from the 'overrides' section of the configuration as list of (compiled regular
+        expression or None, literal, replacement). Overrides are compiled once, an invalid override ends
+        the list like an error while applying it.
+        """
+        if self.overrides is None:
+            self.overrides = list()
+            try:
                 for expression in self.sigmaconfig.config['overrides']:
-                    if 'regexes' in expression:
-                        for x in expression['regexes']:
-                            sub = expression['field']
-                            value = expression['value']
-                            query = re.sub(x, self.mapExpression % (sub, value), query)
-                    if 'literals' in expression:
-                        for x in expression['literals']:
-                            sub = expression['field']
-                            value = expression['value']
-                            query = query.replace(x, self.mapExpression % (sub, value))
-        except Exception:
-            pass
+                    replacement = self.mapExpression % (expression['field'], expression['value'])
+                    for regex in expression.get('regexes', ()):
+                        self.overrides.append((re.compile(regex), None, replacement))
+                    for literal in expression.get('literals', ()):
+                        self.overrides.append((None, literal, replacement))
+            except Exception:
+                pass
+        return self.overrides
+
+    def applyOverrides(self, query):
+        overrides = self.overrides if self.overrides is not None else self.getOverrides()
+        if overrides and isinstance(query, str):
+            try:
+                for regex, literal, replacement in overrides:
+                    if regex is not None:
+                        query = regex.sub(replacement, query)
+                    else:
+                        query = query.replace(literal, replacement)
+            except Exception:
+                pass
         return query
 
-    def generateNode(self, node):
-        if type(node) == sigma.parser.condition.ConditionAND:
-            return self.applyOverrides(self.generateANDNode(node))
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            return self.applyOverrides(self.generateORNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            return self.applyOverrides(self.generateNOTNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNULLValue:
-            return self.applyOverrides(self.generateNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNotNULLValue:
-            return self.applyOverrides(self.generateNotNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            return self.applyOverrides(self.generateSubexpressionNode(node))
-        elif type(node) == sigma.parser.condition.SigmaSearchValueAsIs:
-            return self.generateValueAsIsNode(node)
-        elif type(node) == tuple:
-            return self.applyOverrides(self.generateMapItemNode(node))
-        elif type(node) in (str, int):
-            return self.applyOverrides(self.generateValueNode(node))
-        elif type(node) == list:
-            return self.applyOverrides(self.generateListNode(node))
-        elif isinstance(node, SigmaTypeModifier):
-            return self.applyOverrides(self.generateTypedValueNode(node))
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
+    def getNodeHandler(self, nodetype):
+        """
+        Return handler of parse tree node type as tuple of bound method and flag if overrides are applied to
+        its result: None if not, True if to the result of each node, False if to the result of the outermost
+        node only. Subclasses of node types from nodeHandlers are handled like their base class, except
+        subclasses of builtin types like bool.
+        """
+        if self.nodeDispatch is None:
+            self.nodeDispatch = dict()
+        bases = nodetype.__mro__[:-1] if nodetype.__module__ != "builtins" else (nodetype,)
+        for base in bases:
+            try:
+                name = self.nodeHandlers[base]
+            except KeyError:
+                continue
+            if not self.getOverrides() or name in self.nodeHandlersWithoutOverrides:
+                overrides = None
+            else:
+                overrides = bool(self.overrides_per_node)
+            handler = self.nodeDispatch[nodetype] = (getattr(self, name), overrides)
+            return handler
+        raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(nodetype)))
+
+    def generateNode(self, node, *args):
+        """Generate query from parse tree node by the handler of its type. Further arguments are passed to the handler."""
+        try:
+            handler, overrides = self.nodeDispatch[type(node)]
+        except (KeyError, TypeError):
+            handler, overrides = self.getNodeHandler(type(node))
+        if overrides is None:
+            return handler(node, *args)
+        elif overrides:
+            return self.applyOverrides(handler(node, *args))
+        depth = self.nodeDepth
+        self.nodeDepth = depth + 1
+        try:
+            result = handler(node, *args)
+        finally:
+            self.nodeDepth = depth
+        if depth == 0:
+            return self.applyOverrides(result)
+        return result
 
     def generateValueAsIsNode(self, node):
         raise NotImplementedError("Node type not implemented for this backend")
@@ -18,20 +18,75 @@ import sys
 import json
 import re
 import os
+import pkgutil
+import importlib
 import sigma.backends
 from .base import BaseBackend
 from sigma.tools import getAllSubclasses, getClassDict
 
+path = os.path.dirname(__file__)
+index_path = os.path.join(path, "index.json")
+
 def getBackendList():
     """Return list of backend classes"""
-    path = os.path.dirname(__file__)
     return getAllSubclasses(path, "backends", BaseBackend)
 
 def getBackendDict():
     return getClassDict(getBackendList())
 
+def getModuleNames():
+    """Return sorted list of names of all modules contained in backend directory"""
+    return sorted(name for finder, name, ispkg in pkgutil.iter_modules([ path ]))
+
+def generateBackendIndex():
+    """Import all backends and return index: backend identifier -> name of module that defines the backend class"""
+    return {
+        "modules": getModuleNames(),
+        "backends": { identifier: cls.__module__.rsplit(".", 1)[-1] for identifier, cls in sorted(getBackendDict().items()) },
+        }
+
+def writeBackendIndex():
+    with open(index_path, "w") as f:
+        json.dump(generateBackendIndex(), f, indent=2)
+        f.write("\n")
+
+backend_index = None
+
+def getBackendIndex():
+    """
+    Return mapping of backend identifiers to module names from the generated backend index, which allows to
+    resolve backends without importing all backend modules. The index is generated from all backend modules
+    if it doesn't exist or doesn't cover the modules contained in the backend directory.
+    """
+    global backend_index
+    if backend_index is None:
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["modules"] != getModuleNames():
+                raise ValueError("Backend index is outdated")
+        except (OSError, ValueError, KeyError, TypeError):
+            index = generateBackendIndex()
+        backend_index = index["backends"]
+    return backend_index
+
+def getBackendIdentifiers():
+    """Return list of identifiers of all backends"""
+    return list(getBackendIndex().keys())
+
 def getBackend(name):
+    """Return backend class by identifier. Only the module containing the backend is imported."""
+    try:
+        module = importlib.import_module(".{}".format(getBackendIndex()[name]), __package__)
+        for cls in vars(module).values():
+            if type(cls) == type and issubclass(cls, BaseBackend) and cls.active and cls.identifier == name:
+                return cls
+    except KeyError:        # backend not indexed, try all modules
+        pass
     try:
         return getBackendDict()[name]
     except KeyError as e:
         raise LookupError("Backend not found") from e
+
+if __name__ == "__main__":
+    writeBackendIndex()
@@ -22,6 +22,7 @@ class DnifBackend(SingleTextQueryBackend):
     mapExpression = "%s == \"%s\""
     mapListsSpecialHandling = True
     mapListValueExpression = "%s IN %s"
+    overrides_per_node = True   # overrides of the DNIF configuration match field/value conditions before they are joined
     active = True
 
     config_required = True
@@ -28,7 +28,7 @@ class OutliersBackend(ElasticsearchDSLBackend, MultiRuleOutputMixin):
     active = True
 
     def generate(self, sigmaparser):
-        super().generate(sigmaparser)
+        self.generateQueries(sigmaparser)
 
         self.tags = sigmaparser.parsedyaml.setdefault("tags", "")
 
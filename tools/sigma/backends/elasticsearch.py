@@ -19,6 +19,7 @@ import re
 from fnmatch import fnmatch
 import sys
 import os
+import threading
 from random import randrange
 from distutils.util import strtobool
 from uuid import uuid4
@@ -29,11 +30,13 @@ from sigma.parser.modifiers.type import SigmaRegularExpressionModifier, SigmaTyp
 from sigma.parser.condition import ConditionOR, ConditionAND, NodeSubexpression, SigmaAggregationParser, SigmaConditionParser, SigmaConditionTokenizer
 
 from sigma.config.mapping import ConditionalFieldMapping
-from .base import BaseBackend, SingleTextQueryBackend
+from .base import BaseBackend, SingleTextQueryBackend, RuleState
 from .mixins import RulenameCommentMixin, MultiRuleOutputMixin
 from .exceptions import NotSupportedError
 
 class DeepFieldMappingMixin(object):
+    logsource = RuleState()
+
     def fieldNameMapping(self, fieldname, value):
         if isinstance(fieldname, str):
             get_config = self.sigmaconfig.fieldmappings.get(fieldname)
@@ -73,6 +76,8 @@ class ElasticsearchWildcardHandlingMixin(object):
             )
     reContainsWildcard = re.compile("(?:(?<!\\\\)|\\\\\\\\)[*?]").search
     uuid_regex = re.compile( "[0-9a-fA-F]{8}(\\\)?-[0-9a-fA-F]{4}(\\\)?-[0-9a-fA-F]{4}(\\\)?-[0-9a-fA-F]{4}(\\\)?-[0-9a-fA-F]{12}", re.IGNORECASE )
+    matchKeyword = RuleState(True)
+    CaseInSensitiveField = RuleState(False)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -270,6 +275,8 @@ class ElasticsearchQuerystringBackend(DeepFieldMappingMixin, ElasticsearchWildca
     """Converts Sigma rule into Elasticsearch query string. Only searches, no aggregations."""
     identifier = "es-qs"
     active = True
+    coalesce_value_lists = True
+    coalesce_mixed_wildcards = False     # values with wildcards are searched in keyword fields, plain values in analyzed fields
 
     reEscape = re.compile("([\s+\\-=!(){}\\[\\]^\"~:/]|(?<!\\\\)\\\\(?![*?\\\\])|\\\\u|&&|\\|\\|)")
     andToken = " AND "
@@ -425,6 +432,9 @@ class ElasticsearchEQLBackend(DeepFieldMappingMixin, ElasticsearchWildcardHandli
     reEscape = re.compile('(["\\\\])')
 
     sort_condition_lists = True
+    categories = RuleState()
+    sequence = RuleState(False)
+    maxspan = RuleState()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -511,25 +521,38 @@ class ElasticsearchEQLBackend(DeepFieldMappingMixin, ElasticsearchWildcardHandli
             return "`%s`" % fieldname
         return fieldname
 
-class ElasticsearchDSLBackend(DeepFieldMappingMixin, RulenameCommentMixin, ElasticsearchWildcardHandlingMixin, BaseBackend):
+class ElasticsearchDSLBackend(DeepFieldMappingMixin, RulenameCommentMixin, ElasticsearchWildcardHandlingMixin, MultiRuleOutputMixin, BaseBackend):
     """Converts Sigma rule into Elasticsearch DSL query"""
     identifier = 'es-dsl'
     active = True
+    coalesce_value_lists = True
+    coalesce_mixed_wildcards = False     # values with wildcards are searched in keyword fields, plain values in analyzed fields
     options = RulenameCommentMixin.options + ElasticsearchWildcardHandlingMixin.options + (
         ("es", "http://localhost:9200", "Host and port of Elasticsearch instance", None),
         ("output", "import", "Output format: import = JSON search request, curl = Shell script that do the search queries via curl", "output_type"),
         ("set_size", "0", "value for the size of returned datasets.", None)
     )
-    interval = None
-    title = None
+    interval = RuleState()
+    title = RuleState()
+    indices = RuleState()
+    queries = RuleState()
     reEscape = re.compile( "([\s+\\-=!(){}\\[\\]^\"~:/]|(?<!\\\\)\\\\(?![*?\\\\])|\\\\u|&&|\\|\\|)" )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.queries = []
+        self.pendingQuery = None
+        self.outputLock = threading.Lock()      # queries of rules converted concurrently are written one by one
 
     def generate(self, sigmaparser):
         """Method is called for each sigma rule and receives the parsed rule (SigmaParser)"""
+        for query in self.generateQueries(sigmaparser):
+            self.writeQuery(query)
+        self.queries = []
+
+    def generateQueries(self, sigmaparser):
+        """Generate queries of rule into a new list in self.queries and return it"""
+        self.queries = []
         self.title = sigmaparser.parsedyaml.setdefault("title", "")
         logsource = sigmaparser.get_logsource()
         if logsource is None:
@@ -572,6 +595,7 @@ class ElasticsearchDSLBackend(DeepFieldMappingMixin, RulenameCommentMixin, Elast
                  pass
 
             self.generateAfter(parsed)
+        return self.queries
 
     def generateQuery(self, parsed):
         self.queries[-1]['query']['constant_score']['filter'] = self.generateNode(parsed.parsedSearch)
@@ -777,6 +801,23 @@ class ElasticsearchDSLBackend(DeepFieldMappingMixin, RulenameCommentMixin, Elast
 
             self.queries[-1]['query']['constant_score']['filter']['bool']['must'].append({'range': {dateField: {'gte': 'now-%s'%self.interval}}})
 
+    def writeQuery(self, query):
+        """
+        Write query as element of the JSON array of all queries. A single query is output without array, therefore
+        the first query is held back until it is known if further queries follow.
+        """
+        with self.outputLock:
+            if self.output_type == 'curl':      # only first query is output
+                if self.pendingQuery is None:
+                    self.pendingQuery = query
+            elif self.pendingQuery is None and not self.outputWritten:
+                self.pendingQuery = query
+            else:
+                if self.pendingQuery is not None:
+                    self.writeOutput("[\n" + json.dumps([self.pendingQuery], indent=2)[2:-2])
+                    self.pendingQuery = None
+                self.writeOutput(",\n" + json.dumps([query], indent=2)[2:-2])
+
     def finalize(self):
         """
         Is called after the last file was processed with generate(). The right place if this backend is not intended to
@@ -787,13 +828,14 @@ class ElasticsearchDSLBackend(DeepFieldMappingMixin, RulenameCommentMixin, Elast
             index = '%s/'%self.indices[0]
 
         if self.output_type == 'curl':
-            for query in self.queries:
-                return "\curl -XGET '%s/%s_search?pretty' -H 'Content-Type: application/json' -d'%s'" % (self.es, index, json.dumps(query, indent=2))
+            if self.pendingQuery is not None:
+                return "\curl -XGET '%s/%s_search?pretty' -H 'Content-Type: application/json' -d'%s'" % (self.es, index, json.dumps(self.pendingQuery, indent=2))
+        elif self.outputWritten:
+            return self.finalizeOutput("\n]")
+        elif self.pendingQuery is not None:
+            return json.dumps(self.pendingQuery, indent=2)
         else:
-            if len(self.queries) == 1:
-                return json.dumps(self.queries[0], indent=2)
-            else:
-                return json.dumps(self.queries, indent=2)
+            return json.dumps([], indent=2)
 
 class KibanaBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin):
     """Converts Sigma rule into Kibana JSON Configuration files (searches only)."""
@@ -808,7 +850,6 @@ class KibanaBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.kibanaconf = list()
         self.indexsearch = set()
 
     def generate(self, sigmaparser):
@@ -849,7 +890,7 @@ class KibanaBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin):
                             indexvar=self.index_variable_name(index)
                             )
                         )
-                self.kibanaconf.append({
+                self.writeItem({
                         "_id": rulename,
                         "_type": "search",
                         "_source": {
@@ -881,28 +922,19 @@ class KibanaBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin):
                         }
                     })
 
-    def finalize(self):
+    def writeItem(self, item):
+        """Write saved search as element of the JSON array that is imported in Kibana"""
         if self.output_type == "import":        # output format that can be imported via Kibana UI
-            for item in self.kibanaconf:    # JSONize kibanaSavedObjectMeta.searchSourceJSON
-                item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'])
-            if self.kibanaconf:
-                return json.dumps(self.kibanaconf, indent=2)
+            item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'])     # JSONize kibanaSavedObjectMeta.searchSourceJSON
+            self.writeOutput((",\n" if self.outputWritten else "[\n") + json.dumps([item], indent=2)[2:-2])     # array element with indentation of complete array
+
+    def finalize(self):
+        if self.output_type == "import":
+            if self.outputWritten:
+                return self.finalizeOutput("\n]")
         elif self.output_type == "curl":
             for item in self.indexsearch:
                 return item
-            for item in self.kibanaconf:
-                item['_source']['kibanaSavedObjectMeta']['searchSourceJSON']['index'] = "$" + self.index_variable_name(item['_source']['kibanaSavedObjectMeta']['searchSourceJSON']['index'])   # replace index pattern with reference to variable that will contain Kibana index UUID at script runtime
-                item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'])     # Convert it to JSON string as expected by Kibana
-                item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'] = item['_source']['kibanaSavedObjectMeta']['searchSourceJSON'].replace("\\", "\\\\")      # Add further escaping for escaped quotes for shell
-                return "curl -s -XPUT -H 'Content-Type: application/json' --data-binary @- '{es}/{index}/doc/{doc_id}' <<EOF\n{doc}\nEOF".format(
-                        es=self.es,
-                        index=self.index,
-                        doc_id="search:" + item['_id'],
-                        doc=json.dumps({
-                            "type": "search",
-                            "search": item['_source']
-                            }, indent=2)
-                        )
         else:
             raise NotImplementedError("Output type '%s' not supported" % self.output_type)
 
@@ -950,7 +982,6 @@ class XPackWatcherBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.watcher_alert = dict()
         self.url_prefix = self.watcher_urls[self.watcher_url]
 
     def generate(self, sigmaparser):
@@ -1162,7 +1193,7 @@ class XPackWatcherBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
                             }
                         }
 
-            self.watcher_alert[rulename] = {
+            self.writeWatch(rulename, {
                               "metadata": {
                                   "name": title,
                                   "description": description,
@@ -1209,20 +1240,20 @@ class XPackWatcherBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
                                 }
                               },
                               "actions": { **action }
-                            }
+                            })
+
+    def writeWatch(self, rulename, rule):
+        if self.output_type == "plain":     # output request line + body
+            self.writeOutput("PUT %s/watch/%s\n%s\n" % (self.url_prefix, rulename, json.dumps(rule, indent=2)))
+        elif self.output_type == "curl":      # output curl command line
+            self.writeOutput("curl -s -XPUT -H 'Content-Type: application/json' --data-binary @- %s/%s/watch/%s <<EOF\n%s\nEOF\n" % (self.es, self.url_prefix, rulename, json.dumps(rule, indent=2)))
+        elif self.output_type == "json":    # output compressed watcher json, one per line
+            self.writeOutput(json.dumps(rule) + "\n")
+        else:
+            raise NotImplementedError("Output type '%s' not supported" % self.output_type)
 
     def finalize(self):
-        result = ""
-        for rulename, rule in self.watcher_alert.items():
-            if self.output_type == "plain":     # output request line + body
-                result += "PUT %s/watch/%s\n%s\n" % (self.url_prefix, rulename, json.dumps(rule, indent=2))
-            elif self.output_type == "curl":      # output curl command line
-                result += "curl -s -XPUT -H 'Content-Type: application/json' --data-binary @- %s/%s/watch/%s <<EOF\n%s\nEOF\n" % (self.es, self.url_prefix, rulename, json.dumps(rule, indent=2))
-            elif self.output_type == "json":    # output compressed watcher json, one per line
-                result += json.dumps(rule) + "\n"
-            else:
-                raise NotImplementedError("Output type '%s' not supported" % self.output_type)
-        return result
+        return self.finalizeOutput()
 
 class ElastalertBackend(DeepFieldMappingMixin, MultiRuleOutputMixin):
     """Elastalert backend"""
@@ -1251,7 +1282,6 @@ class ElastalertBackend(DeepFieldMappingMixin, MultiRuleOutputMixin):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.elastalert_alerts = dict()
         self.fields = []
 
     def generate(self, sigmaparser):
@@ -1356,7 +1386,6 @@ class ElastalertBackend(DeepFieldMappingMixin, MultiRuleOutputMixin):
 
             #Increment rule number
             rule_number += 1
-            self.elastalert_alerts[rule_object['name']] = rule_object
             #Clear fields
             self.fields = []
             return str(yaml.dump(rule_object, default_flow_style=False, width=10000))
@@ -1409,11 +1438,6 @@ class ElastalertBackend(DeepFieldMappingMixin, MultiRuleOutputMixin):
 
     def finalize(self):
         pass
-        # result = ""
-        # for rulename, rule in self.elastalert_alerts.items():
-            # result += yaml.dump(rule, default_flow_style=False, width=10000)
-            # result += '\n'
-        # return result
 
 class ElastalertBackendDsl(ElastalertBackend, ElasticsearchDSLBackend):
     """Converts Sigma rule into ElastAlert DSL query"""
@@ -1423,6 +1447,7 @@ class ElastalertBackendDsl(ElastalertBackend, ElasticsearchDSLBackend):
 
     def generateQuery(self, parsed):
         #Generate ES DSL Query
+        self.queries = []
         super().generateBefore(parsed)
         super().generateQuery(parsed)
         super().generateAfter(parsed)
@@ -1450,6 +1475,8 @@ class ElasticSearchRuleBackend(object):
                 ("custom_tag", None , "Add custom tag. for multi split with a comma tag1,tag2 ", None),
             )
     default_rule_type = "query"
+    rule_type = RuleState()
+    rule_threshold = RuleState()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1762,7 +1789,6 @@ class KibanaNdjsonBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.kibanaconf = list()
         self.indexsearch = set()
 
     def generate(self, sigmaparser):
@@ -1803,7 +1829,7 @@ class KibanaNdjsonBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
                             indexvar=self.index_variable_name(index)
                             )
                         )
-                self.kibanaconf.append({
+                self.writeItem({
                         "id": rulename,
                         "type": "search",
                         "attributes": {
@@ -1842,32 +1868,19 @@ class KibanaNdjsonBackend(ElasticsearchQuerystringBackend, MultiRuleOutputMixin)
                         ]
                     })
 
-    def finalize(self):
+    def writeItem(self, item):
+        """Write saved search as line of the NDJSON file that is imported in Kibana"""
         if self.output_type == "import":        # output format that can be imported via Kibana UI
-            for item in self.kibanaconf:    # JSONize kibanaSavedObjectMeta.searchSourceJSON
-                item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'])
-            if self.kibanaconf:
-                ndjson = ""
-                for item in self.kibanaconf:
-                    ndjson += json.dumps(item)
-                    ndjson += "\n"
-                return ndjson
+            item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'])     # JSONize kibanaSavedObjectMeta.searchSourceJSON
+            self.writeOutput(json.dumps(item) + "\n")
+
+    def finalize(self):
+        if self.output_type == "import":
+            if self.outputWritten:
+                return self.finalizeOutput()
         elif self.output_type == "curl":
             for item in self.indexsearch:
                 return item
-            for item in self.kibanaconf:
-                item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON']['index'] = "$" + self.index_variable_name(item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON']['index'])   # replace index pattern with reference to variable that will contain Kibana index UUID at script runtime
-                item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'] = json.dumps(item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'])     # Convert it to JSON string as expected by Kibana
-                item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'] = item['attributes']['kibanaSavedObjectMeta']['searchSourceJSON'].replace("\\", "\\\\")      # Add further escaping for escaped quotes for shell
-                return "curl -s -XPUT -H 'Content-Type: application/json' --data-binary @- '{es}/{index}/doc/{doc_id}' <<EOF\n{doc}\nEOF".format(
-                        es=self.es,
-                        index=self.index,
-                        doc_id="search:" + item['_id'],
-                        doc=json.dumps({
-                            "type": "search",
-                            "search": item['attributes']
-                            }, indent=2)
-                        )
         else:
             raise NotImplementedError("Output type '%s' not supported" % self.output_type)
 
@@ -451,29 +451,10 @@ class FortisemBackend(RulenameCommentMixin, BaseBackend, QuoteCharMixin):
             return tmpstr
 
     def generateNode(self, node, regdicts={}):
-        if type(node) == sigma.parser.condition.ConditionAND:
-            return self.applyOverrides(self.generateANDNode(node))
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            return self.applyOverrides(self.generateORNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            return self.applyOverrides(self.generateNOTNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNULLValue:
-            return self.applyOverrides(self.generateNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNotNULLValue:
-            return self.applyOverrides(self.generateNotNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            return self.applyOverrides(self.generateSubexpressionNode(node))
-        elif type(node) == tuple:
+        if type(node) == tuple:
             return self.applyOverrides(self.generateMapItemNode(node, regdicts))
-        elif type(node) in (str, int):
-            return self.applyOverrides(self.generateValueNode(node))
-        elif type(node) == list:
-            return self.applyOverrides(self.generateListNode(node))
-        elif isinstance(node, SigmaTypeModifier):
-            return self.applyOverrides(self.generateTypedValueNode(node))
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
-        
+        return super().generateNode(node)
+
    #A AND NOT B ---> != 
     def covertToNotValue(self, item, regdicts={}):
         if type(item) == sigma.parser.condition.ConditionAND:
@@ -51,6 +51,18 @@ class HAWKBackend(SingleTextQueryBackend):
     mapExpression = "%s=%s"
     mapListsSpecialHandling = True
     aql_database = "events"
+    nodeHandlers = {
+            sigma.parser.condition.ConditionAND: "generateANDNode",
+            sigma.parser.condition.ConditionOR: "generateORNode",
+            sigma.parser.condition.ConditionNOT: "generateNOTNode",
+            sigma.parser.condition.ConditionNULLValue: "generateNULLValueNode",
+            sigma.parser.condition.ConditionNotNULLValue: "generateNotNULLValueNode",
+            sigma.parser.condition.NodeSubexpression: "generateSubexpressionNode",
+            tuple: "generateMapItemNode",
+            str: "generateKeywordNode",
+            int: "generateKeywordNode",
+            list: "generateListNode",
+            }
 
     def cleanKey(self, key):
         if key == None:
@@ -61,79 +73,51 @@ class HAWKBackend(SingleTextQueryBackend):
         """Remove quotes in text"""
         return value
 
-    def generateNode(self, node, notNode=False):
-        #print(type(node))
+    def generateKeywordNode(self, node, notNode=False):
+        nodeRet = {"key": "",  "description": "", "class": "column", "return": "str", "args": { "comparison": { "value": "=" }, "str": { "value": "5", "regex": "true" } } }
+        #key = next(iter(self.sigmaparser.parsedyaml['detection'])) 
+        key = "payload"
+
+        #nodeRet['key'] = self.cleanKey(key).lower()
+        nodeRet['key'] = key
+
         #print(node)
-        #print("Not: ", notNode)
-        if type(node) == sigma.parser.condition.ConditionAND:
-            return self.generateANDNode(node, notNode)
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            #print("OR NODE")
-            #print(node)
-            return self.generateORNode(node, notNode)
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            #print("NOT NODE")
-            #print(node)
-            return self.generateNOTNode(node)
-        elif type(node) == sigma.parser.condition.ConditionNULLValue:
-            return self.generateNULLValueNode(node, notNode)
-        elif type(node) == sigma.parser.condition.ConditionNotNULLValue:
-            return self.generateNotNULLValueNode(node)
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            #print(node)
-            return self.generateSubexpressionNode(node, notNode)
-        elif type(node) == tuple:
-            #print("TUPLE: ", node)
-            return self.generateMapItemNode(node, notNode)
-        elif type(node) in (str, int):
-            nodeRet = {"key": "",  "description": "", "class": "column", "return": "str", "args": { "comparison": { "value": "=" }, "str": { "value": "5", "regex": "true" } } }
-            #key = next(iter(self.sigmaparser.parsedyaml['detection'])) 
-            key = "payload"
-
-            #nodeRet['key'] = self.cleanKey(key).lower()
-            nodeRet['key'] = key
-
-            #print(node)
-            #print("KEY: ", key)
-            # they imply the entire payload
-            nodeRet['description'] = key
-            nodeRet['rule_id'] = str(uuid.uuid4())
-            value = self.generateValueNode(node, False).replace("*", "EEEESTAREEE")
-            if value[-2:] == "\\\\":
-                value = value[:-2]
-            value = re.escape(value)
-            value = value.replace("EEEESTAREEE", ".*")
-            endsWith = False
-            startsWith = False
-            if value[0:2] == ".*":  
-                value = value[2:]
-                endsWith = True
-            if value[-2:] == ".*":
-                value = value[:-2]
-                startsWith = True
-
-            if endsWith and not startsWith:
-                nodeRet['args']['str']['value'] = value + "$"
-            elif startsWith and not endsWith:
-                nodeRet['args']['str']['value'] = "^" + value
-            else:
+        #print("KEY: ", key)
+        # they imply the entire payload
+        nodeRet['description'] = key
+        nodeRet['rule_id'] = str(uuid.uuid4())
+        value = self.generateValueNode(node, False).replace("*", "EEEESTAREEE")
+        if value[-2:] == "\\\\":
+            value = value[:-2]
+        value = re.escape(value)
+        value = value.replace("EEEESTAREEE", ".*")
+        endsWith = False
+        startsWith = False
+        if value[0:2] == ".*":  
+            value = value[2:]
+            endsWith = True
+        if value[-2:] == ".*":
+            value = value[:-2]
+            startsWith = True
+
+        if endsWith and not startsWith:
+            nodeRet['args']['str']['value'] = value + "$"
+        elif startsWith and not endsWith:
+            nodeRet['args']['str']['value'] = "^" + value
+        else:
 
-                # custom, since we trim up  string size in log to save bytes
-                if key == 'Provider_Name':
-                    nodeRet['key'] = "product_name"
-                    if type(value) is str and value[0:17] == 'Microsoft-Windows':
-                        value = value[18:]
+            # custom, since we trim up  string size in log to save bytes
+            if key == 'Provider_Name':
+                nodeRet['key'] = "product_name"
+                if type(value) is str and value[0:17] == 'Microsoft-Windows':
+                    value = value[18:]
 
-                nodeRet['args']['str']['value'] = value
+            nodeRet['args']['str']['value'] = value
 
-            if notNode:
-                nodeRet["args"]["comparison"]["value"] = "!="
+        if notNode:
+            nodeRet["args"]["comparison"]["value"] = "!="
 
-            return nodeRet
-        elif type(node) == list:
-            return self.generateListNode(node, notNode)
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
+        return nodeRet
 
     def generateANDNode(self, node, notNode=False):
         ret = { "id" : "and", "key": "And", "children" : [ ] }
@@ -183,7 +167,7 @@ class HAWKBackend(SingleTextQueryBackend):
             return result[0]
         return self.listExpression % (self.listSeparator.join(result))
 
-    def generateNOTNode(self, node):
+    def generateNOTNode(self, node, notNode=False):
         generated = self.generateNode(node.item, True)
         return generated
 
@@ -408,7 +392,7 @@ class HAWKBackend(SingleTextQueryBackend):
     def generateValueNode(self, node, keypresent):
         return self.valueExpression % (self.cleanValue(str(node)))
 
-    def generateNULLValueNode(self, node, notNode):
+    def generateNULLValueNode(self, node, notNode=False):
         # node.item
         nodeRet = { "key" : "empty", "description" : "Value Does Not Exist (IS NULL)", "class" : "function", "inputs" : { "comparison" : { "order" : 0, "source" : "comparison", "type" : "comparison" }, "column" : { "order" : 1, "source" : "columns", "type" : "str" } }, "args" : { "comparison" : { "value" : "!=" }, "column" : { "value" : node.item } }, "return" : "boolean" }
         nodeRet['args']['column']['value'] = self.cleanKey(node.item).lower()
@@ -421,7 +405,7 @@ class HAWKBackend(SingleTextQueryBackend):
         # return json.dumps(nodeRet)
         return nodeRet
 
-    def generateNotNULLValueNode(self, node):
+    def generateNotNULLValueNode(self, node, notNode=False):
         # return self.notNullExpression % (node.item)
         return node.item
 
@@ -174,8 +174,13 @@ def none_representer(dumper, _):
     return dumper.represent_scalar(u'tag:yaml.org,2002:null', '')
 
 
-yaml.add_representer(str, str_presenter)
-yaml.add_representer(type(None), none_representer)
+class LaceworkDumper(yaml.Dumper):
+    """YAML dumper with the representers above, which must not affect the output of other backends"""
+    pass
+
+
+LaceworkDumper.add_representer(str, str_presenter)
+LaceworkDumper.add_representer(type(None), none_representer)
 
 
 class LaceworkBackend(SingleTextQueryBackend):
@@ -198,6 +203,8 @@ class LaceworkBackend(SingleTextQueryBackend):
     mapExpression = '%s = %s'
     mapListValueExpression = '%s %s'
     reEscape = re.compile("(')")
+    nodeHandlers = { **SingleTextQueryBackend.nodeHandlers, tuple: "generateSelfJoinMapItemNode" }
+    nodeHandlersWithoutOverrides = SingleTextQueryBackend.nodeHandlersWithoutOverrides | { "generateSelfJoinMapItemNode" }
 
     def generate(self, sigmaparser):
         """
@@ -237,29 +244,8 @@ class LaceworkBackend(SingleTextQueryBackend):
 
         return result
 
-    def generateNode(self, node):
-        if type(node) == sigma.parser.condition.ConditionAND:
-            return self.applyOverrides(self.generateANDNode(node))
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            return self.applyOverrides(self.generateORNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            return self.applyOverrides(self.generateNOTNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNULLValue:
-            return self.applyOverrides(self.generateNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.ConditionNotNULLValue:
-            return self.applyOverrides(self.generateNotNULLValueNode(node))
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            return self.applyOverrides(self.generateSubexpressionNode(node))
-        elif type(node) == tuple:
-            return self.applySelfJoinFilter(node, self.applyOverrides(self.generateMapItemNode(node)))
-        elif type(node) in (str, int):
-            return self.applyOverrides(self.generateValueNode(node))
-        elif type(node) == list:
-            return self.applyOverrides(self.generateListNode(node))
-        elif isinstance(node, SigmaTypeModifier):
-            return self.applyOverrides(self.generateTypedValueNode(node))
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
+    def generateSelfJoinMapItemNode(self, node):
+        return self.applySelfJoinFilter(node, self.applyOverrides(self.generateMapItemNode(node)))
 
     def applySelfJoinFilter(self, node, query):
         if type(node) != tuple:
@@ -573,6 +559,7 @@ class LaceworkQuery:
 
         return yaml.dump(
             o,
+            Dumper=LaceworkDumper,
             explicit_start=True,
             default_flow_style=False,
             sort_keys=False
@@ -773,6 +760,7 @@ class LaceworkPolicy:
 
         return yaml.dump(
             o,
+            Dumper=LaceworkDumper,
             explicit_start=True,
             default_flow_style=False,
             sort_keys=False
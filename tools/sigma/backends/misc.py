@@ -16,7 +16,11 @@
 
 import re
 from .base import BaseBackend
-from .mixins import QuoteCharMixin
+from .mixins import QuoteCharMixin, MultiRuleOutputMixin
+from .pymatch import RequiredLiteralsMixin, parseWildcards
+from sigma.parser.modifiers.base import SigmaTypeModifier
+from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
+from sigma.parser.modifiers.transform import SigmaContainsModifier
 
 class GrepBackend(BaseBackend, QuoteCharMixin):
     """Generates Perl compatible regular expressions and puts 'grep -P' around it"""
@@ -64,3 +68,178 @@ class GrepBackend(BaseBackend, QuoteCharMixin):
     def generateNULLValueNode(self, node):
         key, value = node
         return "(?!%s)" % key
+
+class GrepMultiRuleBackend(GrepBackend, MultiRuleOutputMixin, RequiredLiteralsMixin):
+    """
+    Generates one Perl script that scans log files for all rules in one pass. Each line is printed once, prefixed
+    with the ids of all matching rules: <rule ids>\t<file>:<line number>:<line>
+
+    Like grep, values are searched anywhere in the line, but case-insensitive (ASCII) as in Sigma. Instead of
+    lookaheads, rules are compiled into index() calls and unanchored regular expressions. The literals required
+    by the rules are searched with one trie-optimized regular expression per line, only the rules of the found
+    literals and the rules without required literals are evaluated.
+    """
+    identifier = "grep-multi"
+    active = True
+    config_required = False
+    coalesce_value_lists = True
+    nodeHandlersWithoutOverrides = frozenset(BaseBackend.nodeHandlers.values())     # overrides apply to query strings
+
+    header = """#!/usr/bin/env perl
+# Scan log files for Sigma rules: perl <script> [files]
+use strict;
+use warnings;
+no warnings "regexp";
+
+my ($line, $lc);
+my (@ids, @p, @rules, %literals, @unconditional);
+
+"""
+    footer = """
+my %candidates;     # literal -> numbers of rules that require the literal or a prefix of it
+for my $literal (keys %literals) {
+    for my $length (1 .. length($literal)) {
+        my $prefix = substr($literal, 0, $length);
+        push @{$candidates{$literal}}, @{$literals{$prefix}} if exists $literals{$prefix};
+    }
+}
+my $alternation = join("|", map { quotemeta } sort { length($b) <=> length($a) or $a cmp $b } keys %literals);
+my $scan = %literals ? qr/(?=($alternation))/ : qr/(?!)/;    # longest literal starting at each position
+
+while ($line = <>) {
+    $lc = lc($line);
+    my %selected;
+    while ($lc =~ /$scan/g) {
+        $selected{$_} = 1 for @{$candidates{$1}};
+    }
+    my @matched = grep { $rules[$_]->() } sort { $a <=> $b } (@unconditional, keys %selected);
+    print join(",", @ids[@matched]), "\t$ARGV:$.:$line" if @matched;
+} continue {
+    close ARGV if eof;      # line numbers per file
+}
+"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rulecount = 0
+        self.patterns = dict()      # pattern -> number in @p
+        self.rulePatterns = dict()  # patterns added by the current rule, registered when it was converted completely
+
+    def initialize(self):
+        self.writeOutput(self.header)
+
+    def generate(self, sigmaparser):
+        """Write Perl code that registers the rule in the script"""
+        expressions = list()
+        literals = set()
+        self.code = list()
+        self.rulePatterns = dict()
+        for parsed in sigmaparser.condparsed:
+            expressions.append(self.generateNode(parsed.parsedSearch))
+            required = self.getRequiredLiterals(parsed.parsedSearch)
+            literals = literals | required if literals is not None and required is not None else None
+
+        number = self.rulecount
+        self.rulecount += 1
+        ruleid = sigmaparser.parsedyaml.get("id") or self.getRuleName(sigmaparser)
+        self.code.insert(0, "push @ids, %s;\n" % self.quotePerl(str(ruleid)))
+        self.code.append("push @rules, sub { %s };\n" % " || ".join(expressions))
+        if literals is None:
+            self.code.append("push @unconditional, %d;\n" % number)
+        else:
+            for literal in sorted({ literal for field, literal, exact in literals }):
+                self.code.append("push @{$literals{%s}}, %d;\n" % (self.quotePerl(literal), number))
+        self.patterns.update(self.rulePatterns)
+        self.writeOutput("".join(self.code) + "\n")
+
+    def finalize(self):
+        return self.finalizeOutput(self.footer)
+
+    def foldCase(self, value):
+        """Only ASCII letters are folded, like lc() does for lines read as bytes"""
+        return value.translate(asciiLowerCase)
+
+    def quotePerl(self, value):
+        """Perl string literal without interpolation"""
+        return "'%s'" % value.replace("\\", "\\\\").replace("'", "\\'")
+
+    def escapePattern(self, literal):
+        """Escape all ASCII characters except word characters of literal for use in a regular expression"""
+        return reNonWordAscii.sub("\\\\\\1", literal)
+
+    def getPattern(self, pattern):
+        """
+        Return Perl expression for compiled regular expression, which is compiled once at start of the script. The
+        code that compiles a new pattern is part of the code of the rule and discarded if the rule fails to convert.
+        """
+        number = self.patterns.get(pattern)
+        if number is None:
+            number = self.rulePatterns.get(pattern)
+        if number is None:
+            number = self.rulePatterns[pattern] = len(self.patterns) + len(self.rulePatterns)
+            self.code.append("push @p, qr'%s';\n" % reQuote.sub(lambda m: "\\x27" if m.group() in ("'", "\\'") else m.group(), pattern))
+        return "$p[%d]" % number
+
+    def generateANDNode(self, node):
+        expressions = [ self.generateNode(item) for item in node ]
+        return expressions[0] if len(expressions) == 1 else "(%s)" % " && ".join(expressions)
+
+    def generateORNode(self, node):
+        expressions = [ self.generateNode(item) for item in node ]
+        return expressions[0] if len(expressions) == 1 else "(%s)" % " || ".join(expressions)
+
+    def generateNOTNode(self, node):
+        return "!(%s)" % self.generateNode(node.item)
+
+    def generateSubexpressionNode(self, node):
+        return self.generateNode(node.items)
+
+    def generateListNode(self, node):
+        return self.generateValuesExpression([ SigmaContainsModifier(value).apply() for value in self.checkValues(node) ])
+
+    def generateValueNode(self, node):
+        return self.generateListNode([ node ])
+
+    def generateMapItemNode(self, node):
+        fieldname, value = node
+        if value is None:
+            return "index($lc, %s) < 0" % self.quotePerl(self.foldCase(fieldname))
+        elif isinstance(value, SigmaRegularExpressionModifier):
+            return "$line =~ %s" % self.getPattern(str(value))
+        elif isinstance(value, SigmaTypeModifier):
+            raise NotImplementedError("Type modifier '{}' is not supported by backend".format(value.identifier))
+        elif type(value) in (str, int, bool, list):
+            return self.generateValuesExpression(self.checkValues(value if type(value) is list else [ value ]))
+        else:
+            raise TypeError("Backend does not support map values of type " + str(type(value)))
+
+    def generateNULLValueNode(self, node):
+        return "index($lc, %s) < 0" % self.quotePerl(self.foldCase(node.item))
+
+    def generateNotNULLValueNode(self, node):
+        return "index($lc, %s) >= 0" % self.quotePerl(self.foldCase(node.item))
+
+    def generateValuesExpression(self, values):
+        """Return Perl expression that is true if any of the values is contained in the line"""
+        if not values:      # empty value list never matches
+            return "0"
+        patterns = list()
+        for value in values:
+            tokens = parseWildcards(self.foldCase(value))
+            while tokens and tokens[0] is None:     # values are searched anywhere in the line
+                tokens.pop(0)
+            while tokens and tokens[-1] is None:
+                tokens.pop()
+            if not tokens:
+                return "1"
+            elif len(tokens) == 1 and len(values) == 1 and isinstance(tokens[0], str):
+                return "index($lc, %s) >= 0" % self.quotePerl(tokens[0])
+            patterns.append("".join(
+                ".*" if token is None else "." if token is False else self.escapePattern(token)
+                for token in tokens
+                ))
+        return "$lc =~ %s" % self.getPattern(patterns[0] if len(patterns) == 1 else "(?:%s)" % "|".join(patterns))
+
+asciiLowerCase = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+reQuote = re.compile("\\\\.|'")        # escape sequence or quote in regular expression
+reNonWordAscii = re.compile("([\\x00-\\x2f\\x3a-\\x40\\x5b-\\x5e\\x60\\x7b-\\x7f])")
@@ -54,10 +54,46 @@ class RulenameCommentMixin:
             return "\n"
 
 class MultiRuleOutputMixin:
-    """Mixin with common for multi-rule outputs"""
+    """
+    Mixin with common for multi-rule outputs.
+
+    The output is written incrementally with writeOutput(): the header by initialize(), one fragment per rule by
+    generate() and the footer by finalize(), which returns finalizeOutput(footer). If an output stream was set
+    with setOutputStream() before initialize() was called, fragments are written to it immediately and the
+    output of all rules is never held in memory. Else fragments are collected and finalize() returns the
+    complete output, as required by callers that only use the return values.
+    """
+    outputStream = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.rulenames = set()
+        self.outputFragments = list()
+        self.outputWritten = False
+
+    def setOutputStream(self, stream):
+        """Write output to stream while rules are converted instead of returning it from finalize()"""
+        self.outputStream = stream
+
+    def writeOutput(self, fragment):
+        """Write fragment of output to output stream or collect it until finalizeOutput() is called"""
+        if self.outputStream is None:
+            self.outputFragments.append(fragment)
+        else:
+            self.outputStream.write(fragment)
+        self.outputWritten = True
+
+    def finalizeOutput(self, footer=""):
+        """
+        Complete output with footer. Returns the collected output or None if it was written to the output stream.
+        A newline is added to streamed output, like it is printed after the output returned by finalize().
+        """
+        if self.outputStream is None:
+            output = "".join(self.outputFragments) + footer
+            self.outputFragments = list()
+            return output
+        elif self.outputWritten or footer:
+            self.outputStream.write(footer + "\n")
 
     def getRuleName(self, sigmaparser):
         """
@@ -0,0 +1,419 @@
+# Compilation of Sigma rules into Python matcher functions
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from .base import BaseBackend
+from .exceptions import NotSupportedError
+from sigma.parser.modifiers.base import SigmaTypeModifier
+from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
+from sigma.parser.modifiers.transform import SigmaContainsModifier
+from sigma.parser.condition import ConditionAND, ConditionOR, NodeSubexpression
+
+class SigmaEvent:
+    """
+    Event that is matched against compiled rules. The values of a field are looked up once per event and kept
+    as tuple of strings, values of lists are flattened. Field names that are not contained in the event are
+    resolved as path into nested objects, e.g. 'process.name' as event['process']['name'].
+    """
+    __slots__ = ("event", "strings", "folded", "keywords")
+
+    def __init__(self, event):
+        self.event = event
+        self.strings = dict()       # field -> values as strings
+        self.folded = dict()        # field -> values as lower case strings
+        self.keywords = None        # all values of event as lower case strings
+
+    def getStrings(self, field):
+        """Return values of field as tuple of strings, which is empty if the field doesn't exists or is null"""
+        try:
+            return self.strings[field]
+        except KeyError:
+            pass
+        try:
+            value = self.event[field]
+        except KeyError:
+            value = None
+            if "." in field:
+                value = self.event
+                for name in field.split("."):
+                    if not isinstance(value, dict):
+                        value = None
+                        break
+                    value = value.get(name)
+        values = self.strings[field] = tuple(flattenValues(value))
+        return values
+
+    def getFolded(self, field):
+        """Return values of field as tuple of lower case strings"""
+        try:
+            return self.folded[field]
+        except KeyError:
+            values = self.folded[field] = tuple(value.lower() for value in self.getStrings(field))
+            return values
+
+    def getKeywords(self):
+        """Return all values contained in the event as tuple of lower case strings"""
+        if self.keywords is None:
+            self.keywords = tuple(value.lower() for value in flattenValues(self.event))
+        return self.keywords
+
+def flattenValues(value):
+    """Yield all scalar values contained in value as strings. Booleans are represented like in JSON."""
+    if value is None:
+        return
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from flattenValues(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from flattenValues(item)
+    elif isinstance(value, bool):
+        yield "true" if value else "false"
+    else:
+        yield str(value)
+
+reWildcardToken = re.compile("\\\\([*?\\\\])|([*?])|([^*?\\\\]+|\\\\)")      # escaped character, wildcard or literal
+
+def parseWildcards(value):
+    """
+    Split Sigma value into list of literal strings and wildcards, which are returned as None for * and as
+    False for ?. Wildcards escaped with a backslash and double backslashes are literals.
+    """
+    tokens = list()
+    for escaped, wildcard, literal in reWildcardToken.findall(value):
+        if wildcard:
+            tokens.append(None if wildcard == "*" else False)
+        else:
+            literal = escaped or literal
+            if tokens and isinstance(tokens[-1], str):
+                tokens[-1] += literal
+            else:
+                tokens.append(literal)
+    return tokens
+
+def matchAll(matchers):
+    """Return matcher that matches if all matchers match. Matchers are evaluated in the given order."""
+    if len(matchers) == 1:
+        return matchers[0]
+    elif len(matchers) == 2:
+        first, second = matchers
+        return lambda event: first(event) and second(event)
+    else:
+        def match(event):
+            for matcher in matchers:
+                if not matcher(event):
+                    return False
+            return True
+        return match
+
+def matchAny(matchers):
+    """Return matcher that matches if any of the matchers matches"""
+    if len(matchers) == 1:
+        return matchers[0]
+    elif len(matchers) == 2:
+        first, second = matchers
+        return lambda event: first(event) or second(event)
+    else:
+        def match(event):
+            for matcher in matchers:
+                if matcher(event):
+                    return True
+            return False
+        return match
+
+class SigmaRuleMatcher:
+    """
+    Sigma rule compiled into a function that tests if an event (SigmaEvent) matches the rule. The literals are a set
+    of (field, literal, exact) tuples of which one must be contained in all matching events (see
+    PythonMatcherBackend.getRequiredLiterals) or None if the rule doesn't require any literal.
+    """
+    __slots__ = ("rule", "match", "literals")
+
+    def __init__(self, rule, match, literals=None):
+        self.rule = rule        # parsed YAML of rule
+        self.match = match
+        self.literals = literals
+
+    @property
+    def title(self):
+        return self.rule.get("title")
+
+    @property
+    def id(self):
+        return self.rule.get("id")
+
+    @property
+    def level(self):
+        return self.rule.get("level")
+
+    def matches(self, event):
+        """Test if event given as dict or SigmaEvent matches the rule"""
+        if not isinstance(event, SigmaEvent):
+            event = SigmaEvent(event)
+        return self.match(event)
+
+class RequiredLiteralsMixin:
+    """Derivation of literals from parse trees that must be contained in all events matched by a rule"""
+    def foldCase(self, value):
+        """Case folding of values, events are matched case-insensitive against the folded values"""
+        return value.lower()
+
+    def getRequiredLiterals(self, node):
+        """
+        Return set of (field, literal, exact) tuples of which at least one is contained in each event that is matched
+        by the parse tree node or None if the node doesn't require a literal, e.g. because it's negated. Literals are
+        case folded with foldCase(), exact literals are equal to a value of the field, other literals are contained in
+        a value. The field None stands for any value of the event (keywords). Of the literal sets of the items of an
+        AND node, the set with the longest literals is used. An empty set is returned for nodes that never match,
+        e.g. an empty value list.
+        """
+        if isinstance(node, NodeSubexpression):
+            return self.getRequiredLiterals(node.items)
+        elif isinstance(node, ConditionAND):
+            best = None
+            for item in node:
+                literals = self.getRequiredLiterals(item)
+                if literals is not None and len(literals) == 0:     # AND node never matches
+                    return literals
+                elif literals is not None:
+                    score = (min(len(literal) + (4 if exact else 0) for field, literal, exact in literals), -len(literals))
+                    if best is None or score > bestscore:
+                        best, bestscore = literals, score
+            return best
+        elif isinstance(node, ConditionOR):
+            literals = set()
+            for item in node:
+                required = self.getRequiredLiterals(item)
+                if required is None:
+                    return None
+                literals |= required
+            return literals
+        elif type(node) is tuple:
+            fieldname, value = node
+            if type(value) in (str, int, bool, list):
+                return self.getValueLiterals(fieldname, self.checkValues(value if type(value) is list else [ value ]))
+        elif type(node) in (str, int, list):
+            return self.getValueLiterals(None, [ SigmaContainsModifier(value).apply() for value in self.checkValues(node if type(node) is list else [ node ]) ])
+        return None
+
+    def getValueLiterals(self, fieldname, values):
+        """Return set of literals required by Sigma values of a field or None if a value doesn't contain a literal"""
+        literals = set()
+        for value in values:
+            tokens = parseWildcards(self.foldCase(value))
+            strings = [ token for token in tokens if isinstance(token, str) ]
+            if not strings:
+                return None
+            elif len(tokens) == 1:
+                literals.add((fieldname, tokens[0], True))
+            else:
+                literals.add((fieldname, max(strings, key=len), False))
+        return literals
+
+    def checkValues(self, values):
+        """Return values as strings in the representation of flattenValues()"""
+        result = list()
+        for value in values:
+            if isinstance(value, bool):
+                result.append("true" if value else "false")
+            elif type(value) in (str, int):
+                result.append(str(value))
+            else:
+                raise TypeError("List values must be strings or numbers")
+        return result
+
+class PythonMatcherBackend(BaseBackend, RequiredLiteralsMixin):
+    """
+    Compiles Sigma rules into Python functions that match events given as dicts in-process, e.g. parsed from
+    JSON logs. Each parse tree node is compiled into a closure, values of a field are merged into sets of
+    exact values, tuples of prefixes and suffixes and one regular expression for all other wildcard patterns.
+    As in Sigma, values are matched case-insensitive, except regular expressions of the 're' modifier.
+
+    generate() returns a SigmaRuleMatcher instead of a query, therefore this backend is not an output target
+    of sigmac. It's used by SigmaRuleSet in sigma.matcher and by the sigma_match tool.
+    """
+    identifier = "pymatch"
+    active = False
+    config_required = False
+    coalesce_value_lists = True
+    nodeHandlersWithoutOverrides = frozenset(BaseBackend.nodeHandlers.values())     # overrides apply to query strings
+
+    def generate(self, sigmaparser):
+        """Return SigmaRuleMatcher that matches if any condition of the rule matches"""
+        matchers = [ self.generateQuery(parsed) for parsed in sigmaparser.condparsed ]
+        literals = set()
+        for parsed in sigmaparser.condparsed:
+            required = self.getRequiredLiterals(parsed.parsedSearch)
+            if required is None:
+                literals = None
+                break
+            literals |= required
+        return SigmaRuleMatcher(sigmaparser.parsedyaml, matchAny(matchers), literals)
+
+    def generateQuery(self, parsed):
+        if parsed.parsedAgg:
+            self.generateAggregation(parsed.parsedAgg)
+        return self.generateNode(parsed.parsedSearch)
+
+    def generateANDNode(self, node):
+        return matchAll([ self.generateNode(item) for item in node ])
+
+    def generateORNode(self, node):
+        return matchAny([ self.generateNode(item) for item in node ])
+
+    def generateNOTNode(self, node):
+        matcher = self.generateNode(node.item)
+        return lambda event: not matcher(event)
+
+    def generateSubexpressionNode(self, node):
+        return self.generateNode(node.items)
+
+    def generateListNode(self, node):
+        """Keywords, which are matched as substring of any value of the event"""
+        test = self.generateValuesTest([ SigmaContainsModifier(str(value)).apply() for value in self.checkValues(node) ])
+        return lambda event: test(event.getKeywords())
+
+    def generateValueNode(self, node):
+        return self.generateListNode([ node ])
+
+    def generateMapItemNode(self, node):
+        fieldname, value = node
+        if value is None:
+            return lambda event: not event.getStrings(fieldname)
+        elif isinstance(value, SigmaRegularExpressionModifier):
+            try:
+                regex = re.compile(str(value))
+            except re.error as e:
+                raise NotSupportedError("Invalid regular expression '%s': %s" % (str(value), str(e)))
+            search = regex.search
+            return lambda event: any(search(string) for string in event.getStrings(fieldname))
+        elif isinstance(value, SigmaTypeModifier):
+            raise NotImplementedError("Type modifier '{}' is not supported by backend".format(value.identifier))
+        elif type(value) in (str, int, bool, list):
+            test = self.generateValuesTest(self.checkValues(value if type(value) is list else [ value ]))
+            def match(event):
+                try:
+                    strings = event.folded[fieldname]
+                except KeyError:
+                    strings = event.getFolded(fieldname)
+                return bool(strings) and test(strings)
+            return match
+        else:
+            raise TypeError("Backend does not support map values of type " + str(type(value)))
+
+    def generateNULLValueNode(self, node):
+        fieldname = node.item
+        return lambda event: not event.getStrings(fieldname)
+
+    def generateNotNULLValueNode(self, node):
+        fieldname = node.item
+        return lambda event: bool(event.getStrings(fieldname))
+
+    def splitValues(self, values):
+        """
+        Sort Sigma values with wildcards into lists of lower case exact values, prefixes, suffixes, substrings and
+        regular expressions for all other patterns. Returns None if a value matches all values.
+        """
+        exact = list()
+        prefixes = list()
+        suffixes = list()
+        substrings = list()
+        patterns = list()
+        for value in values:
+            tokens = parseWildcards(value.lower())
+            if tokens == [ None ]:          # '*' matches all values
+                return None
+            elif not tokens:
+                exact.append("")
+            elif len(tokens) == 1 and isinstance(tokens[0], str):
+                exact.append(tokens[0])
+            elif len(tokens) == 2 and isinstance(tokens[0], str) and tokens[1] is None:
+                prefixes.append(tokens[0])
+            elif len(tokens) == 2 and tokens[0] is None and isinstance(tokens[1], str):
+                suffixes.append(tokens[1])
+            elif len(tokens) == 3 and tokens[0] is None and isinstance(tokens[1], str) and tokens[2] is None:
+                substrings.append(tokens[1])
+            else:
+                patterns.append("".join(
+                    ".*" if token is None else "." if token is False else re.escape(token)
+                    for token in tokens
+                    ))
+        return exact, prefixes, suffixes, substrings, patterns
+
+    def generateValuesTest(self, values):
+        """
+        Return function that tests if any of a tuple of lower case strings matches any of the given Sigma values
+        with wildcards.
+        """
+        split = self.splitValues(values)
+        if split is None:
+            return bool
+        exact, prefixes, suffixes, substrings, patterns = split
+
+        tests = list()
+        if exact:
+            isdisjoint = frozenset(exact).isdisjoint
+            tests.append(lambda strings: not isdisjoint(strings))
+        if prefixes:
+            prefixes = tuple(prefixes)
+            def test(strings):
+                for string in strings:
+                    if string.startswith(prefixes):
+                        return True
+                return False
+            tests.append(test)
+        if suffixes:
+            suffixes = tuple(suffixes)
+            def test(strings):
+                for string in strings:
+                    if string.endswith(suffixes):
+                        return True
+                return False
+            tests.append(test)
+        if len(substrings) == 1:
+            substring = substrings[0]
+            def test(strings):
+                for string in strings:
+                    if substring in string:
+                        return True
+                return False
+            tests.append(test)
+        elif substrings:
+            search = re.compile("|".join(re.escape(substring) for substring in substrings), re.DOTALL).search
+            def test(strings):
+                for string in strings:
+                    if search(string):
+                        return True
+                return False
+            tests.append(test)
+        if patterns:
+            fullmatch = re.compile("|".join("(?:%s)" % pattern for pattern in patterns), re.DOTALL).fullmatch
+            def test(strings):
+                for string in strings:
+                    if fullmatch(string):
+                        return True
+                return False
+            tests.append(test)
+
+        if len(tests) == 1:
+            return tests[0]
+        tests = tuple(tests)
+        def test(strings):
+            for test in tests:
+                if test(strings):
+                    return True
+            return False
+        return test
@@ -28,6 +28,7 @@ class QRadarBackend(SingleTextQueryBackend):
     identifier = "qradar"
     active = True
     config_required = False
+    coalesce_value_lists = True
     default_config = ["sysmon", "qradar"]
     reEscape = re.compile('(")')
     reClear = None
@@ -58,29 +59,6 @@ class QRadarBackend(SingleTextQueryBackend):
         """Remove quotes in text"""
         return value.replace("\'","\\\'")
 
-    def generateNode(self, node):
-        if type(node) == sigma.parser.condition.ConditionAND:
-            return self.generateANDNode(node)
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            return self.generateORNode(node)
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            return self.generateNOTNode(node)
-        elif type(node) == sigma.parser.condition.ConditionNULLValue:
-            return self.generateNULLValueNode(node)
-        elif type(node) == sigma.parser.condition.ConditionNotNULLValue:
-            return self.generateNotNULLValueNode(node)
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            return self.generateSubexpressionNode(node)
-        elif type(node) == tuple:
-            return self.generateMapItemNode(node)
-        elif type(node) in (str, int):
-            return self.generateValueNode(node, False)
-        elif type(node) == list:
-            return self.generateListNode(node)
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
-
-
     def generateMapItemNode(self, node):
         key, value = node
         if self.mapListsSpecialHandling == False and type(value) in (str, int, list) or self.mapListsSpecialHandling == True and type(value) in (str, int):
@@ -126,7 +104,7 @@ class QRadarBackend(SingleTextQueryBackend):
         else:
             raise NotImplementedError("Type modifier '{}' is not supported by backend".format(value.identifier))
 
-    def generateValueNode(self, node, keypresent):
+    def generateValueNode(self, node, keypresent=False):
         if keypresent == False:
             return "UTF8(payload) ilike \'{0}{1}{2}\'".format("%", self.cleanValue(str(node)), "%")
         else:
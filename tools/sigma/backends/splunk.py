@@ -24,6 +24,7 @@ class SplunkBackend(SingleTextQueryBackend):
     identifier = "splunk"
     active = True
     index_field = "index"
+    coalesce_value_lists = True
 
     # \   -> \\
     # \*  -> \*
@@ -124,7 +125,6 @@ class SplunkXMLBackend(SingleTextQueryBackend, MultiRuleOutputMixin):
     dash_pre = "<form><label>MyDashboard</label><fieldset submitButton=\"false\"><input type=\"time\" token=\"field1\">" \
                "<label></label><default><earliest>-24h@h</earliest><latest>now</latest></default></input></fieldset>"
     dash_suf = "</form>"
-    queries = dash_pre
 
 
     reEscape = re.compile('("|(?<!\\\\)\\\\(?![*?\\\\]))')
@@ -155,22 +155,20 @@ class SplunkXMLBackend(SingleTextQueryBackend, MultiRuleOutputMixin):
         else:
             return " | stats %s(%s) as val by %s | search val %s %s" % (agg.aggfunc_notrans, agg.aggfield or "", agg.groupfield or "", agg.cond_op, agg.condition)
 
+    def initialize(self):
+        self.writeOutput(self.dash_pre)
+
     def generate(self, sigmaparser):
         """Method is called for each sigma rule and receives the parsed rule (SigmaParser)"""
         for parsed in sigmaparser.condparsed:
             query = self.generateQuery(parsed)
             if query is not None:
-                self.queries += self.panel_pre
-                self.queries += sigmaparser.parsedyaml.get("title") or ""
-                self.queries += self.panel_inf
                 query = query.replace("<", "&lt;")
                 query = query.replace(">", "&gt;")
-                self.queries += query
-                self.queries += self.panel_suf
+                self.writeOutput(self.panel_pre + (sigmaparser.parsedyaml.get("title") or "") + self.panel_inf + query + self.panel_suf)
 
     def finalize(self):
-        self.queries += self.dash_suf
-        return self.queries
+        return self.finalizeOutput(self.dash_suf)
 
 class CrowdStrikeBackend(SplunkBackend):
     """Converts Sigma rule into CrowdStrike Search Processing Language (SPL)."""
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from sigma.backends.base import RuleState
 from sigma.backends.sql import SQLBackend
 from sigma.parser.condition import NodeSubexpression, ConditionAND, ConditionOR, ConditionNOT
 from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
@@ -33,7 +34,8 @@ class SQLiteBackend(SQLBackend):
         SigmaRegularExpressionModifier: "\'%s\'" # Syntax for regular expressions
     }
 
-    countFTS = 0
+    countFTS = RuleState(0)
+    mappingItem = RuleState(False)
 
     def __init__(self, sigmaconfig, table):
         super().__init__(sigmaconfig, table)
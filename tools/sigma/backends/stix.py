@@ -17,6 +17,15 @@ class STIXBackend(SingleTextQueryBackend):
     notMapExpression = "%s != %s"
     mapListsSpecialHandling = True
     sort_condition_lists = True
+    nodeHandlers = {
+            sigma.parser.condition.ConditionAND: "generateNegatableANDNode",
+            sigma.parser.condition.ConditionOR: "generateNegatableORNode",
+            sigma.parser.condition.ConditionNOT: "generateNOTNode",
+            sigma.parser.condition.NodeSubexpression: "generateSubexpressionNode",
+            tuple: "generateMapItemNode",
+            str: "generateKeywordNode",
+            int: "generateKeywordNode",
+            }
 
     def cleanKey(self, key):
         if key is None:
@@ -140,25 +149,18 @@ class STIXBackend(SingleTextQueryBackend):
         else:
             return self.valueExpression % (self.cleanValue(str(node)))
 
-    def generateNode(self, node, currently_within_NOT_node=False):
-        if type(node) == sigma.parser.condition.ConditionAND:
-            if currently_within_NOT_node:
-                return self.generateORNode(node, currently_within_NOT_node)
-            return self.generateANDNode(node, currently_within_NOT_node)
-        elif type(node) == sigma.parser.condition.ConditionOR:
-            if currently_within_NOT_node:
-                return self.generateANDNode(node, currently_within_NOT_node)
+    def generateNegatableANDNode(self, node, currently_within_NOT_node=False):
+        if currently_within_NOT_node:
             return self.generateORNode(node, currently_within_NOT_node)
-        elif type(node) == sigma.parser.condition.ConditionNOT:
-            return self.generateNOTNode(node, currently_within_NOT_node)
-        elif type(node) == sigma.parser.condition.NodeSubexpression:
-            return self.generateSubexpressionNode(node, currently_within_NOT_node)
-        elif type(node) == tuple:
-            return self.generateMapItemNode(node, currently_within_NOT_node)
-        elif type(node) in (str, int):
-            return self.generateValueNode(node, keypresent=False)
-        else:
-            raise TypeError("Node type %s was not expected in Sigma parse tree" % (str(type(node))))
+        return self.generateANDNode(node, currently_within_NOT_node)
+
+    def generateNegatableORNode(self, node, currently_within_NOT_node=False):
+        if currently_within_NOT_node:
+            return self.generateANDNode(node, currently_within_NOT_node)
+        return self.generateORNode(node, currently_within_NOT_node)
+
+    def generateKeywordNode(self, node, currently_within_NOT_node=False):
+        return self.generateValueNode(node, keypresent=False)
 
     def generate(self, sigmaparser):
         for parsed in sigmaparser.condparsed:
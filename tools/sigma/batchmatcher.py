@@ -0,0 +1,345 @@
+# Vectorized evaluation of Sigma rules against columnar batches of events with NumPy
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# NumPy is an optional dependency (pip install sigmatools[batch]), this module is only imported if batch
+# evaluation is requested.
+
+import re
+import numpy
+from sigma.matcher import SigmaRuleSet
+from sigma.backends.exceptions import NotSupportedError
+from sigma.backends.pymatch import PythonMatcherBackend, SigmaRuleMatcher, flattenValues
+from sigma.parser.modifiers.base import SigmaTypeModifier
+from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
+from sigma.parser.modifiers.transform import SigmaContainsModifier
+
+class SigmaEventBatch:
+    """
+    Batch of events given as columns: dict of field name -> sequence with one value per event, e.g. NumPy arrays
+    or lists. Missing values are None or NaN, values of lists are flattened like in SigmaEvent. Each column is
+    converted once per batch into the rows and string values of the column, which are kept as unique values and
+    the inverse index into them, so tests are evaluated once per distinct value.
+    """
+    def __init__(self, columns, length=None):
+        self.columns = columns
+        if length is None:
+            length = len(next(iter(columns.values()))) if columns else 0
+        for field, column in columns.items():
+            if len(column) != length:
+                raise ValueError("Column '%s' contains %d values instead of %d" % (field, len(column), length))
+        self.length = length
+        self.strings = dict()       # field -> (rows, unique values, inverse) with values as strings
+        self.folded = dict()        # field -> (rows, unique values, inverse) with values as lower case strings
+        self.keywords = None        # (rows, unique values, inverse) of all values as lower case strings
+        self.masks = dict()         # key of compiled test -> mask of events that match the test
+
+    @classmethod
+    def from_events(cls, events):
+        """Create batch from a list of events given as dicts. Nested objects are flattened into dotted field names."""
+        columns = dict()
+        for row, event in enumerate(events):
+            for field, value in flattenFields(event):
+                try:
+                    columns[field][row] = value
+                except KeyError:
+                    columns[field] = [ None ] * len(events)
+                    columns[field][row] = value
+        return cls(columns, len(events))
+
+    def getStrings(self, field):
+        """Return (rows, unique values, inverse) of field, the value of row rows[i] is values[inverse[i]]"""
+        try:
+            return self.strings[field]
+        except KeyError:
+            rows, values = columnValues(self.columns.get(field))
+            values, inverse = numpy.unique(values, return_inverse=True)
+            column = self.strings[field] = (rows, values, inverse.reshape(-1))
+            return column
+
+    def getFolded(self, field):
+        """Return (rows, unique values, inverse) of field with lower case values. Values may be repeated."""
+        try:
+            return self.folded[field]
+        except KeyError:
+            rows, values, inverse = self.getStrings(field)
+            column = self.folded[field] = (rows, numpy.char.lower(values), inverse)
+            return column
+
+    def getKeywords(self):
+        """Return (rows, values, inverse) of all values of all fields as lower case strings"""
+        if self.keywords is None:
+            columns = [ self.getStrings(field) for field in self.columns ]
+            offsets = numpy.cumsum([ 0 ] + [ len(values) for rows, values, inverse in columns ])
+            self.keywords = (
+                    numpy.concatenate([ rows for rows, values, inverse in columns ] + [ emptyRows ]),
+                    numpy.char.lower(numpy.concatenate([ values for rows, values, inverse in columns ] + [ emptyValues ])),
+                    numpy.concatenate([ inverse + offset for (rows, values, inverse), offset in zip(columns, offsets) ] + [ emptyRows ]),
+                    )
+        return self.keywords
+
+    def getPresent(self, field):
+        """Return mask of events that contain a value of field"""
+        mask = numpy.zeros(self.length, dtype=bool)
+        mask[self.getStrings(field)[0]] = True
+        return mask
+
+    def selectRows(self, column, test):
+        """Return mask of events of which a value of column (rows, values, inverse) passes the test of the values"""
+        rows, values, inverse = column
+        mask = numpy.zeros(self.length, dtype=bool)
+        if len(values):
+            hits = test(values)
+            if hits.any():
+                mask[rows[hits[inverse]]] = True
+        return mask
+
+emptyRows = numpy.zeros(0, dtype=numpy.intp)
+emptyValues = numpy.zeros(0, dtype=str)
+
+def flattenFields(event, prefix=""):
+    """Yield (field, value) of all values of event, values of nested objects with dotted field names"""
+    for name, value in event.items():
+        if isinstance(value, dict):
+            yield from flattenFields(value, prefix + name + ".")
+        else:
+            yield prefix + name, value
+
+def columnValues(column):
+    """
+    Return (rows, values) of all values contained in a column as array of row numbers and array of strings in the
+    representation of flattenValues(). Values of NumPy arrays with string, boolean and numeric types are converted
+    vectorized, floats that are integral are represented as integers because NaN turns integer columns into floats.
+    """
+    if column is None:
+        return emptyRows, emptyValues
+    if isinstance(column, numpy.ndarray) and column.ndim == 1:
+        kind = column.dtype.kind
+        rows = numpy.arange(len(column))
+        if kind == "U":
+            return rows, column
+        elif kind == "S":
+            return rows, numpy.char.decode(column, "utf-8")
+        elif kind == "b":
+            return rows, numpy.where(column, "true", "false")
+        elif kind in "iu":
+            return rows, column.astype(str)
+        elif kind == "f":
+            rows = numpy.flatnonzero(~numpy.isnan(column))
+            numbers = column[rows]
+            values = numbers.astype(str)
+            integral = numpy.isfinite(numbers) & (numbers == numpy.floor(numbers))
+            values[integral] = numbers[integral].astype(numpy.int64).astype(str)
+            return rows, values
+    rows = list()
+    values = list()
+    for row, cell in enumerate(column):
+        if isinstance(cell, numpy.generic):
+            cell = cell.item()
+        if isinstance(cell, float) and cell != cell:        # NaN
+            continue
+        for value in flattenValues(cell):
+            rows.append(row)
+            values.append(value)
+    return numpy.array(rows, dtype=numpy.intp), numpy.array(values, dtype=str)
+
+def matchAllMasks(matchers):
+    """Return matcher that returns the conjunction of the masks of matchers. Evaluation stops if no event is left."""
+    if len(matchers) == 1:
+        return matchers[0]
+    def match(batch):
+        mask = matchers[0](batch)
+        for matcher in matchers[1:]:
+            if not mask.any():
+                break
+            mask = mask & matcher(batch)
+        return mask
+    return match
+
+def matchAnyMasks(matchers):
+    """Return matcher that returns the disjunction of the masks of matchers. Evaluation stops if all events match."""
+    if len(matchers) == 1:
+        return matchers[0]
+    def match(batch):
+        mask = matchers[0](batch)
+        for matcher in matchers[1:]:
+            if mask.all():
+                break
+            mask = mask | matcher(batch)
+        return mask
+    return match
+
+class SigmaBatchRuleMatcher(SigmaRuleMatcher):
+    """Sigma rule compiled into a function that returns the mask of the events of a SigmaEventBatch matching the rule"""
+    __slots__ = ()
+
+    def matches(self, batch):
+        """Return indices of events matching the rule in batch given as SigmaEventBatch or dict of columns"""
+        if not isinstance(batch, SigmaEventBatch):
+            batch = SigmaEventBatch(batch)
+        return numpy.flatnonzero(self.match(batch))
+
+class NumpyMatcherBackend(PythonMatcherBackend):
+    """
+    Compiles Sigma rules into functions that evaluate a rule for all events of a SigmaEventBatch at once and return
+    boolean masks. Values lists become numpy.isin() tests, wildcard patterns vectorized string operations, AND, OR
+    and NOT become mask algebra. Tests are applied to the distinct values of a column and their results are kept
+    in the batch, so tests used by multiple rules are only evaluated once per batch.
+    """
+    identifier = "npmatch"
+    active = False
+
+    def generate(self, sigmaparser):
+        """Return SigmaBatchRuleMatcher that matches if any condition of the rule matches"""
+        return SigmaBatchRuleMatcher(sigmaparser.parsedyaml, matchAnyMasks([ self.generateQuery(parsed) for parsed in sigmaparser.condparsed ]))
+
+    def generateANDNode(self, node):
+        return matchAllMasks([ self.generateNode(item) for item in node ])
+
+    def generateORNode(self, node):
+        return matchAnyMasks([ self.generateNode(item) for item in node ])
+
+    def generateNOTNode(self, node):
+        matcher = self.generateNode(node.item)
+        return lambda batch: ~matcher(batch)
+
+    def generateListNode(self, node):
+        """Keywords, which are matched as substring of any value of the event"""
+        values = [ SigmaContainsModifier(str(value)).apply() for value in self.checkValues(node) ]
+        return self.generateColumnTest((None, tuple(values)), lambda batch: batch.getKeywords(), self.generateValuesTest(values))
+
+    def generateMapItemNode(self, node):
+        fieldname, value = node
+        if value is None:
+            return lambda batch: ~batch.getPresent(fieldname)
+        elif isinstance(value, SigmaRegularExpressionModifier):
+            try:
+                search = re.compile(str(value)).search
+            except re.error as e:
+                raise NotSupportedError("Invalid regular expression '%s': %s" % (str(value), str(e)))
+            test = lambda values: numpy.fromiter((search(string) is not None for string in values), dtype=bool, count=len(values))
+            return self.generateColumnTest((fieldname, "re", str(value)), lambda batch: batch.getStrings(fieldname), test)
+        elif isinstance(value, SigmaTypeModifier):
+            raise NotImplementedError("Type modifier '{}' is not supported by backend".format(value.identifier))
+        elif type(value) in (str, int, bool, list):
+            values = self.checkValues(value if type(value) is list else [ value ])
+            return self.generateColumnTest((fieldname, tuple(values)), lambda batch: batch.getFolded(fieldname), self.generateValuesTest(values))
+        else:
+            raise TypeError("Backend does not support map values of type " + str(type(value)))
+
+    def generateNULLValueNode(self, node):
+        fieldname = node.item
+        return lambda batch: ~batch.getPresent(fieldname)
+
+    def generateNotNULLValueNode(self, node):
+        fieldname = node.item
+        return lambda batch: batch.getPresent(fieldname)
+
+    def generateColumnTest(self, key, getColumn, test):
+        """Return matcher that applies test to the values of the column returned by getColumn. Masks are cached by key."""
+        def match(batch):
+            try:
+                return batch.masks[key]
+            except KeyError:
+                mask = batch.masks[key] = batch.selectRows(getColumn(batch), test)
+                return mask
+        return match
+
+    def generateValuesTest(self, values):
+        """Return function that maps an array of lower case strings to a mask of strings matching any of the values"""
+        split = self.splitValues(values)
+        if split is None:
+            return lambda strings: numpy.ones(len(strings), dtype=bool)
+        exact, prefixes, suffixes, substrings, patterns = split
+        fullmatch = re.compile("|".join("(?:%s)" % pattern for pattern in patterns), re.DOTALL).fullmatch if patterns else None
+
+        def test(strings):
+            if exact:
+                hits = numpy.isin(strings, exact)
+            else:
+                hits = numpy.zeros(len(strings), dtype=bool)
+            for prefix in prefixes:
+                hits |= numpy.char.startswith(strings, prefix)
+            for suffix in suffixes:
+                hits |= numpy.char.endswith(strings, suffix)
+            for substring in substrings:
+                hits |= numpy.char.find(strings, substring) >= 0
+            if fullmatch:
+                hits |= numpy.fromiter((fullmatch(string) is not None for string in strings), dtype=bool, count=len(strings))
+            return hits
+        return test
+
+class SigmaBatchRuleSet(SigmaRuleSet):
+    """
+    Set of Sigma rules that are evaluated vectorized against columnar batches of events. Example:
+
+    ruleset = SigmaBatchRuleSet()
+    ruleset.add_file(Path("rules/windows/process_creation/proc_creation_win_whoami.yml"))
+    for rule, indices in ruleset.match_batch({ "Image": images, "CommandLine": commandlines }):
+        ...
+    """
+    backend_class = NumpyMatcherBackend
+
+    def __init__(self, config=None, rulefilter=None, batch_size=10000, correlation=None):
+        super().__init__(config, rulefilter, False, correlation)
+        self.batch_size = batch_size        # number of events per batch in match_lines()
+
+    def match_batch(self, batch):
+        """
+        Match batch of events given as SigmaEventBatch or dict of columns. Returns list of (rule, indices of matching
+        events) of all rules that match any event of the batch.
+        """
+        if not isinstance(batch, SigmaEventBatch):
+            batch = SigmaEventBatch(batch)
+        results = list()
+        for rule in self.rules:
+            indices = numpy.flatnonzero(rule.match(batch))
+            if len(indices):
+                results.append((rule, indices))
+        return results
+
+    def match_events(self, events):
+        """Match list of events given as dicts and return list of rules matching each event"""
+        matches = [ list() for event in events ]
+        for rule, indices in self.match_batch(SigmaEventBatch.from_events(events)):
+            for i in indices:
+                matches[i].append(rule)
+        return matches
+
+    def match(self, event):
+        """Return list of rules matching event"""
+        return self.match_events([ event ])[0]
+
+    def match_event(self, event):
+        """Return list of rules matching event given as SigmaEvent"""
+        return self.match(event.event)
+
+    def match_lines(self, lines):
+        """
+        Match events given as JSON lines in batches of batch_size events. Yields (line number, event, list of matching
+        rules) for each event like SigmaRuleSet.match_lines().
+        """
+        batch = list()
+        for item in self.parse_lines(lines):
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield from self.match_line_batch(batch)
+                batch = list()
+        if batch:
+            yield from self.match_line_batch(batch)
+
+    def match_line_batch(self, batch):
+        for (lineno, event), rules in zip(batch, self.match_events([ event for lineno, event in batch ])):
+            yield lineno, event, rules
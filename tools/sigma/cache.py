@@ -0,0 +1,140 @@
+# Persistent cache for conversion results
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CACHE_FORMAT = 1
+
+def toolchain_fingerprint():
+    """Hash of all modules of the Sigma toolchain. Conversion results of other versions are not reused."""
+    h = hashlib.sha256()
+    base = Path(__file__).parent
+    for path in sorted(base.glob("**/*.py")):
+        h.update(str(path.relative_to(base)).encode())
+        h.update(path.read_bytes())
+    return h.digest()
+
+class SigmaConversionCache:
+    """
+    Content-addressed on-disk cache of conversion results. The key of a Sigma file is the hash of:
+
+    * the file name and content
+    * the contents of all configurations in the configuration chain
+    * the backend identifier and the backend options
+    * the rule filter expression
+    * the Sigma toolchain code
+
+    The value is the list of results generated by the backend for all rules contained in the file.
+    Cache entries are evicted in least recently used order if the cache exceeds the given size.
+    """
+    def __init__(self, path, max_size, sigmaconfigs, backend_identifier, backend_options, rulefilter=None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.total_size = None
+
+        context = hashlib.sha256()
+        context.update(str(CACHE_FORMAT).encode())
+        context.update(toolchain_fingerprint())
+        context.update(json.dumps(
+            [ [ config.config for config in sigmaconfigs ], backend_identifier, backend_options, rulefilter ],
+            sort_keys=True,
+            default=str,
+            ).encode())
+        if rulefilter is not None and "inlastday" in rulefilter:     # result depends on current date
+            context.update(datetime.date.today().isoformat().encode())
+        self.context = context.digest()
+
+    def key(self, sigmafile):
+        """Return cache key of Sigma file or None if file can't be read."""
+        h = hashlib.sha256(self.context)
+        h.update(str(sigmafile).encode())
+        h.update(b"\0")
+        try:
+            h.update(sigmafile.read_bytes())
+        except OSError:
+            return None
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return self.path / key[:2] / (key + ".json")
+
+    def get(self, key):
+        """Return cached results for key or None if there is no cache entry."""
+        if key is None:
+            return None
+        path = self.entry_path(key)
+        try:
+            data = path.read_bytes()
+            results = json.loads(data)
+            os.utime(path)      # keep track of recent usage for eviction
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_read += len(data)
+        return results
+
+    def put(self, key, results):
+        """Store results for key. Results that can't be serialized to JSON are not cached."""
+        try:
+            data = json.dumps(results).encode()
+        except (TypeError, ValueError):
+            return
+        path = self.entry_path(key)
+        tmppath = path.with_suffix(".tmp%d" % os.getpid())
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmppath.write_bytes(data)
+            os.replace(tmppath, path)
+        except OSError:
+            return
+        self.bytes_written += len(data)
+
+    def evict(self):
+        """Remove least recently used entries until cache size is below the maximum size."""
+        entries = list()
+        for path in self.path.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= self.max_size:
+                break
+            try:
+                path.unlink()
+                size -= entry_size
+            except OSError:
+                pass
+        self.total_size = size
+        return size
+
+    def stats(self):
+        stats = "Cache: %d hits, %d misses, %d bytes read, %d bytes written" % (self.hits, self.misses, self.bytes_read, self.bytes_written)
+        if self.total_size is not None:
+            stats += ", %d bytes in cache" % (self.total_size)
+        return stats
@@ -16,18 +16,35 @@
 
 from collections.abc import Iterable
 from pathlib import Path
+import json
+import os
 import sys
 import re
+import yaml
 from sigma.configuration import SigmaConfiguration
 from sigma.config.exceptions import SigmaConfigParseError
 
+INDEX_FORMAT = 1
+
+def default_index_path():
+    """Location of the persisted configuration index: $XDG_CACHE_HOME/sigma or ~/.cache/sigma"""
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home) / "sigma" / "configurations.json"
+    else:
+        return Path.home() / ".cache" / "sigma" / "configurations.json"
+
 class SigmaConfigurationManager(object):
     """
     Locate Sigma configuration files in a directory and provide them as well as information
     about them.
+
+    Configurations are only parsed when they are requested. Title and backends of each found
+    configuration file are kept in an index. If an index path is given, the index is persisted
+    between runs and only updated for files that were changed since the index was written.
     """
     re_identifier = re.compile("^[\\w-]+$")
-    def __init__(self, paths=None):
+    def __init__(self, paths=None, index_path=None):
         """
         Initialize configuration collection. If paths is not given, some default locations are used:
 
@@ -38,6 +55,8 @@ class SigmaConfigurationManager(object):
 
         Parameters:
         * paths: list of strings with paths
+        * index_path: file where configuration index is persisted, e.g. default_index_path(). The index is
+          not persisted if not given.
         """
         if paths is None:
             self.paths = [
@@ -55,26 +74,81 @@ class SigmaConfigurationManager(object):
         else:
             raise TypeError("None or iterable of strings expected as paths")
 
-        self.configs = dict()
+        if index_path is None:
+            self.index_path = None
+        else:
+            self.index_path = Path(index_path)
+
+        self.index = dict()         # identifier -> index entry of configuration file
+        self.configs = dict()       # identifier -> parsed configuration
         self.errors = list()
         self.update()
 
+    def load_index(self):
+        """Return persisted index entries by file path or empty dict if index can't be loaded."""
+        if self.index_path is None:
+            return dict()
+        try:
+            with self.index_path.open() as f:
+                index = json.load(f)
+            if index["format"] != INDEX_FORMAT:
+                return dict()
+            return index["configs"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return dict()
+
+    def save_index(self, entries):
+        """Persist index entries. Failures are ignored, the index is then rebuilt in the next run."""
+        if self.index_path is None:
+            return
+        tmppath = self.index_path.with_suffix(".tmp%d" % os.getpid())
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with tmppath.open("w") as f:
+                json.dump({ "format": INDEX_FORMAT, "configs": entries }, f)
+            os.replace(tmppath, self.index_path)
+        except OSError:
+            pass
+
+    def index_entry(self, conf_path, stat):
+        """Build index entry from configuration file."""
+        with conf_path.open() as f:
+            config = yaml.safe_load(f)
+        if type(config) != dict:
+            raise SigmaConfigParseError("Configuration has wrong type, should be map")
+        return {
+                "path": str(conf_path),
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "title": config.get("title") or "",
+                "backends": config.get("backends") or list(),
+                }
+
     def update(self):
         """Update configurations"""
+        self.index.clear()
         self.configs.clear()
         self.errors.clear()
+        persisted = self.load_index()
+        entries = dict()
         for path in reversed(self.paths):       # Configs from first paths override latter ones
             for conf_path in path.glob("**/*.yml"):
+                conf_path = conf_path.resolve()
                 try:
-                    f = conf_path.open()
-                    self.configs[conf_path.stem] = SigmaConfiguration(f)
-                    f.close()
-                except (SigmaConfigParseError, OSError) as e:
+                    stat = conf_path.stat()
+                    entry = persisted.get(str(conf_path))
+                    if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                        entry = self.index_entry(conf_path, stat)
+                    entries[str(conf_path)] = entry
+                    self.index[conf_path.stem] = entry
+                except (SigmaConfigParseError, yaml.YAMLError, OSError) as e:
                     self.errors.append((conf_path, e))
+        if entries != persisted:
+            self.save_index(entries)
 
     def list(self):
-        """Returns a list of (identifier, title) tuples of found configurations."""
-        return [ (conf_id, config.config.setdefault("title", ""), config.config.setdefault("backends", list())) for conf_id, config in self.configs.items() ]
+        """Returns a list of (identifier, title, backends) tuples of found configurations."""
+        return [ (conf_id, entry["title"], entry["backends"]) for conf_id, entry in self.index.items() ]
 
     def get(self, name):
         """
@@ -82,8 +156,16 @@ class SigmaConfigurationManager(object):
         discovered configurations (file name stem). If this fails, the parameter value is treated
         as file name.
         """
-        try:                # Lookup in discovered configurations
+        try:                # Lookup in already parsed configurations
             return self.configs[name]
+        except KeyError:
+            pass
+        try:                # Lookup in discovered configurations
+            path = self.index[name]["path"]
         except KeyError:    # identifier not found, try with filename
             f = open(name)
             return SigmaConfiguration(f)
+        with open(path) as f:
+            config = SigmaConfiguration(f)
+        self.configs[name] = config
+        return config
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 from sigma.parser.condition import ConditionOR, NodeSubexpression, ConditionNULLValue
 from .exceptions import SigmaConfigParseError, FieldMappingError
 
@@ -174,6 +175,30 @@ class FieldMappingChain(object):
     def __init__(self, fieldname):
         """Initialize field mapping chain with given field name."""
         self.fieldmappings = set([fieldname])
+        self.logsourcemappings = dict()     # logsource attributes used by conditions of conditional mapping -> conditional mapping with default for log source
+
+    def logsource_mapping(self, sigmaparser):
+        """
+        Return conditional field mapping whose default is replaced by the targets of conditions on log
+        source attributes of the rule. The mappings are built on first use and cached per log source.
+        """
+        mapping = self.fieldmappings
+        condition = mapping.conditions
+        logsource = sigmaparser.parsedyaml.get("logsource")
+        key = tuple(
+                (source_type, logsource_item)
+                for source_type, logsource_item in logsource.items()
+                if condition.get(source_type) and condition.get(source_type, {}).get(logsource_item)
+                )
+        try:
+            return self.logsourcemappings[key]
+        except KeyError:
+            if key:         # last matching log source attribute determines default
+                source_type, logsource_item = key[-1]
+                mapping = copy.copy(mapping)
+                mapping.default = condition[source_type][logsource_item]
+            self.logsourcemappings[key] = mapping
+            return mapping
 
     def append(self, config):
         """Propagate current possible field mappings with field mapping from configuration"""
@@ -208,13 +233,7 @@ class FieldMappingChain(object):
         if type(self.fieldmappings) == str:     # one field mapping
             return (self.fieldmappings, value)
         elif isinstance(self.fieldmappings, ConditionalFieldMapping):
-            logsource = sigmaparser.parsedyaml.get("logsource")
-            condition = self.fieldmappings.conditions
-            for source_type, logsource_item in logsource.items():
-                if condition.get(source_type) and condition.get(source_type, {}).get(logsource_item):
-                    new_field = condition.get(source_type, {}).get(logsource_item)
-                    self.fieldmappings.default = new_field
-            return self.fieldmappings.resolve(self.fieldmappings.source, value, sigmaparser)
+            return self.logsource_mapping(sigmaparser).resolve(self.fieldmappings.source, value, sigmaparser)
         elif isinstance(self.fieldmappings, SimpleFieldMapping):
             return self.fieldmappings.resolve(key, value, sigmaparser)
         elif type(self.fieldmappings) == set:
@@ -229,6 +248,8 @@ class FieldMappingChain(object):
     def resolve_fieldname(self, fieldname, sigmaparser=None):
         if type(self.fieldmappings) == str:     # one field mapping
             return self.fieldmappings
+        elif isinstance(self.fieldmappings, ConditionalFieldMapping) and sigmaparser is not None:
+            return self.logsource_mapping(sigmaparser).resolve_fieldname(fieldname, sigmaparser)
         elif isinstance(self.fieldmappings, SimpleFieldMapping):
             return self.fieldmappings.resolve_fieldname(fieldname, sigmaparser)
         elif type(self.fieldmappings) == set:
@@ -246,3 +267,13 @@ class FieldMappingChain(object):
 
     def __str__(self):  # pragma: no cover
         return "FieldMappingChain: {}".format(self.fieldmappings)
+
+def is_rule_dependent(mapping):
+    """Return if the result of a field mapping depends on the rule, like conditional field mappings"""
+    if isinstance(mapping, FieldMappingChain):
+        if type(mapping.fieldmappings) == set:
+            return any(isinstance(fieldmapping, ConditionalFieldMapping) for fieldmapping in mapping.fieldmappings)
+        else:
+            return isinstance(mapping.fieldmappings, ConditionalFieldMapping)
+    else:
+        return isinstance(mapping, ConditionalFieldMapping)
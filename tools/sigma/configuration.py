@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
 import yaml
 from sigma.parser.condition import ConditionAND, ConditionOR
 from sigma.config.exceptions import SigmaConfigParseError
@@ -32,7 +33,9 @@ class SigmaConfigurationChain(list):
         self.defaultindex = None
         self.config = dict()
         self.fieldmappings = dict()
+        self.fieldmappingchains = dict()     # field name -> field mapping chain through all configurations
         self.logsources = dict()
+        self.logsourcecache = dict()         # (category, product, service) -> merged log source configuration
 
         for config in self:
             self.postprocess_config(config)
@@ -45,28 +48,45 @@ class SigmaConfigurationChain(list):
         self.defaultindex = config.defaultindex
         self.config.update(config.config)
         self.fieldmappings.update(config.fieldmappings)
+        self.fieldmappingchains.clear()
         self.logsources.update(config.logsources)
+        self.logsourcecache.clear()
 
     def get_fieldmapping(self, fieldname):
-        """Return mapped fieldname by iterative application of each config stored in configuration chain."""
+        """
+        Return mapped fieldname by iterative application of each config stored in configuration chain. The
+        chain of a field is built on first use and reused for all following rules.
+        """
+        try:
+            return self.fieldmappingchains[fieldname]
+        except KeyError:
+            pass
         if self:
             fieldmappings = FieldMappingChain(fieldname)
             for config in self:
                 fieldmappings.append(config)
-            return fieldmappings
         else:
-            return FieldMapping(fieldname)
+            fieldmappings = FieldMapping(fieldname)
+        self.fieldmappingchains[fieldname] = fieldmappings
+        return fieldmappings
 
     def get_logsource(self, category, product, service):
-        """Return merged log source definition of all logosurces that match criteria across all Sigma conversion configurations in chain."""
+        """
+        Return merged log source definition of all logosurces that match criteria across all Sigma conversion
+        configurations in chain. The merged definition is built once per (category, product, service).
+        """
+        try:
+            return self.logsourcecache[(category, product, service)]
+        except KeyError:
+            pass
         matching = list()
+        rewritten = (category, product, service)
         for config in self:
-            for logsource in config.logsources:
-                if logsource.matches(category, product, service):
-                    matching.append(logsource)
-                    if logsource.rewrite is not None:
-                        category, product, service = logsource.rewrite
-        return SigmaLogsourceConfiguration(matching, self.defaultindex)
+            matches, rewritten = config.get_matching_logsources(*rewritten)
+            matching.extend(matches)
+        logsource = SigmaLogsourceConfiguration(matching, self.defaultindex)
+        self.logsourcecache[(category, product, service)] = logsource
+        return logsource
 
     def get_logsourcemerging(self):
         value = ''
@@ -82,6 +102,7 @@ class SigmaConfigurationChain(list):
     def set_backend(self, backend):
         """Set backend for all sigma conversion configurations in chain."""
         self.backend = backend
+        self.logsourcecache.clear()
         for config in self:
             config.set_backend(backend)
 
@@ -90,6 +111,14 @@ class SigmaConfigurationChain(list):
         if self.backend is not None:
             return self.backend.index_field
 
+    def get_coalesce_value_lists(self):
+        """Get if the condition optimizer should merge values of the same field into value lists for the backend"""
+        return getattr(self.backend, "coalesce_value_lists", False)
+
+    def get_coalesce_mixed_wildcards(self):
+        """Get if the condition optimizer may merge values with and without wildcards into one value list for the backend"""
+        return getattr(self.backend, "coalesce_mixed_wildcards", True)
+
 # Configuration
 class SigmaConfiguration:
     """Sigma converter configuration. Contains field mappings and logsource descriptions"""
@@ -122,6 +151,8 @@ class SigmaConfiguration:
 
             self.logsources = list()
             self.backend = None
+        self.logsourceindex = None          # (category, product, service) of log source definitions -> [ (position, log source definition) ]
+        self.logsourcecache = dict()        # (category, product, service) -> merged log source configuration
 
     def get_fieldmapping(self, fieldname):
         """Return mapped fieldname if mapping defined or field name given in parameter value"""
@@ -131,9 +162,49 @@ class SigmaConfiguration:
             return FieldMapping(fieldname)
 
     def get_logsource(self, category, product, service):
-        """Return merged log source definition of all logosurces that match criteria"""
-        matching = [logsource for logsource in self.logsources if logsource.matches(category, product, service)]
-        return SigmaLogsourceConfiguration(matching, self.defaultindex)
+        """Return merged log source definition of all logosurces that match criteria, built once per (category, product, service)."""
+        try:
+            return self.logsourcecache[(category, product, service)]
+        except KeyError:
+            pass
+        matching = [ logsource for position, logsource in self.find_logsources(category, product, service) ]
+        logsource = SigmaLogsourceConfiguration(matching, self.defaultindex)
+        self.logsourcecache[(category, product, service)] = logsource
+        return logsource
+
+    def find_logsources(self, category, product, service):
+        """
+        Return (position, log source definition) of all log source definitions that match the criteria in the
+        order of the configuration. A definition matches if each of its category, product and service is
+        undefined or equal to the criterion, therefore only the index entries with combinations of the criteria
+        and None have to be looked up.
+        """
+        if self.logsourceindex is None:
+            self.logsourceindex = dict()
+            for position, logsource in enumerate(self.logsources):
+                self.logsourceindex.setdefault((logsource.category, logsource.product, logsource.service), list()).append((position, logsource))
+        found = list()
+        for key in itertools.product(*[ (None,) if value is None else (value, None) for value in (category, product, service) ]):
+            if key != (None, None, None):       # definitions without any criteria never match
+                found.extend(self.logsourceindex.get(key, ()))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def get_matching_logsources(self, category, product, service):
+        """
+        Return list of log source definitions that match the criteria and the criteria after rewriting by the
+        matched definitions. Definitions that follow a definition with rewrite are matched with the rewritten
+        criteria.
+        """
+        matching = list()
+        found = self.find_logsources(category, product, service)
+        while found:
+            position, logsource = found.pop(0)
+            matching.append(logsource)
+            if logsource.rewrite is not None:
+                category, product, service = logsource.rewrite
+                found = [ item for item in self.find_logsources(category, product, service) if item[0] > position ]
+        return matching, (category, product, service)
 
     def get_logsourcemerging(self):
         if self.config != None:
@@ -144,6 +215,8 @@ class SigmaConfiguration:
     def set_backend(self, backend):
         """Set backend. This is used by other code to determine target properties for index addressing"""
         self.backend = backend
+        self.logsourceindex = None
+        self.logsourcecache.clear()
         if self.config != None:
             if 'logsources' in self.config:
                 logsources = self.config['logsources']
@@ -157,10 +230,19 @@ class SigmaConfiguration:
         if self.backend is not None:
             return self.backend.index_field
 
+    def get_coalesce_value_lists(self):
+        """Get if the condition optimizer should merge values of the same field into value lists for the backend"""
+        return getattr(self.backend, "coalesce_value_lists", False)
+
+    def get_coalesce_mixed_wildcards(self):
+        """Get if the condition optimizer may merge values with and without wildcards into one value list for the backend"""
+        return getattr(self.backend, "coalesce_mixed_wildcards", True)
+
 class SigmaLogsourceConfiguration:
     """Contains the definition of a log source"""
     def __init__(self, logsource=None, defaultindex=None):
         self.search = []
+        self.condition = None       # condition generated from merged log source by SigmaParser, kept if independent from rule
         if logsource == None:               # create empty object
             self.merged = False
             self.category = None
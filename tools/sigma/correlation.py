@@ -0,0 +1,433 @@
+# Streaming evaluation of Sigma aggregations (correlations) over event streams
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import operator
+from collections import deque, OrderedDict
+from datetime import datetime, timezone
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.parser.condition import SigmaAggregationParser
+from sigma.parser.exceptions import SigmaParseError
+from sigma.matcher import SigmaRuleIndex
+from sigma.backends.pymatch import PythonMatcherBackend, SigmaRuleMatcher, SigmaEvent, matchAny
+
+timeframeUnits = {
+        "s": 1,
+        "m": 60,
+        "h": 3600,
+        "d": 86400,
+        }
+
+def parseTimeframe(timeframe):
+    """Return timeframe like '30s', '5m', '1h' or '7d' in seconds or None if no timeframe is given"""
+    if timeframe is None:
+        return None
+    try:
+        return int(str(timeframe)[:-1]) * timeframeUnits[str(timeframe)[-1:]]
+    except (ValueError, KeyError):
+        raise SigmaParseError("Invalid timeframe '%s'" % str(timeframe))
+
+def parseTime(value):
+    """
+    Return timestamp as seconds since epoch. Numbers are seconds since epoch, strings are ISO 8601 timestamps, which
+    are UTC if they don't contain a timezone.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    elif isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            timestamp = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+        except ValueError:
+            raise ValueError("Invalid timestamp '%s'" % value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    else:
+        raise ValueError("Invalid timestamp '%s'" % str(value))
+
+class SigmaAlert:
+    """Result of an aggregation: rule (SigmaRuleMatcher), group value, aggregated value, time and last event of the group"""
+    __slots__ = ("rule", "group", "value", "time", "event")
+
+    def __init__(self, rule, group, value, time, event):
+        self.rule = rule
+        self.group = group
+        self.value = value
+        self.time = time
+        self.event = event
+
+class CountWindow:
+    """Times of events of a group in the timeframe. Only the last limit events are kept."""
+    __slots__ = ("times", "last", "event", "alerted")
+
+    def __init__(self, limit):
+        self.times = deque(maxlen=limit)
+        self.last = None        # time of last event
+        self.event = None       # last event
+        self.alerted = False
+
+    def add(self, time, value):
+        self.times.append(time)
+
+    def expire(self, cutoff):
+        times = self.times
+        while times and times[0] < cutoff:
+            times.popleft()
+
+    def value(self):
+        return len(self.times)
+
+class DistinctCountWindow(CountWindow):
+    """Distinct values of the aggregated field in the timeframe with the time they were seen last"""
+    __slots__ = ("limit",)
+
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.times = OrderedDict()      # value -> time, ordered by time
+        self.limit = limit
+
+    def add(self, time, value):
+        times = self.times
+        times[value] = time
+        times.move_to_end(value)
+        if len(times) > self.limit:
+            times.popitem(last=False)
+
+    def expire(self, cutoff):
+        times = self.times
+        while times and next(iter(times.values())) < cutoff:
+            times.popitem(last=False)
+
+class SumWindow(CountWindow):
+    """Values of the aggregated field in the timeframe and their sum"""
+    __slots__ = ("total",)
+
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.total = 0.0
+
+    def add(self, time, value):
+        if len(self.times) == self.times.maxlen:
+            self.total -= self.times[0][1]
+        self.times.append((time, value))
+        self.total += value
+
+    def expire(self, cutoff):
+        times = self.times
+        while times and times[0][0] < cutoff:
+            self.total -= times.popleft()[1]
+
+    def value(self):
+        return self.total
+
+class AverageWindow(SumWindow):
+    __slots__ = ()
+
+    def value(self):
+        return self.total / len(self.times) if self.times else None
+
+class MinimumWindow(CountWindow):
+    """
+    Monotonic queue of values of the aggregated field: each value is followed only by greater values, so the first
+    value is the minimum of the timeframe and values that can't become the minimum are dropped.
+    """
+    __slots__ = ()
+    better = operator.le
+
+    def add(self, time, value):
+        times = self.times
+        while times and self.better(value, times[-1][1]):
+            times.pop()
+        times.append((time, value))
+
+    def expire(self, cutoff):
+        times = self.times
+        while times and times[0][0] < cutoff:
+            times.popleft()
+
+    def value(self):
+        return self.times[0][1] if self.times else None
+
+class MaximumWindow(MinimumWindow):
+    __slots__ = ()
+    better = operator.ge
+
+class SigmaAggregationMatcher:
+    """
+    Evaluation of an aggregation like 'count(field) by group > 10' over a stream of events. Events matching the search
+    of the condition are added to the sliding window of their group, which holds the events of the last timeframe
+    seconds. Groups are kept ordered by the time of their last event, groups without events in the timeframe are
+    evicted and the least recently updated groups are evicted if there are more than max_groups groups.
+
+    Conditions with >, >= and == raise an alert when they become true for a group. Conditions with < and <= are
+    evaluated when the group is evicted or the stream ends, with the value as of the last event of the group.
+    Event counts only keep as many events per group as required to decide the condition, other windows keep at most
+    max_group_events events.
+    """
+    windows = {
+            SigmaAggregationParser.AGGFUNC_COUNT: CountWindow,
+            SigmaAggregationParser.AGGFUNC_MIN: MinimumWindow,
+            SigmaAggregationParser.AGGFUNC_MAX: MaximumWindow,
+            SigmaAggregationParser.AGGFUNC_AVG: AverageWindow,
+            SigmaAggregationParser.AGGFUNC_SUM: SumWindow,
+            }
+    operators = {
+            ">":  operator.gt,
+            ">=": operator.ge,
+            "<":  operator.lt,
+            "<=": operator.le,
+            "==": operator.eq,
+            }
+
+    def __init__(self, rule, search, agg, timeframe, max_groups, max_group_events):
+        self.rule = rule
+        self.search = search
+        self.aggfield = agg.aggfield
+        self.groupfield = agg.groupfield
+        self.timeframe = timeframe
+        self.max_groups = max_groups
+        try:
+            self.compare = self.operators[agg.cond_op]
+            self.threshold = float(agg.condition)
+        except (KeyError, ValueError):
+            raise SigmaParseError("Invalid aggregation condition '%s %s'" % (agg.cond_op, agg.condition))
+        self.deferred = agg.cond_op in ("<", "<=")     # condition is evaluated at end of group
+        if agg.aggfunc == SigmaAggregationParser.AGGFUNC_COUNT:
+            self.window = DistinctCountWindow if self.aggfield else CountWindow
+            self.limit = int(self.threshold) + 1 if self.threshold >= 0 else 1
+            self.numeric = False
+        else:
+            if not self.aggfield:
+                raise SigmaParseError("Aggregation function '%s' requires a field" % agg.aggfunc_notrans)
+            self.window = self.windows[agg.aggfunc]
+            self.limit = max_group_events
+            self.numeric = True
+        self.groups = OrderedDict()     # group -> window, ordered by time of last event
+
+    def expire(self, time, alerts):
+        """Evict groups without events in the timeframe before time"""
+        if self.timeframe is not None:
+            groups = self.groups
+            cutoff = time - self.timeframe
+            while groups:
+                group, window = next(iter(groups.items()))
+                if window.last >= cutoff:
+                    break
+                del groups[group]
+                self.close(group, window, alerts)
+
+    def process(self, event, time, alerts):
+        """Add event (SigmaEvent) that occurred at time if it matches the search and append alerts to list alerts"""
+        if not self.search(event):
+            return alerts
+        groups = self.groups
+        if self.groupfield:
+            group = event.getStrings(self.groupfield)
+            if not group:
+                return alerts
+            group = group[0] if len(group) == 1 else group
+        else:
+            group = None
+        if self.aggfield:
+            value = event.getStrings(self.aggfield)
+            if not value:
+                return alerts
+            value = value[0] if len(value) == 1 else value
+            if self.numeric:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return alerts
+        else:
+            value = None
+
+        try:
+            window = groups[group]
+            groups.move_to_end(group)
+        except KeyError:
+            window = groups[group] = self.window(self.limit)
+            if len(groups) > self.max_groups:
+                self.close(*groups.popitem(last=False), alerts)
+        window.add(time, value)
+        window.last = time
+        window.event = event.event
+        if self.timeframe is not None:
+            window.expire(time - self.timeframe)
+        if not self.deferred:
+            result = window.value()
+            if result is not None and self.compare(result, self.threshold):
+                if not window.alerted:
+                    window.alerted = True
+                    alerts.append(SigmaAlert(self.rule, group, result, time, event.event))
+            else:
+                window.alerted = False
+        return alerts
+
+    def close(self, group, window, alerts):
+        """Evaluate deferred condition of group that is removed"""
+        if self.deferred:
+            result = window.value()
+            if result is not None and self.compare(result, self.threshold):
+                alerts.append(SigmaAlert(self.rule, group, result, window.last, window.event))
+
+    def flush(self):
+        """Evict all groups at end of stream and return list of alerts"""
+        alerts = list()
+        while self.groups:
+            self.close(*self.groups.popitem(last=False), alerts)
+        return alerts
+
+class SigmaNearMatcher:
+    """
+    Evaluation of 'near' aggregations: an alert is raised if events matching the search of the condition and all
+    included searches occurred within the timeframe and no event matched an excluded search in this time. Only the
+    time of the last match of each search is kept. The events that raised an alert are not used for further alerts.
+    """
+    def __init__(self, rule, search, includes, excludes, timeframe):
+        self.rule = rule
+        self.searches = [ search ] + includes
+        self.excludes = excludes
+        self.timeframe = timeframe
+        self.last = [ None ] * len(self.searches)       # time of last match of each search
+        self.lastexclude = None
+
+    def expire(self, time, alerts):
+        pass
+
+    def process(self, event, time, alerts):
+        matched = False
+        for i, search in enumerate(self.searches):
+            if search(event):
+                self.last[i] = time
+                matched = True
+        for search in self.excludes:
+            if search(event):
+                self.lastexclude = time
+        if not matched:
+            return alerts
+        cutoff = time - self.timeframe if self.timeframe is not None else None
+        for last in self.last:
+            if last is None or cutoff is not None and last < cutoff:
+                return alerts
+        if self.lastexclude is not None and (cutoff is None or self.lastexclude >= cutoff):
+            return alerts
+        self.last = [ None ] * len(self.searches)
+        alerts.append(SigmaAlert(self.rule, None, len(self.searches), time, event.event))
+        return alerts
+
+    def flush(self):
+        return []
+
+class SigmaCorrelationEngine:
+    """
+    Streaming evaluation of Sigma rules with aggregations (count, min, max, avg, sum and near) over events given as
+    dicts in time order, e.g. to test correlation rules for their alert volume. The searches are compiled with the
+    pymatch backend, the time of an event is taken from timefield. Events without time are assigned to the time of
+    the latest event. Like in SigmaRuleSet, the searches are only evaluated for events that contain a literal required
+    by them (SigmaRuleIndex). Example:
+
+    engine = SigmaCorrelationEngine(timefield="UtcTime")
+    engine.add_file(Path("rules/windows/builtin/security/win_susp_failed_logons_single_source.yml"))
+    for event in events:
+        for alert in engine.process(event):
+            ...
+    for alert in engine.flush():
+        ...
+    """
+    def __init__(self, config=None, rulefilter=None, timefield="@timestamp", max_groups=100000, max_group_events=10000):
+        self.config = config if config is not None else SigmaConfiguration()
+        self.rulefilter = rulefilter
+        self.timefield = timefield
+        self.max_groups = max_groups                # number of groups kept per aggregation
+        self.max_group_events = max_group_events    # number of events kept per group for min/max/avg/sum
+        self.backend = PythonMatcherBackend(self.config)
+        self.aggregations = list()      # SigmaAggregationMatcher or SigmaNearMatcher of each condition
+        self.index = None               # SigmaRuleIndex of the rules of the aggregations
+        self.time = None                # time of latest event
+
+    def add(self, content, filename=None):
+        """Parse and add all rules contained in content, which is a string or stream with YAML documents"""
+        for parser in SigmaCollectionParser(content, self.config, self.rulefilter, filename).parsers:
+            self.add_parser(parser)
+
+    def add_file(self, path):
+        """Add rules from Sigma file given as Path"""
+        with path.open(encoding="utf-8") as f:
+            self.add(f, path)
+
+    def add_parser(self, parser):
+        """Add rule given as SigmaParser. All conditions of the rule must contain an aggregation."""
+        aggregations = list()
+        for parsed in parser.condparsed:
+            agg = parsed.parsedAgg
+            if agg is None:
+                raise NotImplementedError("Conditions without aggregation are not supported in rules with aggregations")
+            search = self.backend.generateNode(parsed.parsedSearch)
+            literals = self.backend.getRequiredLiterals(parsed.parsedSearch)
+            timeframe = parseTimeframe(parser.parsedyaml["detection"].get("timeframe"))
+            if agg.aggfunc == SigmaAggregationParser.AGGFUNC_NEAR:
+                definitions = [ [ parser.parse_definition_byname(definition) for definition in parser.match_definitions(name) ] for name in agg.include + agg.exclude ]
+                for definition in definitions:      # events matching any search including excluded ones are candidates
+                    for node in definition:
+                        required = self.backend.getRequiredLiterals(node)
+                        literals = literals | required if literals is not None and required is not None else None
+                searches = [ matchAny([ self.backend.generateNode(node) for node in definition ]) for definition in definitions ]
+                rule = SigmaRuleMatcher(parser.parsedyaml, search, literals)
+                aggregations.append(SigmaNearMatcher(rule, search, searches[:len(agg.include)], searches[len(agg.include):], timeframe))
+            else:
+                rule = SigmaRuleMatcher(parser.parsedyaml, search, literals)
+                aggregations.append(SigmaAggregationMatcher(rule, search, agg, timeframe, self.max_groups, self.max_group_events))
+        self.aggregations.extend(aggregations)
+        self.index = None
+
+    def getTime(self, event):
+        """Return time of event (SigmaEvent) in seconds since epoch or time of latest event"""
+        value = event.event.get(self.timefield)
+        if value is None and "." in self.timefield:
+            value = event.getStrings(self.timefield)
+            value = value[0] if value else None
+        if value is None:
+            return self.time if self.time is not None else 0.0
+        time = parseTime(value)
+        if self.time is None or time > self.time:
+            self.time = time
+        return time
+
+    def process(self, event):
+        """Process event given as dict or SigmaEvent and return list of alerts (SigmaAlert)"""
+        if not isinstance(event, SigmaEvent):
+            event = SigmaEvent(event)
+        time = self.getTime(event)
+        if self.index is None:
+            self.index = SigmaRuleIndex([ aggregation.rule for aggregation in self.aggregations ])
+        alerts = list()
+        for aggregation in self.aggregations:
+            aggregation.expire(time, alerts)
+        aggregations = self.aggregations
+        for i in self.index.candidates(event):
+            aggregations[i].process(event, time, alerts)
+        return alerts
+
+    def flush(self):
+        """Evaluate remaining state at end of the event stream and return list of alerts"""
+        alerts = list()
+        for aggregation in self.aggregations:
+            alerts.extend(aggregation.flush())
+        return alerts
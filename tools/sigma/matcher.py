@@ -0,0 +1,189 @@
+# Evaluation of Sigma rules against events in-process
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from collections import deque
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.pymatch import PythonMatcherBackend, SigmaEvent
+
+class AhoCorasickAutomaton:
+    """Aho-Corasick automaton that finds all occurrences of a set of strings in a text in one pass over the text"""
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [ dict() ]      # state -> character -> next state
+        self.fail = [ 0 ]           # state -> state of longest proper suffix that is a prefix of a pattern
+        self.output = [ () ]        # state -> numbers of patterns that end in state
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                try:
+                    state = self.goto[state][char]
+                except KeyError:
+                    self.goto[state][char] = len(self.goto)
+                    state = len(self.goto)
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.output.append(())
+            self.output[state] += (i,)
+
+        queue = deque(self.goto[0].values())     # breadth-first computation of failure transitions
+        while queue:
+            state = queue.popleft()
+            for char, nextstate in self.goto[state].items():
+                queue.append(nextstate)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nextstate] = self.goto[fail].get(char, 0)
+                self.output[nextstate] += self.output[self.fail[nextstate]]
+
+    def search(self, text, found):
+        """Add numbers of all patterns contained in text to set found"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            nextstate = goto[state].get(char)
+            while nextstate is None and state:
+                state = fail[state]
+                nextstate = goto[state].get(char)
+            state = nextstate or 0
+            if output[state]:
+                found.update(output[state])
+
+class SigmaRuleIndex:
+    """
+    Index of rules by the literals that are required by them (SigmaRuleMatcher.literals). Values of fields that
+    are compared with exact literals are looked up in a dict, values that must contain literals are scanned for
+    the literals of all rules with one Aho-Corasick automaton per field. Only the candidate rules selected by the
+    literals found in an event and the rules without literals must be evaluated for the event.
+    """
+    def __init__(self, rules):
+        self.unconditional = [ i for i, rule in enumerate(rules) if rule.literals is None ]
+        exact = dict()          # field -> literal -> rule numbers
+        contained = dict()      # field -> literal -> rule numbers
+        for i, rule in enumerate(rules):
+            for field, literal, is_exact in rule.literals or ():
+                (exact if is_exact else contained).setdefault(field, dict()).setdefault(literal, list()).append(i)
+        self.exact = list(exact.items())
+        self.contained = list()     # (field, automaton, rule numbers of each literal)
+        for field, literals in contained.items():
+            automaton = AhoCorasickAutomaton(literals.keys())
+            self.contained.append((field, automaton, [ literals[pattern] for pattern in automaton.patterns ]))
+
+    def candidates(self, event):
+        """Return sorted list of numbers of rules that can match the event (SigmaEvent)"""
+        candidates = set(self.unconditional)
+        raw = event.event
+        for field, literals in self.exact:
+            if field is None or field in raw or "." in field:
+                for value in event.getFolded(field):
+                    try:
+                        candidates.update(literals[value])
+                    except KeyError:
+                        pass
+        for field, automaton, rules in self.contained:
+            if field is None:
+                values = event.getKeywords()
+            elif field in raw or "." in field:
+                values = event.getFolded(field)
+            else:
+                continue
+            found = set()
+            for value in values:
+                automaton.search(value, found)
+            for pattern in found:
+                candidates.update(rules[pattern])
+        return sorted(candidates)
+
+class SigmaRuleSet:
+    """
+    Set of Sigma rules that are compiled with the pymatch backend and matched against events, which are dicts
+    like parsed from JSON. Example:
+
+    ruleset = SigmaRuleSet()
+    ruleset.add_file(Path("rules/windows/process_creation/proc_creation_win_whoami.yml"))
+    for lineno, event, rules in ruleset.match_lines(open("events.jsonl")):
+        ...
+    """
+    backend_class = PythonMatcherBackend
+
+    def __init__(self, config=None, rulefilter=None, prefilter=True, correlation=None):
+        self.config = config if config is not None else SigmaConfiguration()
+        self.rulefilter = rulefilter
+        self.prefilter = prefilter      # select candidate rules for each event with SigmaRuleIndex
+        self.correlation = correlation  # SigmaCorrelationEngine that receives rules with aggregations
+        self.backend = self.backend_class(self.config)
+        self.rules = list()         # compiled rules as SigmaRuleMatcher
+        self.index = None           # index of rules, built on first match after rules were added
+
+    def add(self, content, filename=None):
+        """
+        Parse and compile all rules contained in content, which is a string or stream with YAML documents. Parse
+        errors and rules that can't be compiled raise exceptions like in sigmac, rules of content that were
+        compiled before the error are kept. Rules with aggregations are added to the correlation engine if given.
+        """
+        for parser in SigmaCollectionParser(content, self.config, self.rulefilter, filename).parsers:
+            if self.correlation is not None and any(parsed.parsedAgg for parsed in parser.condparsed):
+                self.correlation.add_parser(parser)
+            else:
+                self.rules.append(self.backend.generate(parser))
+                self.index = None
+
+    def add_file(self, path):
+        """Add rules from Sigma file given as Path"""
+        with path.open(encoding="utf-8") as f:
+            self.add(f, path)
+
+    def get_index(self):
+        if self.index is None:
+            self.index = SigmaRuleIndex(self.rules)
+        return self.index
+
+    def match_event(self, event):
+        """Return list of rules matching event given as SigmaEvent"""
+        rules = self.rules
+        if self.prefilter:
+            return [ rules[i] for i in self.get_index().candidates(event) if rules[i].match(event) ]
+        else:
+            return [ rule for rule in rules if rule.match(event) ]
+
+    def match(self, event):
+        """Return list of rules matching event"""
+        return self.match_event(SigmaEvent(event))
+
+    def match_lines(self, lines):
+        """
+        Match events given as JSON lines, e.g. a file object. Yields (line number, event, list of matching rules)
+        for each event, empty lines are skipped. Lines that are not a JSON object raise ValueError.
+        """
+        for lineno, event in self.parse_lines(lines):
+            yield lineno, event, self.match_event(SigmaEvent(event))
+
+    def parse_lines(self, lines):
+        """Yield (line number, event) for each non-empty line of JSON lines"""
+        for lineno, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError as e:
+                raise ValueError("Line %d is no valid JSON: %s" % (lineno, str(e))) from e
+            if not isinstance(event, dict):
+                raise ValueError("Line %d is no JSON object" % lineno)
+            yield lineno, event
@@ -14,8 +14,8 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import yaml
+from sigma import profiling
 from .exceptions import SigmaCollectionParseError
 from .rule import SigmaParser
 
@@ -28,22 +28,58 @@ class SigmaCollectionParser:
     * global: merges attributes from document in all following documents. Accumulates attributes from previous set_global documents
     * reset: resets global attributes from previous set_global statements
     * repeat: takes attributes from this YAML document, merges into previous rule YAML and regenerates the rule
+
+    The content is either a string or stream with YAML documents or a list of already loaded YAML documents.
+
+    By default, all rules are parsed on construction and kept in the parsers attribute. In lazy mode, YAML
+    documents are loaded and rules are parsed one by one while they are consumed by generate() or
+    parse_rules(), each parsed rule is released after it was processed. This allows conversion of streams
+    with an arbitrary number of rules in constant memory, but the rules can only be iterated once.
     """
-    def __init__(self, content, config=None, rulefilter=None, filename=None):
+    def __init__(self, content, config=None, rulefilter=None, filename=None, lazy=False):
         if config is None:
             from sigma.configuration import SigmaConfiguration
             config = SigmaConfiguration()
-        self.yamls = yaml.safe_load_all(content)
-        globalyaml = dict()
-        self.parsers = list()
-        prevrule = None
         if filename:
             try:
-                globalyaml['yml_filename']=str(filename.name)
-                globalyaml['yml_path']=str(filename.parent)
+                filename.name, filename.parent
             except:
                 filename = None
-        
+        self.config = config
+        self.rulefilter = rulefilter
+        self.filename = filename
+        self.lazy = lazy
+        profiling.set_rule(str(filename) if filename else "<rule>")
+        if isinstance(content, list):
+            self.yamls = content
+        else:
+            self.yamls = yaml.safe_load_all(content)
+            if profiling.profiler is not None:      # load all documents in advance to measure YAML loading separately
+                start = profiling.start()
+                self.yamls = list(self.yamls)
+                profiling.stop("yaml_load", start)
+
+        if lazy:
+            self.parsers = None
+            self.rulenames = None
+        else:
+            self.parsers = list()
+            self.rulenames = list()     # names of parsed rules for profiling: file name, followed by number of rule in file from second rule
+            for rulename, parser in self.parse_rules():
+                self.parsers.append(parser)
+                self.rulenames.append(rulename)
+
+    def parse_rules(self):
+        """Generator of (rule name, SigmaParser) tuples of the rules contained in the YAML documents that pass the rule filter"""
+        filename = self.filename
+        rulefilter = self.rulefilter
+        globalyaml = dict()
+        if filename:
+            globalyaml['yml_filename']=str(filename.name)
+            globalyaml['yml_path']=str(filename.parent)
+        filename_str = str(filename) if filename else "<rule>"
+        rulecount = 0
+        prevrule = None
         for yamldoc in self.yamls:
             action = None
             try:
@@ -62,27 +98,71 @@ class SigmaCollectionParser:
             elif action == "repeat":
                 if prevrule is None:
                     raise SigmaCollectionParseError("action 'repeat' is only applicable after first valid Sigma rule")
-                newrule = copy.deepcopy(prevrule)
-                deep_update_dict(newrule, yamldoc)
-                if rulefilter is None or rulefilter is not None and not rulefilter.match(newrule):
-                    self.parsers.append(SigmaParser(newrule, config))
+                newrule = merged_dict(prevrule, yamldoc)
+                rulecount += 1
+                rulename = filename_str if rulecount == 1 else "%s#%d" % (filename_str, rulecount)
+                profiling.set_rule(rulename)
+                start = profiling.start()
+                passed = rulefilter is None or rulefilter is not None and not rulefilter.match(newrule)
+                profiling.stop("rule_filter", start)
+                if passed:
+                    yield rulename, SigmaParser(newrule, self.config)
                     prevrule = newrule
             else:
                 deep_update_dict(yamldoc, globalyaml)
-                if rulefilter is None or rulefilter is not None and rulefilter.match(yamldoc):
-                    self.parsers.append(SigmaParser(yamldoc, config))
+                rulecount += 1
+                rulename = filename_str if rulecount == 1 else "%s#%d" % (filename_str, rulecount)
+                profiling.set_rule(rulename)
+                start = profiling.start()
+                passed = rulefilter is None or rulefilter is not None and rulefilter.match(yamldoc)
+                profiling.stop("rule_filter", start)
+                if passed:
+                    yield rulename, SigmaParser(yamldoc, self.config)
                     prevrule = yamldoc
-        self.config = config
 
     def generate(self, backend):
-        """Calls backend for all parsed rules"""
-        return filter(
-                lambda x: bool(x),      # filter None's and empty strings
-                [ backend.generate(parser) for parser in self.parsers ]
-                )
+        """
+        Calls backend for all parsed rules. In lazy mode, rules are parsed and converted while the returned
+        iterator is consumed, parse errors are raised from the iterator.
+        """
+        if self.lazy:
+            return filter(
+                    lambda x: bool(x),      # filter None's and empty strings
+                    self._generate(backend, self.parse_rules())
+                    )
+        else:
+            results = list(self._generate(backend, zip(self.rulenames, self.parsers)))
+            return filter(
+                    lambda x: bool(x),      # filter None's and empty strings
+                    results
+                    )
+
+    def _generate(self, backend, parsers):
+        for rulename, parser in parsers:
+            profiling.set_rule(rulename)
+            start = profiling.start()
+            result = backend.generate(parser)
+            profiling.stop("generate", start)
+            yield result
 
     def __iter__(self):
-        return iter([parser.parsedyaml for parser in self.parsers])
+        if self.lazy:
+            return (parser.parsedyaml for rulename, parser in self.parse_rules())
+        else:
+            return iter([parser.parsedyaml for parser in self.parsers])
+
+def merged_dict(dest, src):
+    """
+    Return copy of dest with src merged like deep_update_dict. Only dicts on the paths of merged keys are
+    copied, all other values are shared with dest.
+    """
+    merged = dict(dest)
+    for key, value in src.items():
+        if isinstance(value, dict) and key in merged and isinstance(merged[key], dict):
+            merged[key] = merged_dict(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
 
 def deep_update_dict(dest, src):
     for key, value in src.items():
@@ -14,7 +14,9 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import re
+from sigma import profiling
 from .base import SimpleParser
 from .exceptions import SigmaParseError
 
@@ -125,28 +127,44 @@ class SigmaConditionTokenizer:
             (SigmaConditionToken.TOKEN_LPAR,   re.compile("\\(")),
             (SigmaConditionToken.TOKEN_RPAR,   re.compile("\\)")),
             ]
+    # All token definitions combined into one pattern. Alternatives are tried in the order of the definitions
+    # like above, group t<n> identifies the matched token definition n.
+    tokenpattern = re.compile("|".join(
+        "(?P<t%d>%s)" % (i, "(?i:%s)" % (regex.pattern) if regex.flags & re.IGNORECASE else regex.pattern)
+        for i, (tokenid, regex) in enumerate(tokendefs)
+        ))
+    tokencache = dict()         # condition string -> tuple of tokens
+    tokencache_size = 4096
 
     def __init__(self, condition):
         if type(condition) == str:          # String that is parsed
-            self.tokens = list()
-            pos = 1
-
-            while len(condition) > 0:
-                for tokendef in self.tokendefs:     # iterate over defined tokens and try to recognize the next one
-                    match = tokendef[1].match(condition)
-                    if match:
-                        if tokendef[0] != None:
-                            self.tokens.append(SigmaConditionToken(tokendef, match, pos + match.start()))
-                        pos += match.end()      # increase position and cut matched prefix from condition
-                        condition = condition[match.end():]
-                        break
-                else:   # no valid token identified
-                    raise SigmaParseError("Unexpected token in condition at position %s" % condition)
+            try:
+                self.tokens = list(self.tokencache[condition])
+            except KeyError:
+                self.tokens = self.tokenize(condition)
+                if len(self.tokencache) >= self.tokencache_size:
+                    self.tokencache.clear()
+                self.tokencache[condition] = tuple(self.tokens)
         elif type(condition) == list:       # List of tokens to be converted into SigmaConditionTokenizer class
             self.tokens = condition
         else:
             raise TypeError("SigmaConditionTokenizer constructor expects string or list, got %s" % (type(condition)))
 
+    def tokenize(self, condition):
+        """Return list of tokens recognized in condition string"""
+        tokens = list()
+        pos = 0
+        for match in self.tokenpattern.finditer(condition):
+            if match.start() != pos:        # characters between previous and this token weren't recognized
+                break
+            tokendef = self.tokendefs[int(match.lastgroup[1:])]
+            if tokendef[0] != None:
+                tokens.append(SigmaConditionToken(tokendef, match, pos + 1))
+            pos = match.end()
+        if pos != len(condition):   # no valid token identified
+            raise SigmaParseError("Unexpected token in condition at position %s" % condition[pos:])
+        return tokens
+
     def __str__(self):  # pragma: no cover
         return " ".join([str(token) for token in self.tokens])
 
@@ -179,6 +197,8 @@ class SigmaConditionTokenizer:
 ### Parse Tree Node Classes ###
 class ParseTreeNode:
     """Parse Tree Node Base Class"""
+    __slots__ = ()
+
     def __init__(self):
         raise NotImplementedError("ConditionBase is no usable class")
 
@@ -188,8 +208,8 @@ class ParseTreeNode:
 
 class ConditionBase(ParseTreeNode):
     """Base class for conditional operations"""
+    __slots__ = ("items",)          # nodes are kept for all parsed rules, no per-instance attribute dict
     op = COND_NONE
-    items = None
 
     def __init__(self, sigma=None, op=None, *args):
         if type(self) == ConditionBase:
@@ -211,6 +231,8 @@ class ConditionBase(ParseTreeNode):
 
 
 class ConditionBaseOneItem(ConditionBase):
+    __slots__ = ()
+
     def __init__(self, sigma=None, op=None, val=None):
         if type(self) == ConditionBaseOneItem:
             raise NotImplementedError("ConditionBaseOneItem is no usable class")
@@ -236,39 +258,46 @@ class ConditionBaseOneItem(ConditionBase):
 
 class ConditionAND(ConditionBase):
     """AND Condition"""
+    __slots__ = ()
     op = COND_AND
 
 
 class ConditionOR(ConditionBase):
     """OR Condition"""
+    __slots__ = ()
     op = COND_OR
 
 
 class ConditionNOT(ConditionBaseOneItem):
     """NOT Condition"""
+    __slots__ = ()
     op = COND_NOT
 
 
 class ConditionNULLValue(ConditionBaseOneItem):
     """Condition: Field value is empty or doesn't exists"""
+    __slots__ = ()
     op = COND_NULL
-    pass
 
 
 class ConditionNotNULLValue(ConditionNULLValue):
     """Condition: Field value is not empty"""
+    __slots__ = ()
     op = COND_NULL
-    pass
 
 
 class NodeSubexpression(ParseTreeNode):
     """Subexpression"""
+    __slots__ = ("items",)
+
     def __init__(self, subexpr):
         self.items = subexpr
 
 
 class SigmaSearchValueAsIs:
     """The contained value is used as-is in the output."""
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -282,19 +311,10 @@ def generateXOf(sigma, val, condclass):
     * condclass across all definitions if x is keyword 'them'
     * condclass across all matching definition if x is wildcard expression, e.g. 'selection*'
     """
-    if val.matched == "them":           # OR across all definitions
-        cond = condclass()
-        for name, definition in sigma.definitions.items():
-            if name == "timeframe":
-                continue
-            cond.add(NodeSubexpression(sigma.parse_definition(definition)))
-        return NodeSubexpression(cond)
-    elif val.matched.find("*") > 0:     # OR across all matching definitions
+    if val.matched == "them" or val.matched.find("*") > 0:     # OR across all (matching) definitions
         cond = condclass()
-        reDefPat = re.compile("^" + val.matched.replace("*", ".*") + "$")
-        for name, definition in sigma.definitions.items():
-            if name != "timeframe" and reDefPat.match(name):
-                cond.add(NodeSubexpression(sigma.parse_definition(definition)))
+        for name in sigma.match_definitions(val.matched):
+            cond.add(NodeSubexpression(sigma.parse_definition_byname(name)))
         return NodeSubexpression(cond)
     else:                               # OR across all items of definition
         return NodeSubexpression(sigma.parse_definition_byname(val.matched, condclass))
@@ -315,123 +335,330 @@ def convertId(sigma, op):
     return NodeSubexpression(sigma.parse_definition_byname(op.matched))
 
 
+def copyTree(node):
+    """
+    Copy parse tree nodes. Leaf values are shared, except value lists of (field, value) items that may be
+    changed by backends.
+    """
+    if isinstance(node, NodeSubexpression):
+        return NodeSubexpression(copyTree(node.items))
+    elif isinstance(node, ConditionBase):
+        copied = copy.copy(node)
+        copied.items = type(node.items)(copyTree(item) for item in node.items)
+        return copied
+    elif type(node) is tuple and len(node) == 2 and type(node[1]) is list:
+        return (node[0], list(node[1]))
+    else:
+        return node
+
+
 # Optimizer
 class SigmaConditionOptimizer:
     """
     Optimizer for the parsed AST.
     """
-    def _stripSubexpressionNode(self, node):
-        """
-        Recursively strips all subexpressions (i.e. brackets) from the AST.
-        """
-        if type(node) == NodeSubexpression:
-            assert(type(node.items) != list)
-            return self._stripSubexpressionNode(node.items)
-        if hasattr(node, 'items') and type(node) is not ConditionNOT:
-            node.items = list(map(self._stripSubexpressionNode, node.items))
-        return node
+    reContainsWildcard = re.compile("(?:(?<!\\\\)|\\\\\\\\)[*?]").search
+
+    def __init__(self, coalesce_value_lists=False, coalesce_mixed_wildcards=True):
+        self.coalesce_value_lists = coalesce_value_lists    # merge OR'ed values of a field into value list, backend must support lists
+        self.coalesce_mixed_wildcards = coalesce_mixed_wildcards    # values with and without wildcards may be merged into one list
 
-    def _unstripSubexpressionNode(self, node):
+    def _itemKey(self, item):
         """
-        Recursively adds brackets around AND and OR operations in the AST.
+        Key of item for detection of duplicates. Lists within definitions are converted into tuples, nodes
+        are represented by the canonical node of their structure.
         """
-        if type(node) in (ConditionAND, ConditionOR):
-            newnode = NodeSubexpression(node)
-            node.items = list(map(self._unstripSubexpressionNode, node.items))
-            return newnode
-        return node
+        if type(item) == tuple and type(item[1]) == list:
+            return (item[0], tuple(item[1]))
+        return item
 
-    def _ordered_uniq(self, l):
+    def _canonical(self, node, keys):
         """
-        Remove duplicate entries in list *l* while preserving order.
-
-        Used to be fast before it needed to work around list instead of
-        tuple being used for lists within definitions in the AST.
+        Return canonical node of structure given by node type and item keys (hash consing). Structurally
+        equal subtrees share the same canonical node and are detected as duplicates by identity.
         """
-        seen = set()
-        #return [x for x in l if x not in seen and not seen.add(x)]
-        uniq = []
-        for x in l:
-            if type(x) == tuple and type(x[1]) == list:
-                x = (x[0], tuple(x[1]))
-            if x not in seen and not seen.add(x):
-                uniq.append(x)
-        out = []
-        for x in uniq:
-            if type(x) == tuple and type(x[1]) == tuple:
-                out.append((x[0], list(x[1])))
-            else:
-                out.append(x)
-        return out
+        return self.structures.setdefault((type(node), tuple(keys)), node)
 
-    def _optimizeNode(self, node, changes=False):
+    def _optimizeJunction(self, node, items):
         """
-        Recursively optimize the AST rooted at *node* once.  Returns the new
-        root node and a boolean indicating if the tree was changed in this
-        invocation or any of the recursive sub-invocations.
-
-        You MUST remove all subexpression nodes from the AST before calling
-        this function.  Subexpressions are implicit around AND/OR nodes.
+        Apply rules to AND/OR node whose items are already optimized. Items are given as list of (item, key)
+        pairs, returns optimized node and key.
         """
-        if type(node) in (ConditionOR, ConditionAND):
-            # Remove empty OR(X), AND(X)
-            if len(node.items) == 0:
-                return None, True
-            if None in node.items:
-                node.items = [item for item in node.items if item != None]
-                return self._optimizeNode(node, changes=True)
+        nodetype = type(node)
+        while True:
+            # Remove empty OR(), AND()
+            if None in (item for item, key in items):
+                items = [ (item, key) for item, key in items if item is not None ]
+            if len(items) == 0:
+                return None, None
 
             # OR(X), AND(X)                 =>  X
-            if len(node.items) == 1:
-                return self._optimizeNode(node.items[0], changes=True)
+            if len(items) == 1:
+                return items[0]
 
             # OR(X, X, ...), AND(X, X, ...) =>  OR(X, ...), AND(X, ...)
-            uniq_items = self._ordered_uniq(node.items)
-            if len(uniq_items) < len(node.items):
-                node.items = uniq_items
-                return self._optimizeNode(node, changes=True)
+            seen = set()
+            uniq_items = [ (item, key) for item, key in items if key not in seen and not seen.add(key) ]
+            if len(uniq_items) < len(items):
+                items = uniq_items
+                continue
 
             # OR(X, OR(Y))                  =>  OR(X, Y)
-            if any(type(child) == type(node) for child in node.items) and \
-               all(type(child) in (type(node), tuple) for child in node.items):
+            if any(type(item) == nodetype for item, key in items) and \
+               all(type(item) in (nodetype, tuple) for item, key in items):
                 newitems = []
-                for child in node.items:
-                    if hasattr(child, 'items'):
-                        newitems.extend(child.items)
+                for item, key in items:
+                    if type(item) == nodetype:
+                        newitems.extend(self.junctionItems.pop(item))
                     else:
-                        newitems.append(child)
-                node.items = newitems
-                return self._optimizeNode(node, changes=True)
+                        newitems.append((item, key))
+                items = newitems
+                continue
 
-            # fallthrough
+            if nodetype == ConditionOR:
+                # OR((F, A), (F, B), ...)       =>  (F, [A, B, ...])
+                if self.coalesce_value_lists:
+                    coalesced = self._coalesceItems(items)
+                    if coalesced is not None:
+                        items = coalesced
+                        continue
 
-        elif type(node) == ConditionNOT:
-            assert(len(node.items) == 1)
-            # NOT(NOT(X))                   =>  X
-            if type(node.items[0]) == ConditionNOT:
-                assert(len(node.items[0].items) == 1)
-                return self._optimizeNode(node.items[0].items[0], changes=True)
+                # OR(AND(X, A), AND(X, B), C)   =>  OR(AND(X, OR(A, B)), C)
+                factored = self._factorItems(items)
+                if factored is not None:
+                    items = factored
+                    continue
 
-            # NOT(ConditionNULLValue)       =>  ConditionNotNULLValue
-            if type(node.items[0]) == ConditionNULLValue:
-                newnode = ConditionNotNULLValue(val=node.items[0].items[0])
-                return self._optimizeNode(newnode, changes=True)
+            break
 
-            # NOT(ConditionNotNULLValue)    =>  ConditionNULLValue
-            if type(node.items[0]) == ConditionNotNULLValue:
-                newnode = ConditionNULLValue(val=node.items[0].items[0])
-                return self._optimizeNode(newnode, changes=True)
+        node.items = [ item for item, key in items ]
+        self.junctionItems[node] = items
+        return node, self._canonical(node, (key for item, key in items))
 
-            # fallthrough
+    def _valueType(self, value):
+        """
+        Return str or int if value is a string or number or a list of them with the same type, else None. Only
+        values of the same type are merged. If the backend doesn't merge values with and without wildcards,
+        strings are returned as (str, True) or (str, False) depending on wildcards contained in all values.
+        """
+        values = value if type(value) == list else [ value ]
+        if len(values) == 0 or type(values[0]) not in (str, int) or any(type(v) != type(values[0]) for v in values):
+            return None
+        if type(values[0]) == str and not self.coalesce_mixed_wildcards:
+            wildcards = set(self.reContainsWildcard(v) is not None for v in values)
+            if len(wildcards) > 1:
+                return None
+            return (str, wildcards.pop())
+        return type(values[0])
+
+    def _wildcardSegments(self, value):
+        """
+        Split value into the parts between wildcards. Returns None if value can't be compared safely:
+        values with single character wildcards or escape sequences.
+        """
+        if type(value) != str or "?" in value or "\\*" in value or "\\\\" in value:
+            return None
+        return value.split("*")
 
-        else:
-            return node, changes
+    def _covers(self, patternparts, valueparts):
+        """
+        Check if all strings matched by the value are also matched by the pattern, e.g. '*foo*' covers
+        '*foo.exe*'. Both are given as parts between wildcards. The parts of the pattern are searched in
+        the literal parts of the value, therefore the check can miss coverage but never reports it wrongly.
+        """
+        if len(patternparts) == 1:      # no wildcard in pattern
+            return patternparts == valueparts
+
+        if not valueparts[0].startswith(patternparts[0]):
+            return False
+        i = 0
+        pos = len(patternparts[0])
+        for part in patternparts[1:-1]:
+            found = valueparts[i].find(part, pos)
+            while found < 0:
+                i += 1
+                if i >= len(valueparts):
+                    return False
+                pos = 0
+                found = valueparts[i].find(part)
+            pos = found + len(part)
+        last = len(valueparts) - 1
+        return valueparts[last].endswith(patternparts[-1]) and \
+            (i < last or len(valueparts[last]) - len(patternparts[-1]) >= pos)
+
+    def _pruneValues(self, values):
+        """Remove values from list of alternative values that are duplicates or covered by other values."""
+        # Each part of a pattern must be contained in a covered value, the longest part is checked first
+        # with a plain substring search to skip most pairs.
+        patterns = list()
+        for value in values:
+            if type(value) == str and "*" in value:
+                parts = self._wildcardSegments(value)
+                if parts is not None:
+                    patterns.append((value, parts, max(parts, key=len)))
+        pruned = list()
+        seen = set()
+        for value in values:
+            if value in seen:
+                continue
+            seen.add(value)
+            if patterns and type(value) == str:
+                valueparts = self._wildcardSegments(value)
+                if valueparts is not None and any(
+                        pattern != value and longest in value and self._covers(patternparts, valueparts)
+                        for pattern, patternparts, longest in patterns
+                        ):
+                    continue
+            pruned.append(value)
+        return pruned
+
+    def _optimizeItem(self, item):
+        """Optimize field/value pair. Returns item and key."""
+        if type(item) == tuple and len(item) == 2 and type(item[1]) == list and self._valueType(item[1]) is not None:
+            # (F, [A, A*, ...])             =>  (F, [A*, ...])
+            values = self._pruneValues(item[1])
+            if len(values) < len(item[1]):
+                item = (item[0], values)
+        return item, self._itemKey(item)
+
+    def _coalesceItems(self, items):
+        """
+        Merge field/value pairs of an OR node that refer to the same field into one pair with a list of
+        values. Returns new list of items or None if nothing was merged.
+        """
+        counts = dict()         # (field, value type) -> number of pairs
+        for item, key in items:
+            if type(item) == tuple and len(item) == 2:
+                group = (item[0], self._valueType(item[1]))
+                if group[1] is not None:
+                    counts[group] = counts.get(group, 0) + 1
+        if not any(count > 1 for count in counts.values()):
+            return None
+
+        merged = dict()         # (field, value type) -> list of values, merged pair is placed at first occurrence
+        coalesced = []
+        for item, key in items:
+            group = (item[0], self._valueType(item[1])) if type(item) == tuple and len(item) == 2 else None
+            if counts.get(group, 0) > 1:
+                if group not in merged:
+                    merged[group] = list()
+                    coalesced.append((None, group))
+                if type(item[1]) == list:
+                    merged[group].extend(item[1])
+                else:
+                    merged[group].append(item[1])
+            else:
+                coalesced.append((item, key))
+
+        for i, (item, group) in enumerate(coalesced):
+            if item is None:
+                values = self._pruneValues(merged[group])
+                coalesced[i] = self._optimizeItem((group[0], values if len(values) > 1 else values[0]))
+        return coalesced
+
+    def _factorItems(self, items):
+        """
+        Factor the operand that is contained in most AND nodes within the items of an OR node out of
+        these AND nodes, if it is contained in at least two of them. Returns new list of items or None if
+        there is no such operand.
+        """
+        counts = dict()
+        for item, key in items:
+            if type(item) == ConditionAND:
+                for operand, operandkey in self.junctionItems[item]:
+                    counts[operandkey] = counts.get(operandkey, 0) + 1
+        if not any(count > 1 for count in counts.values()):
+            return None
+
+        common = None
+        for item, key in items:
+            if type(item) == ConditionAND:
+                for operand, operandkey in self.junctionItems[item]:
+                    if common is None or counts[operandkey] > counts[common[1]]:
+                        common = (operand, operandkey)
+
+        alternatives = []
+        factored = []
+        for item, key in items:
+            if type(item) == ConditionAND and any(operandkey == common[1] for operand, operandkey in self.junctionItems[item]):
+                rest = [ (operand, operandkey) for operand, operandkey in self.junctionItems[item] if operandkey != common[1] ]
+                if not alternatives:
+                    factored.append(None)       # placeholder for the new AND node
+                alternatives.append(self._optimizeJunction(ConditionAND(), rest))
+            else:
+                factored.append((item, key))
+        alternative = self._optimizeJunction(ConditionOR(), alternatives)
+        factored[factored.index(None)] = self._optimizeJunction(ConditionAND(), [ common, alternative ])
+        return factored
+
+    def _optimizeNOT(self, node, item, key):
+        """Apply rules to NOT node whose item is already optimized. Returns optimized node and key."""
+        # NOT(NOT(X))                   =>  X
+        if type(item) == ConditionNOT:
+            inner = item.items[0]
+            return inner, self.negatedKeys.get(item, inner)
+
+        # NOT(ConditionNULLValue)       =>  ConditionNotNULLValue
+        if type(item) == ConditionNULLValue:
+            newnode = ConditionNotNULLValue(val=item.items[0])
+            return newnode, newnode
+
+        # NOT(ConditionNotNULLValue)    =>  ConditionNULLValue
+        if type(item) == ConditionNotNULLValue:
+            newnode = ConditionNULLValue(val=item.items[0])
+            return newnode, newnode
+
+        node.items = [ item ]
+        self.negatedKeys[node] = key
+        return node, self._canonical(node, (key,))
+
+    def _optimize(self, tree):
+        """
+        Optimize the AST rooted at *tree* bottom-up in one pass. Subexpression nodes around AND/OR nodes are
+        removed, subexpressions below NOT nodes are kept as they are. The tree is traversed iteratively with
+        an explicit stack, because parsed conditions with many operands are deeply nested.
+        """
+        results = []                        # (node, key) pairs of optimized nodes
+        stack = [ (tree, False) ]
+        while stack:
+            node, visited = stack.pop()
+            while type(node) == NodeSubexpression:
+                node = node.items
+            nodetype = type(node)
+            if nodetype in (ConditionAND, ConditionOR, ConditionNOT):
+                if nodetype == ConditionNOT and type(node.items[0]) == NodeSubexpression:
+                    results.append((node, node))
+                elif not visited:
+                    stack.append((node, True))
+                    stack.extend((item, False) for item in reversed(node.items))
+                elif nodetype == ConditionNOT:
+                    item, key = results.pop()
+                    results.append(self._optimizeNOT(node, item, key))
+                else:
+                    count = len(node.items)
+                    items = results[len(results) - count:]
+                    del results[len(results) - count:]
+                    results.append(self._optimizeJunction(node, items))
+            else:
+                results.append(self._optimizeItem(node))
+        return results[0][0]
 
-        itemresults = [self._optimizeNode(item, changes) for item in node.items]
-        node.items = [res[0] for res in itemresults]
-        if any(res[1] for res in itemresults):
-            changes = True
-        return node, changes
+    def _unstripSubexpressionNode(self, tree):
+        """
+        Adds brackets around AND and OR operations in the AST.
+        """
+        if type(tree) not in (ConditionAND, ConditionOR):
+            return tree
+        stack = [ tree ]
+        while stack:
+            node = stack.pop()
+            items = list(node.items)
+            for i, item in enumerate(items):
+                if type(item) in (ConditionAND, ConditionOR):
+                    items[i] = NodeSubexpression(item)
+                    stack.append(item)
+            node.items = items
+        return NodeSubexpression(tree)
 
     def optimizeTree(self, tree):
         """
@@ -453,21 +680,39 @@ class SigmaConditionOptimizer:
         -   OR(X, X, ...), AND(X, X, ...) =>  OR(X, ...), AND(X, ...)
         -   OR(X, OR(Y))                  =>  OR(X, Y)
         -   OR(AND(X, ...), AND(X, ...))  =>  AND(X, OR(AND(...), AND(...)))
+        -   OR(AND(X, A), AND(X, B), C)   =>  OR(AND(X, OR(A, B)), C)
+        -   OR((F, A), (F, B), ...)       =>  (F, [A, B, ...])
+        -   (F, [*foo*, *foo.exe*, ...])  =>  (F, [*foo*, ...])
         -   NOT(NOT(X))                   =>  X
         -   NOT(ConditionNULLValue)       =>  ConditionNotNULLValue
         -   NOT(ConditionNotNULLValue)    =>  ConditionNULLValue
 
+        Field/value pairs are only merged if the backend supports value lists
+        for all fields (coalesce_value_lists), and only merged and pruned if
+        the values are plain strings or numbers of the same type.  Backends that
+        handle values with and without wildcards differently
+        (coalesce_mixed_wildcards) only get lists of values that either all
+        contain wildcards or none.  Values are removed from a list of alternatives if
+        they are covered by a broader wildcard pattern for the same field.
+        Factoring takes out the operand that is contained in most AND()s within
+        an OR() and reduces the number of terms by one less than that count.
+
         Boolean logic simplification is NP-hard.  To avoid backtracking,
         speculative transformations that may or may not lead to a more optimal
         expression were not implemented.  These include for example factoring
-        out common operands that are not in all, but only some AND()s within an
-        OR(), or vice versa.  Nevertheless, it is safe to assume that this
-        implementation performs poorly on very large expressions.
+        out common operands of OR()s within an AND().
+
+        The tree is optimized bottom-up in one pass.  The rules are applied to
+        a node after its items were optimized until none of them matches, the
+        items of merged nodes are already optimized.  Duplicates are detected
+        by structure: all optimized subtrees with the same structure are
+        represented by one canonical node.
         """
-        tree = self._stripSubexpressionNode(tree)
-        changes = True
-        while changes:
-            tree, changes = self._optimizeNode(tree)
+        self.structures = dict()        # (node type, item keys) -> canonical node
+        self.junctionItems = dict()     # optimized AND/OR node -> list of (item, key) pairs
+        self.negatedKeys = dict()       # optimized NOT node -> key of negated item
+        tree = self._optimize(tree)
+        del self.structures, self.junctionItems, self.negatedKeys
         tree = self._unstripSubexpressionNode(tree)
         return tree
 
@@ -482,95 +727,139 @@ class SigmaConditionParser:
             (SigmaConditionToken.TOKEN_AND, 2, ConditionAND),
             (SigmaConditionToken.TOKEN_OR,  2, ConditionOR),
             ]
+    binaryPrecedence = {    # precedence of binary operators for precedence climbing, higher values bind stronger
+            SigmaConditionToken.TOKEN_AND: 2,
+            SigmaConditionToken.TOKEN_OR:  1,
+            }
+    binaryNodes = {
+            SigmaConditionToken.TOKEN_AND: ConditionAND,
+            SigmaConditionToken.TOKEN_OR:  ConditionOR,
+            }
 
     def __init__(self, sigmaParser, tokens):
         self.sigmaParser = sigmaParser
         self.config = sigmaParser.config
-        self._optimizer = SigmaConditionOptimizer()
+        self._optimizer = SigmaConditionOptimizer(self.config.get_coalesce_value_lists(), self.config.get_coalesce_mixed_wildcards())
 
+        start = profiling.start()
         if SigmaConditionToken.TOKEN_PIPE in tokens:    # Condition contains atr least one aggregation expression
             pipepos = tokens.index(SigmaConditionToken.TOKEN_PIPE)
             self.parsedSearch = self.parseSearch(tokens[:pipepos])
+            profiling.stop("parse_search", start)
             self.parsedAgg = SigmaAggregationParser(tokens[pipepos + 1:], self.sigmaParser, self.config)
         else:
             self.parsedSearch = self.parseSearch(tokens)
+            profiling.stop("parse_search", start)
             self.parsedAgg = None
 
     def parseSearch(self, tokens, depth=0):
         """
-        Iterative parsing of search expression.
+        Parsing of search expression by precedence climbing in one pass over the tokens.
+
+        The structure of the expression is recognized first. Afterwards, search identifiers are converted
+        into parse tree nodes in the same order as by reduction of the token list in precedence order
+        before: parenthesized subexpressions from left to right, then 'all of', '1 of' and identifiers. The
+        conversion order is kept because resolution of field mappings can depend on it.
         """
-        def find_close_token_index_in_pairs(tokens, start_index, open_token, close_token):
-            """
-                the function try to find close_token index for open_token in pairs
-                e.g
-                    open_token was '(' and
-                    tokens were ['(', '...', '(', '...', ')', ')']
-                    the first '(' should pair with the last ')' instead of the first ')'
-
-                Parameters:
-                    tokens: the list of tokens
-                    start_index: the start index (included) of the input tokens for finding the close_token
-                    open_token: the token that considered as opening token
-                    close_token: the token that considered as closing token
-                Returns:
-                    the index of the close_token in pair with the open_token
-                    raise ValueError when there is no close_token in pairs
-            """
-            open_token_count = 0
-            for i in range(start_index, len(tokens)):
-                if tokens[i] == open_token:
-                    open_token_count += 1
-                elif tokens[i] == close_token:
-                    if open_token_count == 0:
-                        return i
+        tokens = list(tokens)
+        pos, tree = self._parseExpression(tokens, 0)
+        if pos < len(tokens):
+            token = tokens[pos]
+            if token.type == SigmaConditionToken.TOKEN_RPAR:
+                raise SigmaParseError("Closing parentheses at position " + str(token.pos) + " without opening parentheses")
+            raise SigmaParseError("Unexpected token '%s' at position %s" % (token.matched, str(token.pos)))
+        return self._buildSearch(tree, depth)
+
+    def _parseExpression(self, tokens, pos, min_precedence=1):
+        """Parse binary operators with at least given precedence. Returns position after parsed expression and structure."""
+        pos, left = self._parseOperand(tokens, pos)
+        while pos < len(tokens):
+            operator = tokens[pos]
+            precedence = self.binaryPrecedence.get(operator.type)
+            if precedence is None or precedence < min_precedence:
+                break
+            pos, right = self._parseExpression(tokens, pos + 1, precedence + 1)    # left associative
+            left = [ "binary", operator, left, right ]
+        return pos, left
+
+    def _parseOperand(self, tokens, pos):
+        """Parse negation, parenthesized subexpression or search identifier."""
+        if pos >= len(tokens):
+            if pos > 0:
+                raise SigmaParseError("Missing operand after '%s' at position %s" % (tokens[pos - 1].matched, str(tokens[pos - 1].pos)))
+            raise SigmaParseError("Empty search expression")
+        token = tokens[pos]
+        tokentype = token.type
+        if tokentype == SigmaConditionToken.TOKEN_NOT:
+            if pos + 1 < len(tokens) and tokens[pos + 1].type == SigmaConditionToken.TOKEN_NOT:
+                raise SigmaParseError("Double negation at position " + str(token.pos))
+            pos, operand = self._parseOperand(tokens, pos + 1)
+            return pos, [ "not", token, operand ]
+        elif tokentype == SigmaConditionToken.TOKEN_LPAR:
+            if pos + 1 < len(tokens) and tokens[pos + 1].type == SigmaConditionToken.TOKEN_RPAR:
+                raise SigmaParseError("Empty subexpression at " + str(token.pos))
+            if pos + 1 >= len(tokens):
+                raise SigmaParseError("Missing matching closing parentheses")
+            pos, subexpression = self._parseExpression(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos].type != SigmaConditionToken.TOKEN_RPAR:
+                raise SigmaParseError("Missing matching closing parentheses")
+            return pos + 1, [ "group", token, subexpression, None ]
+        elif tokentype in (SigmaConditionToken.TOKEN_ALL, SigmaConditionToken.TOKEN_ONE):
+            if pos + 1 >= len(tokens) or tokens[pos + 1].type != SigmaConditionToken.TOKEN_ID:
+                raise SigmaParseError("Expected search identifier after '%s' at position %s" % (token.matched, str(token.pos)))
+            return pos + 2, [ "leaf", token, tokens[pos + 1], None ]
+        elif tokentype == SigmaConditionToken.TOKEN_ID:
+            return pos + 1, [ "leaf", token, None, None ]
+        else:
+            raise SigmaParseError("Unexpected token '%s' at position %s" % (token.matched, str(token.pos)))
+
+    def _leftSpine(self, structure):
+        """
+        Return innermost left operand and the binary operations of a left-associative chain from inner to
+        outer. Long chains like 'sel1 or sel2 or ...' are nested deeply on their left side and are walked
+        iteratively.
+        """
+        spine = list()
+        while structure[0] == "binary":
+            spine.append(structure)
+            structure = structure[2]
+        spine.reverse()
+        return structure, spine
+
+    def _collectOperands(self, structure, groups, leaves):
+        """Collect subexpressions and search identifiers of expression without descending into subexpressions."""
+        kind = structure[0]
+        if kind == "binary":
+            left, spine = self._leftSpine(structure)
+            self._collectOperands(left, groups, leaves)
+            for binary in spine:
+                self._collectOperands(binary[3], groups, leaves)
+        elif kind == "not":
+            self._collectOperands(structure[2], groups, leaves)
+        elif kind == "group":
+            groups.append(structure)
+        else:
+            leaves.append(structure)
+
+    def _buildSearch(self, structure, depth):
+        """Convert structure of (sub)expression into optimized parse tree."""
+        groups = list()
+        leaves = list()
+        self._collectOperands(structure, groups, leaves)
+        for group in groups:
+            group[3] = NodeSubexpression(self._buildSearch(group[2], depth + 1))
+        for tokentype, operands, converter in self.searchOperators:
+            if tokentype in self.binaryPrecedence or tokentype == SigmaConditionToken.TOKEN_NOT:
+                continue
+            for leaf in leaves:
+                if leaf[1].type == tokentype:
+                    if operands == 0:
+                        leaf[3] = converter(self.sigmaParser, leaf[1])
                     else:
-                        open_token_count -= 1
-            raise ValueError(f"matched close_token {close_token} is not found in tokens")
-        # 1. Identify subexpressions with parentheses around them and parse them like a separate search expression
-        while SigmaConditionToken.TOKEN_LPAR in tokens:
-            lPos = tokens.index(SigmaConditionToken.TOKEN_LPAR)
-            lTok = tokens[lPos]
-            try:
-                rPos = find_close_token_index_in_pairs(tokens, lPos+1, SigmaConditionToken.TOKEN_LPAR, SigmaConditionToken.TOKEN_RPAR)
-                rTok = tokens[rPos]
-            except ValueError as e:
-                raise SigmaParseError("Missing matching closing parentheses") from e
-            if lPos + 1 == rPos:
-                raise SigmaParseError("Empty subexpression at " + str(lTok.pos))
-            if lPos > rPos:
-                raise SigmaParseError("Closing parentheses at position " + str(rTok.pos) + " precedes opening at position " + str(lTok.pos))
-
-            subparsed = self.parseSearch(tokens[lPos + 1:rPos], depth=depth+1)
-            tokens = tokens[:lPos] + NodeSubexpression(subparsed) + tokens[rPos + 1:]   # replace parentheses + expression with group node that contains parsed subexpression
-
-        # 2. Iterate over all known operators in given precedence
-        for operator in self.searchOperators:
-            # 3. reduce all occurrences into corresponding parse tree nodes
-            while operator[0] in tokens:
-                pos_op = tokens.index(operator[0])
-                tok_op = tokens[pos_op]
-                if operator[1] == 0:    # operator
-                    treenode = operator[2](self.sigmaParser, tok_op)
-                    tokens = tokens[:pos_op] + treenode + tokens[pos_op + 1:]
-                elif operator[1] == 1:    # operator value
-                    pos_val = pos_op + 1
-                    tok_val = tokens[pos_val]
-                    treenode = operator[2](self.sigmaParser, tok_op, tok_val)
-                    tokens = tokens[:pos_op] + treenode + tokens[pos_val + 1:]
-                elif operator[1] == 2:    # value1 operator value2
-                    pos_val1 = pos_op - 1
-                    pos_val2 = pos_op + 1
-                    tok_val1 = tokens[pos_val1]
-                    tok_val2 = tokens[pos_val2]
-                    treenode = operator[2](self.sigmaParser, tok_op, tok_val1, tok_val2)
-                    tokens = tokens[:pos_val1] + treenode + tokens[pos_val2 + 1:]
-
-        if len(tokens) != 1:     # parse tree must begin with exactly one node
-            raise ValueError("Parse tree must have exactly one start node!")
-        query_cond = tokens[0]
-
-        # 4. Integrate conditions from logsources in configurations to outermost expression
+                        leaf[3] = converter(self.sigmaParser, leaf[1], leaf[2])
+        query_cond = self._buildNode(structure)
+
+        # Integrate conditions from logsources in configurations to outermost expression
         if depth == 0:
             ls_cond = self.sigmaParser.get_logsource_condition()
             if ls_cond is not None:
@@ -579,7 +868,24 @@ class SigmaConditionParser:
                 cond.add(query_cond)
                 query_cond = cond
 
-        return self._optimizer.optimizeTree(query_cond)
+        start = profiling.start()
+        optimized = self._optimizer.optimizeTree(query_cond)
+        profiling.stop("optimize_tree", start)
+        return optimized
+
+    def _buildNode(self, structure):
+        """Build parse tree node from structure with converted operands."""
+        kind = structure[0]
+        if kind == "binary":
+            left, spine = self._leftSpine(structure)
+            node = self._buildNode(left)
+            for binary in spine:
+                node = self.binaryNodes[binary[1].type](self.sigmaParser, binary[1], node, self._buildNode(binary[3]))
+            return node
+        elif kind == "not":
+            return ConditionNOT(self.sigmaParser, structure[1], self._buildNode(structure[2]))
+        else:
+            return structure[3]
 
     def __str__(self):  # pragma: no cover
         return str(self.parsedSearch)
@@ -15,18 +15,29 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import sys
+from sigma import profiling
 from .exceptions import SigmaParseError
-from .condition import SigmaConditionTokenizer, SigmaConditionParser, ConditionAND, ConditionOR, ConditionNULLValue, SigmaSearchValueAsIs
+from .condition import SigmaConditionToken, SigmaConditionTokenizer, SigmaConditionParser, ConditionBase, ConditionAND, ConditionOR, ConditionNULLValue, NodeSubexpression, SigmaSearchValueAsIs, copyTree
 from .modifiers import apply_modifiers
+from sigma.config.mapping import is_rule_dependent
 
 class SigmaParser:
     """Parse a Sigma rule (definitions, conditions and aggregations)"""
+    definitionpatterns = dict()     # wildcard expression of x of condition -> compiled regular expression matching definition names
+    definitionpatterns_size = 1024
+
     def __init__(self, sigma, config):
         self.definitions = dict()
+        self.definitioncache = dict()       # (definition name, condition class) -> parse tree of definition referenced multiple times
+        self.multireferenced = set()        # names of definitions referenced multiple times in conditions
         self.values = dict()
         self.config = config
         self.parsedyaml = sigma
+        self.intern_yaml(sigma)
+        start = profiling.start()
         self.parse_sigma()
+        profiling.stop("parse_sigma", start)
 
     def parse_sigma(self):
         try:    # definition uniqueness check
@@ -38,6 +49,7 @@ class SigmaParser:
             raise SigmaParseError("No detection definitions found")
 
         try:    # tokenization
+            start = profiling.start()
             conditions = self.parsedyaml["detection"]["condition"]
             self.condtoken = list()     # list of tokenized conditions
             if type(conditions) == str:
@@ -47,18 +59,58 @@ class SigmaParser:
                     self.condtoken.append(SigmaConditionTokenizer(condition))
         except KeyError:
             raise SigmaParseError("No condition found")
+        finally:
+            profiling.stop("tokenization", start)
+
+        references = set()
+        for tokens in self.condtoken:
+            for token in tokens:
+                if token.type == SigmaConditionToken.TOKEN_ID:
+                    for name in self.match_definitions(token.matched):
+                        if name in references:
+                            self.multireferenced.add(name)
+                        references.add(name)
 
         self.condparsed = list()        # list of parsed conditions
         for tokens in self.condtoken:
             condparsed = SigmaConditionParser(self, tokens)
             self.condparsed.append(condparsed)
+        self.definitioncache.clear()        # parse trees of definitions are not kept after conditions are parsed
+
+    def match_definitions(self, expression):
+        """Return names of definitions matched by definition name, wildcard expression or 'them' of a condition"""
+        if expression == "them":
+            return [ name for name in self.definitions.keys() if name != "timeframe" ]
+        elif expression.find("*") > 0:
+            try:
+                pattern = self.definitionpatterns[expression]
+            except KeyError:
+                pattern = re.compile("^" + expression.replace("*", ".*") + "$")
+                if len(self.definitionpatterns) >= self.definitionpatterns_size:
+                    self.definitionpatterns.clear()
+                self.definitionpatterns[expression] = pattern
+            return [ name for name in self.definitions.keys() if name != "timeframe" and pattern.match(name) ]
+        else:
+            return [ expression ]
 
     def parse_definition_byname(self, definitionName, condOverride=None):
+        """
+        Return parse tree of definition. Definitions that are referenced multiple times in the conditions
+        are parsed once per condition class, each reference gets its own copy of the parse tree, as it is
+        changed by the optimizer.
+        """
         try:
-            definition = self.definitions[definitionName]
-        except KeyError as e:
-            raise SigmaParseError("Unknown definition '%s'" % definitionName) from e
-        return self.parse_definition(definition, condOverride)
+            parsed = self.definitioncache[(definitionName, condOverride)]
+        except KeyError:
+            try:
+                definition = self.definitions[definitionName]
+            except KeyError as e:
+                raise SigmaParseError("Unknown definition '%s'" % definitionName) from e
+            parsed = self.parse_definition(definition, condOverride)
+            if definitionName not in self.multireferenced:
+                return parsed
+            self.definitioncache[(definitionName, condOverride)] = parsed
+        return copyTree(parsed)
 
     def parse_definition(self, definition, condOverride=None):
         if type(definition) not in (dict, list):
@@ -73,7 +125,7 @@ class SigmaParser:
             subcond = None
             for value in definition:
                 if type(value) in (str, int):
-                    cond.add(value)
+                    cond.add(self.intern(value))
                 elif type(value) in (dict, list):
                     cond.add(self.parse_definition(value))
                 else:
@@ -88,14 +140,61 @@ class SigmaParser:
                     fieldname = key
                 mapping = self.config.get_fieldmapping(fieldname)
                 if isinstance(value, (ConditionAND, ConditionOR)):    # value is condition node (by transformation modifier)
-                    value.items = [ mapping.resolve(key, item, self) for item in value.items ]
+                    value.items = [ self.intern_item(mapping.resolve(key, item, self)) for item in value.items ]
                     cond.add(value)
                 else:           # plain value or something unexpected (caught by backends)
                     mapped = mapping.resolve(key, value, self)
-                    cond.add(mapped)
+                    cond.add(self.intern_item(mapped))
 
         return cond
 
+    def intern(self, value):
+        """
+        Return shared instance of string value, other values are returned unchanged. Equal field names and
+        values of all parsed rules share one instance while they are in use.
+        """
+        if type(value) is str:
+            return sys.intern(value)
+        else:
+            return value
+
+    def intern_yaml(self, document):
+        """Intern all keys and string values of a loaded YAML document in place"""
+        stack = [ document ]
+        while stack:
+            node = stack.pop()
+            if type(node) is dict:
+                items = list(node.items())
+                node.clear()
+                for key, value in items:
+                    if type(value) in (dict, list):
+                        stack.append(value)
+                    node[self.intern(key)] = self.intern(value)
+            elif type(node) is list:
+                for i, value in enumerate(node):
+                    if type(value) in (dict, list):
+                        stack.append(value)
+                    else:
+                        node[i] = self.intern(value)
+
+    def intern_item(self, item):
+        """Intern field names and values of a mapped (field, value) item or of the items of a condition node"""
+        if type(item) is tuple and len(item) == 2:
+            fieldname, value = item
+            if type(value) is list:
+                value = [ self.intern(v) for v in value ]
+            else:
+                value = self.intern(value)
+            return (self.intern(fieldname), value)
+        elif isinstance(item, NodeSubexpression):
+            item.items = self.intern_item(item.items)
+            return item
+        elif isinstance(item, ConditionBase):
+            item.items = type(item.items)(self.intern_item(subitem) for subitem in item.items)
+            return item
+        else:
+            return self.intern(item)
+
     def extract_values(self, definition):
         """Extract all values from map key:value pairs info self.values"""
         if type(definition) == list:     # iterate through items of list
@@ -107,10 +206,11 @@ class SigmaParser:
 
     def add_value(self, key, value):
         """Add value to values table, create key if it doesn't exist"""
+        value = self.intern(str(value))
         if key in self.values:
-            self.values[key].add(str(value))
+            self.values[key].add(value)
         else:
-            self.values[key] = { str(value) }
+            self.values[self.intern(key)] = { value }
 
     def get_logsource(self):
         """Returns logsource configuration object for current rule"""
@@ -146,9 +246,15 @@ class SigmaParser:
         return cond
 
     def get_logsource_condition(self):
+        """
+        Return condition from log source configuration. The condition of a merged log source is generated once
+        and a copy is returned for each rule, if it doesn't contain field mappings that depend on the rule.
+        """
         logsource = self.get_logsource()
         if logsource is None:
             return None
+        elif logsource.condition is not None:
+            return copyTree(logsource.condition)
         else:
             cond = ConditionAND()
             if self.config.get_logsourcemerging() == 'or':
@@ -173,4 +279,15 @@ class SigmaParser:
                 for item in logsource.search:
                     cond.add(SigmaSearchValueAsIs(item))
 
+            if not any(is_rule_dependent(self.config.get_fieldmapping(field)) for field in condition_fields(logsource.conditions)):
+                logsource.condition = cond
+                return copyTree(cond)
             return cond
+
+def condition_fields(conditions):
+    """Field names of (nested) list of (field, value) tuples of log source conditions"""
+    for item in conditions:
+        if type(item) is list:
+            yield from condition_fields(item)
+        else:
+            yield item[0]
@@ -0,0 +1,92 @@
+# Per-rule timing of conversion phases
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+
+# Conversion phases in processing order. Phases are measured including the phases called by them:
+# parse_sigma contains tokenization, parse_search and optimize_tree, parse_search contains optimize_tree.
+PHASES = (
+        "yaml_load",        # loading of YAML documents from Sigma file
+        "rule_filter",      # matching of rule filter
+        "parse_sigma",      # SigmaParser.parse_sigma
+        "tokenization",     # tokenization of conditions
+        "parse_search",     # SigmaConditionParser.parseSearch
+        "optimize_tree",    # SigmaConditionOptimizer.optimizeTree
+        "generate",         # backend.generate
+        )
+
+class SigmaProfiler:
+    """
+    Collects wall time spent in conversion phases per rule. The rule that is currently processed is
+    set by the code that drives the conversion, timings of all phases are accounted to this rule.
+    """
+    def __init__(self):
+        self.rule = None
+        self.times = { phase: dict() for phase in PHASES }     # phase -> rule -> seconds
+        self.started = time.perf_counter()
+
+    def add(self, phase, start):
+        times = self.times[phase]
+        times[self.rule] = times.get(self.rule, 0.0) + time.perf_counter() - start
+
+    def results(self, slowest=10):
+        """Return profiling results as dict with totals and slowest rules per phase and the times of each rule."""
+        phases = dict()
+        rules = dict()
+        for phase, times in self.times.items():
+            phases[phase] = {
+                    "total": sum(times.values()),
+                    "rules": len(times),
+                    "slowest": [
+                        { "rule": rule, "time": t }
+                        for rule, t in sorted(times.items(), key=lambda item: item[1], reverse=True)[:slowest]
+                        ],
+                    }
+            for rule, t in times.items():
+                rules.setdefault(rule, dict())[phase] = t
+        return {
+                "total": time.perf_counter() - self.started,
+                "phases": phases,
+                "rules": rules,
+                }
+
+    def write(self, path, slowest=10):
+        with open(path, "w") as f:
+            json.dump(self.results(slowest), f, indent=2)
+
+profiler = None     # active profiler or None if profiling is disabled
+
+def enable():
+    """Enable profiling and return the profiler"""
+    global profiler
+    profiler = SigmaProfiler()
+    return profiler
+
+def set_rule(rule):
+    """Set rule to which following timings are accounted"""
+    if profiler is not None:
+        profiler.rule = rule
+
+def start():
+    """Return start time of phase or None if profiling is disabled"""
+    if profiler is not None:
+        return time.perf_counter()
+
+def stop(phase, start):
+    """Account time since start to phase of current rule"""
+    if start is not None and profiler is not None:
+        profiler.add(phase, start)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Match Sigma rules against events from JSON lines files
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import argparse
+import json
+import time
+import yaml
+from pathlib import Path
+from sigma.configuration import SigmaConfigurationChain
+from sigma.config.collection import SigmaConfigurationManager
+from sigma.config.exceptions import SigmaConfigParseError, SigmaRuleFilterParseException
+from sigma.filter import SigmaRuleFilter
+from sigma.matcher import SigmaRuleSet
+from sigma.correlation import SigmaCorrelationEngine
+from sigma.parser.exceptions import SigmaCollectionParseError, SigmaParseError
+from sigma.backends.exceptions import BackendError
+
+ERR_OPEN_FILE           = 5
+ERR_CONFIG              = 6
+ERR_INVALID_EVENT       = 7
+ERR_RULE_FILTER_PARSING = 11
+ERR_MISSING_DEPENDENCY  = 12
+
+rule_errors = (OSError, yaml.YAMLError, SigmaParseError, SigmaCollectionParseError, BackendError, NotImplementedError, TypeError)
+
+def set_argparser():
+    argparser = argparse.ArgumentParser(description="Match Sigma rules against events from JSON lines files (one JSON object per line) and output matches as JSON lines.")
+    argparser.add_argument("--config", "-c", action="append", help="Configuration with field name mapping and log source conditions, given as name or path. Multiple configurations are merged into one.")
+    argparser.add_argument("--filter", "-f", help="Only use rules that match the rule filter expression (same syntax as sigmac)")
+    argparser.add_argument("--events", "-e", action="append", help="JSON lines file with events. Can be given multiple times. Events are read from stdin if not given.")
+    argparser.add_argument("--with-event", "-E", action="store_true", help="Add matched event to output")
+    argparser.add_argument("--count", "-C", action="store_true", help="Only output number of matched events per rule")
+    argparser.add_argument("--no-prefilter", action="store_true", help="Evaluate all rules for each event instead of selecting candidate rules by the literals contained in the event")
+    argparser.add_argument("--batch-size", "-b", type=int, help="Evaluate rules vectorized against batches of the given number of events (requires NumPy)")
+    argparser.add_argument("--time-field", "-t", default="@timestamp", help="Field with the time of events for rules with aggregations, given as ISO 8601 timestamp or seconds since epoch (default: %(default)s)")
+    argparser.add_argument("--verbose", "-v", action="store_true", help="Report rules that can't be matched and statistics on stderr")
+    argparser.add_argument("rules", nargs="+", help="Sigma rule files or directories, which are searched recursively for .yml files")
+    return argparser
+
+def get_configuration_chain(config_names):
+    scm = SigmaConfigurationManager()
+    sigmaconfigs = SigmaConfigurationChain()
+    for config_name in config_names or ():
+        try:
+            sigmaconfigs.append(scm.get(config_name))
+        except OSError as e:
+            print("Failed to open Sigma configuration file %s: %s" % (config_name, str(e)), file=sys.stderr)
+            sys.exit(ERR_OPEN_FILE)
+        except (yaml.YAMLError, SigmaConfigParseError) as e:
+            print("Sigma configuration file %s is invalid: %s" % (config_name, str(e)), file=sys.stderr)
+            sys.exit(ERR_CONFIG)
+    return sigmaconfigs
+
+def get_rule_files(paths):
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(path.glob("**/*.yml"))
+        else:
+            yield path
+
+def main():
+    cmdargs = set_argparser().parse_args()
+
+    rulefilter = None
+    if cmdargs.filter:
+        try:
+            rulefilter = SigmaRuleFilter(cmdargs.filter)
+        except SigmaRuleFilterParseException as e:
+            print("Parse error in Sigma rule filter expression: %s" % str(e), file=sys.stderr)
+            sys.exit(ERR_RULE_FILTER_PARSING)
+
+    config = get_configuration_chain(cmdargs.config)
+    correlation = SigmaCorrelationEngine(config, rulefilter, cmdargs.time_field)
+    if cmdargs.batch_size:
+        try:
+            from sigma.batchmatcher import SigmaBatchRuleSet
+        except ImportError as e:
+            print("Batch evaluation requires NumPy: %s" % str(e), file=sys.stderr)
+            sys.exit(ERR_MISSING_DEPENDENCY)
+        ruleset = SigmaBatchRuleSet(config, rulefilter, cmdargs.batch_size, correlation)
+    else:
+        ruleset = SigmaRuleSet(config, rulefilter, not cmdargs.no_prefilter, correlation)
+    skipped = 0
+    for path in get_rule_files(cmdargs.rules):
+        try:
+            ruleset.add_file(path)
+        except rule_errors as e:
+            skipped += 1
+            if cmdargs.verbose:
+                print("Skipping rule %s: %s" % (path, str(e)), file=sys.stderr)
+    if cmdargs.verbose:
+        print("%d rules and %d aggregations loaded, %d rule files skipped" % (len(ruleset.rules), len(correlation.aggregations), skipped), file=sys.stderr)
+
+    rules = ruleset.rules + [ aggregation.rule for aggregation in correlation.aggregations ]
+    counts = { id(rule): 0 for rule in rules }
+
+    def output(rule, filename=None, lineno=None, event=None, alert=None):
+        counts[id(rule)] += 1
+        if not cmdargs.count:
+            match = {
+                    "file": filename,
+                    "line": lineno,
+                    "id": rule.id,
+                    "title": rule.title,
+                    "level": rule.level,
+                    }
+            if alert is not None:
+                match["group"] = alert.group
+                match["value"] = alert.value
+                match["time"] = alert.time
+                event = alert.event
+            if cmdargs.with_event:
+                match["event"] = event
+            print(json.dumps(match, default=str))
+
+    events = 0
+    start = time.perf_counter()
+    for filename in cmdargs.events or [ "-" ]:
+        try:
+            f = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+        except OSError as e:
+            print("Failed to open event file %s: %s" % (filename, str(e)), file=sys.stderr)
+            sys.exit(ERR_OPEN_FILE)
+        try:
+            for lineno, event, matches in ruleset.match_lines(f):
+                events += 1
+                for rule in matches:
+                    output(rule, filename, lineno, event)
+                if correlation.aggregations:
+                    for alert in correlation.process(event):
+                        output(alert.rule, filename, lineno, alert=alert)
+        except ValueError as e:
+            print("Invalid event in %s: %s" % (filename, str(e)), file=sys.stderr)
+            sys.exit(ERR_INVALID_EVENT)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    for alert in correlation.flush():
+        output(alert.rule, alert=alert)
+    seconds = time.perf_counter() - start
+
+    if cmdargs.count:
+        for rule in rules:
+            if counts[id(rule)]:
+                print(json.dumps({ "id": rule.id, "title": rule.title, "level": rule.level, "count": counts[id(rule)] }, default=str))
+    if cmdargs.verbose:
+        print("%d events matched in %.2fs (%.0f events/s)" % (events, seconds, events / seconds if seconds else 0), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -26,17 +26,21 @@ import logging, traceback
 from sigma.parser.collection import SigmaCollectionParser
 from sigma.parser.exceptions import SigmaCollectionParseError, SigmaParseError
 from sigma.configuration import SigmaConfiguration, SigmaConfigurationChain
-from sigma.config.collection import SigmaConfigurationManager
+from sigma.config.collection import SigmaConfigurationManager, default_index_path
 from sigma.config.exceptions import SigmaConfigParseError, SigmaRuleFilterParseException
 from sigma.filter import SigmaRuleFilter
+from sigma.cache import SigmaConversionCache
+from sigma import profiling
 import sigma.backends.discovery as backends
-from sigma.backends.base import BackendOptions
+from sigma.backends.base import BackendOptions, BaseBackend
+from sigma.backends.mixins import MultiRuleOutputMixin
 from sigma.backends.exceptions import BackendError, NotSupportedError, PartialMatchError, FullMatchError
 from sigma.parser.modifiers import modifiers
 import codecs
 import copy
 import time
 import datetime
+import multiprocessing
 
 sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
 
@@ -82,6 +86,53 @@ def get_inputs(paths, recursive):
     else:
         return [pathlib.Path(p) for p in paths]
 
+def supports_parallel(backend_class):
+    """
+    Backends that collect all rules for a combined output in finalize() or track state across rules
+    (e.g. unique rule names) must see all rules in one process and can't be used with worker processes.
+    """
+    return not issubclass(backend_class, MultiRuleOutputMixin) and backend_class.finalize is BaseBackend.finalize
+
+# State of worker processes used for parallel conversion (--jobs), initialized once per worker by init_worker()
+worker_state = dict()
+
+def init_worker(target, configs, backend_option, backend_config, rulefilter):
+    """Build configuration chain, rule filter and backend of a worker process"""
+    scm = SigmaConfigurationManager(index_path=default_index_path())
+    sigmaconfigs = SigmaConfigurationChain()
+    for conf_name in configs or list():
+        sigmaconfigs.append(scm.get(conf_name))
+    backend_class = backends.getBackend(target)
+    worker_state["sigmaconfigs"] = sigmaconfigs
+    worker_state["rulefilter"] = SigmaRuleFilter(rulefilter) if rulefilter else None
+    worker_state["backend"] = backend_class(sigmaconfigs, BackendOptions(backend_option, backend_config))
+
+def convert_worker(sigmafile):
+    """
+    Convert one Sigma file in a worker process. Returns a (results, exception) tuple, exceptions are
+    passed to the main process and raised there.
+    """
+    backend = worker_state["backend"]
+    try:
+        with sigmafile.open(encoding='utf-8') as f:
+            parser = SigmaCollectionParser(f, worker_state["sigmaconfigs"], worker_state["rulefilter"], sigmafile)
+            backend.setYmlFileName(str(sigmafile))
+            return list(parser.generate(backend)), None
+    except Exception as e:
+        return None, e
+
+class ActionConversionTarget(argparse.Action):
+    """Store target and track order of targets and configurations for conversion into multiple targets"""
+    def __call__(self, parser, ns, vals, opt):
+        setattr(ns, self.dest, vals)
+        ns.conversions = (getattr(ns, "conversions", None) or list()) + [ ("target", vals) ]
+
+class ActionConversionConfig(argparse.Action):
+    """Append configuration and track order of targets and configurations for conversion into multiple targets"""
+    def __call__(self, parser, ns, vals, opt):
+        setattr(ns, self.dest, (getattr(ns, self.dest, None) or list()) + [ vals ])
+        ns.conversions = (getattr(ns, "conversions", None) or list()) + [ ("config", vals) ]
+
 class ActionBackendHelp(argparse.Action):
     def __call__(self, parser, ns, vals, opt):
         backend = backends.getBackend(vals)
@@ -111,11 +162,11 @@ def set_argparser():
     inlastday=X rule create or modified in the last X days period
     tlp=valid_tlp if rule have no tlp set to WHITE 
             """)
-    argparser.add_argument("--target", "-t", choices=backends.getBackendDict().keys(), help="Output target format")
+    argparser.add_argument("--target", "-t", action=ActionConversionTarget, choices=backends.getBackendIdentifiers(), help="Output target format. Can be given multiple times to convert rules into multiple targets in one run, each followed by its configurations. This requires --output.")
     argparser.add_argument("--lists", "-l", action="store_true", help="List available output target formats and configurations")
     argparser.add_argument("--lists-files-after-date", "-L",help="List yml files  which is modified/created after the date (Example of the date: 2022/02/01).")
-    argparser.add_argument("--config", "-c", action="append", help="Configurations with field name and index mapping for target environment. Multiple configurations are merged into one. Last config is authoritative in case of conflicts.")
-    argparser.add_argument("--output", "-o", default=None, help="Output file or filename prefix (if end with a '_','/' or '\\')")
+    argparser.add_argument("--config", "-c", action=ActionConversionConfig, help="Configurations with field name and index mapping for target environment. Multiple configurations are merged into one. Last config is authoritative in case of conflicts. With multiple targets, configurations given before the first target apply to all targets.")
+    argparser.add_argument("--output", "-o", default=None, help="Output file or filename prefix (if end with a '_','/' or '\\'). With multiple targets: output file name, where '{target}' is replaced with the target, or prefix that is extended with target and extension.")
     argparser.add_argument("--output-fields", "-of", help="""Enhance your output with additional fields from the Sigma rule (not only the converted rule itself). 
     Select the fields you want by providing their list delimited with commas (no space). Only work with the '--output-format' option and with 'json' or 'yaml' value.
     available additional fields : title, id, status, description, author, references, fields, falsepositives, level, tags.
@@ -126,12 +177,18 @@ def set_argparser():
     argparser.add_argument("--backend-option", "-O", action="append", help="Options and switches that are passed to the backend")
     argparser.add_argument("--backend-config", "-C", help="Configuration file (YAML format) containing options to pass to the backend")
     argparser.add_argument("--backend-help", action=ActionBackendHelp, help="Print backend options")
+    argparser.add_argument("--jobs", "-j", type=int, default=1, help="Convert rules in given number of worker processes. Output order is kept. Ignored for stdin input and for backends that generate one output from all rules.")
+    argparser.add_argument("--cache-dir", help="Directory of persistent cache for conversion results. Unchanged rules are not converted again. Ignored for stdin input and for backends that generate one output from all rules.")
+    argparser.add_argument("--cache-size", type=int, default=256, help="Maximum size of conversion result cache in MB (default: 256). Least recently used results are removed.")
+    argparser.add_argument("--profile", default=None, metavar="FILE", help="Write time spent in each conversion phase per rule with totals and slowest rules as JSON into FILE. Rules are converted sequentially without cache.")
+    argparser.add_argument("--profile-slowest", type=int, default=10, metavar="N", help="Number of slowest rules reported per phase in profile (default: 10)")
     argparser.add_argument("--defer-abort", "-d", action="store_true", help="Don't abort on parse or conversion errors, proceed with next rule. The exit code from the last error is returned")
     argparser.add_argument("--ignore-backend-errors", "-I", action="store_true", help="Only return error codes for parse errors and ignore errors for rules that cause backend errors. Useful, when you want to get as much queries as possible.")
     argparser.add_argument("--shoot-yourself-in-the-foot", action="store_true", help=argparse.SUPPRESS)
     argparser.add_argument("--verbose", "-v", action="store_true", help="Be verbose")
     argparser.add_argument("--debug", "-D", action="store_true", help="Debugging output")
     argparser.add_argument("inputs", nargs="*", help="Sigma input files ('-' for stdin)")
+    argparser.set_defaults(conversions=None)
     
     return argparser
 
@@ -177,16 +234,253 @@ def get_fileName_after_date(inputs, recurse, date):
         if modified > dateTime:
             print("%s, Updated" % sigmafile)
 
+def write_profile(cmdargs):
+    if profiling.profiler is not None:
+        try:
+            profiling.profiler.write(cmdargs.profile, cmdargs.profile_slowest)
+        except (IOError, OSError) as e:
+            print("Failed to write profile '%s': %s" % (cmdargs.profile, str(e)), file=sys.stderr)
+            sys.exit(ERR_OUTPUT)
+
+def get_configuration_chain(scm, target, config_names, cmdargs, isolated=False):
+    """
+    Build configuration chain for target from given configuration names. Returns the chain and the
+    configuration names that were used (default configuration of backend if none were given).
+    Exits sigmac if the configurations can't be used for the target. Configurations are modified by
+    the backend, therefore isolated copies must be used if they are shared between multiple backends.
+    """
+    sigmaconfigs = SigmaConfigurationChain()
+    backend_class = backends.getBackend(target)
+    if not config_names:
+        if backend_class.config_required and not cmdargs.shoot_yourself_in_the_foot:
+            print("The backend you want to use usually requires a configuration to generate valid results. Please provide one with --config/-c.", file=sys.stderr)
+            print("Available choices for this backend (get complete list with --lists/-l):")
+            list_configurations(backend=target, scm=scm)
+            sys.exit(ERR_CONFIG_REQUIRED)
+        if backend_class.default_config is not None:
+            config_names = backend_class.default_config
+
+    if config_names:
+        order = 0
+        for conf_name in config_names:
+            try:
+                sigmaconfig = scm.get(conf_name)
+                if isolated:
+                    sigmaconfig = copy.deepcopy(sigmaconfig)
+                if sigmaconfig.order is not None:
+                    if sigmaconfig.order <= order and not cmdargs.shoot_yourself_in_the_foot:
+                        print("The configurations were provided in the wrong order (order key check in config file)", file=sys.stderr)
+                        sys.exit(ERR_CONFIG_ORDER)
+                    order = sigmaconfig.order
+
+                try:
+                    if target not in sigmaconfig.config["backends"]:
+                        print("The configuration '{}' is not valid for backend '{}'. Valid choices are: {}".format(conf_name, target, ", ".join(sigmaconfig.config["backends"])), file=sys.stderr)
+                        sys.exit(ERR_CONFIG_ORDER)
+                except KeyError:
+                    pass
+
+                sigmaconfigs.append(sigmaconfig)
+            except OSError as e:
+                print("Failed to open Sigma configuration file %s: %s" % (conf_name, str(e)), file=sys.stderr)
+                exit(ERR_OPEN_CONFIG_FILE)
+            except (yaml.parser.ParserError, yaml.scanner.ScannerError) as e:
+                print("Sigma configuration file %s is no valid YAML: %s" % (conf_name, str(e)), file=sys.stderr)
+                exit(ERR_CONFIG_INVALID_YAML)
+            except SigmaConfigParseError as e:
+                print("Sigma configuration parse error in %s: %s" % (conf_name, str(e)), file=sys.stderr)
+                exit(ERR_CONFIG_PARSING)
+
+    return sigmaconfigs, config_names
+
+def get_conversions(order):
+    """
+    Group targets and configurations into (target, configuration names) pairs in the order given on the
+    command line. Configurations given before the first target are used for all targets, all further
+    configurations for the preceding target.
+    """
+    common = list()
+    conversions = list()
+    for kind, value in order or list():
+        if kind == "target":
+            conversions.append((value, list(common)))
+        elif conversions:
+            conversions[-1][1].append(value)
+        else:
+            common.append(value)
+    return conversions
+
+def report_conversion_error(e, sigmafile, cmdargs, error):
+    """
+    Print message for error raised while conversion of a Sigma file. Returns the error code that
+    is finally returned by sigmac or exits if errors are not deferred.
+    """
+    backend_error = True
+    if isinstance(e, OSError):
+        print("Failed to open Sigma file %s: %s" % (sigmafile, str(e)), file=sys.stderr)
+        return ERR_OPEN_SIGMA_RULE
+    elif isinstance(e, (yaml.parser.ParserError, yaml.scanner.ScannerError)):
+        print("Error: Sigma file %s is no valid YAML: %s" % (sigmafile, str(e)), file=sys.stderr)
+        code = ERR_INVALID_YAML
+        backend_error = False
+    elif isinstance(e, (SigmaParseError, SigmaCollectionParseError)):
+        print("Error: Sigma parse error in %s: %s" % (sigmafile, str(e)), file=sys.stderr)
+        code = ERR_SIGMA_PARSING
+        backend_error = False
+    elif isinstance(e, NotSupportedError):
+        print("Error: The Sigma rule requires a feature that is not supported by the target system: " + str(e), file=sys.stderr)
+        code = ERR_NOT_SUPPORTED
+    elif isinstance(e, BackendError):
+        print("Error: Backend error in %s: %s" % (sigmafile, str(e)), file=sys.stderr)
+        code = ERR_BACKEND
+    elif isinstance(e, (NotImplementedError, TypeError)):
+        print("An unsupported feature is required for this Sigma rule (%s): " % (sigmafile) + str(e), file=sys.stderr)
+        code = ERR_NOT_IMPLEMENTED
+    elif isinstance(e, PartialMatchError):
+        print("Error: Partial field match error: %s" % str(e), file=sys.stderr)
+        code = ERR_PARTIAL_FIELD_MATCH
+    elif isinstance(e, FullMatchError):
+        print("Error: Full field match error", file=sys.stderr)
+        code = ERR_FULL_FIELD_MATCH
+    else:
+        raise e
+
+    if backend_error and cmdargs.ignore_backend_errors:
+        return error
+    if not cmdargs.defer_abort:
+        sys.exit(code)
+    return code
+
+# Exceptions raised by conversion of a Sigma file that are reported by report_conversion_error()
+conversion_errors = (OSError, yaml.parser.ParserError, yaml.scanner.ScannerError, SigmaParseError, SigmaCollectionParseError, BackendError, NotImplementedError, TypeError, PartialMatchError, FullMatchError)
+
+def isolated_rule(sigmaparser):
+    """
+    Copy of parsed rule that can be passed to a further backend, as some backends modify the rule YAML
+    or the parse tree while generating queries. The configuration chain is shared.
+    """
+    return copy.deepcopy(sigmaparser, { id(sigmaparser.config): sigmaparser.config })
+
+def convert_multi_target(cmdargs, conversions, scm, rulefilter):
+    """
+    Convert inputs into multiple targets. Each Sigma file is loaded once and parsed once for all targets
+    with the same configurations, the parsed rules are then passed to each of these backends. The output
+    of each target is written into its own file. Exits sigmac after conversion.
+    """
+    if cmdargs.output is None:
+        print("Conversion into multiple targets requires an output file name or prefix (--output/-o). '{target}' is replaced with the target identifier, else it is appended.", file=sys.stderr)
+        sys.exit(ERR_OUTPUT)
+    if cmdargs.output_fields:
+        print("The '--output-fields' or '-of' arguments are not supported for conversion into multiple targets", file=sys.stderr)
+        sys.exit(ERR_OUTPUT_FORMAT)
+
+    filename_ext = cmdargs.output_extention or ".rule"
+    if filename_ext[0] != '.':
+        filename_ext = '.' + filename_ext
+    newline_separator = '\0' if cmdargs.print0 else '\n'
+
+    # Targets with the same configurations, index field and optimizer settings get the same parse result
+    groups = dict()         # (configuration names, index field, value list coalescing) -> (configuration chain used for parsing, [ (target, backend, output file) ])
+    outputs = list()
+    names = set()
+    for target, config_names in conversions:
+        backend_class = backends.getBackend(target)
+        sigmaconfigs, config_names = get_configuration_chain(scm, target, config_names, cmdargs, isolated=True)
+        backend = backend_class(sigmaconfigs, BackendOptions(cmdargs.backend_option, cmdargs.backend_config))
+
+        name = target
+        cnt = 2
+        while name in names:        # same target with different configurations
+            name = "%s-%d" % (target, cnt)
+            cnt += 1
+        names.add(name)
+        if "{target}" in cmdargs.output:
+            filename = cmdargs.output.replace("{target}", name)
+        else:
+            filename = cmdargs.output + name + filename_ext
+        try:
+            out = open(filename, "w", encoding='utf-8')
+        except (IOError, OSError) as e:
+            print("Failed to open output file '%s': %s" % (filename, str(e)), file=sys.stderr)
+            exit(ERR_OUTPUT)
+
+        output = (name, backend, out)
+        outputs.append(output)
+        groups.setdefault((tuple(config_names or ()), backend.index_field, backend.coalesce_value_lists, backend.coalesce_mixed_wildcards), (sigmaconfigs, list()))[1].append(output)
+
+    for name, backend, out in outputs:
+        if isinstance(backend, MultiRuleOutputMixin):
+            backend.setOutputStream(out)
+        result = backend.initialize()
+        if result:
+            print(result, file=out)
+
+    error = 0
+    for sigmafile in get_inputs(cmdargs.inputs, cmdargs.recurse):
+        try:
+            if cmdargs.inputs == ['-']:
+                f = sigmafile
+            else:
+                f = sigmafile.open(encoding='utf-8')
+            profiling.set_rule(str(sigmafile))
+            start = profiling.start()
+            yamldocs = list(yaml.safe_load_all(f))
+            profiling.stop("yaml_load", start)
+            f.close()
+        except conversion_errors as e:
+            error = report_conversion_error(e, sigmafile, cmdargs, error)
+            continue
+
+        for sigmaconfigs, group in groups.values():
+            try:
+                parser = SigmaCollectionParser(copy.deepcopy(yamldocs), sigmaconfigs, rulefilter, sigmafile)
+            except conversion_errors as e:
+                error = report_conversion_error(e, sigmafile, cmdargs, error)
+                continue
+
+            for i, (name, backend, out) in enumerate(group):
+                try:
+                    backend.setYmlFileName(str(sigmafile))
+                    if i < len(group) - 1:
+                        rules = [ isolated_rule(sigmaparser) for sigmaparser in parser.parsers ]
+                    else:
+                        rules = parser.parsers
+                    for sigmaparser, rulename in zip(rules, parser.rulenames):
+                        profiling.set_rule(rulename)
+                        start = profiling.start()
+                        result = backend.generate(sigmaparser)
+                        profiling.stop("generate", start)
+                        if result:
+                            print(result, file=out, end=newline_separator)
+                except conversion_errors as e:
+                    error = report_conversion_error(e, "%s (target %s)" % (sigmafile, name), cmdargs, error)
+
+    for name, backend, out in outputs:
+        result = backend.finalize()
+        if result:
+            print(result, file=out)
+        out.close()
+
+    write_profile(cmdargs)
+    sys.exit(error)
+
 def main():
     argparser = set_argparser()
     cmdargs = argparser.parse_args()
-    scm = SigmaConfigurationManager()
+    scm = SigmaConfigurationManager(index_path=default_index_path())
 
     logger = logging.getLogger(__name__)
     if cmdargs.debug:   # pragma: no cover
         logging.basicConfig(filename='sigmac.log', filemode='w', level=logging.DEBUG)
         logger.setLevel(logging.DEBUG)
 
+    if cmdargs.profile:
+        profiling.enable()
+        if cmdargs.verbose and (cmdargs.jobs > 1 or cmdargs.cache_dir):
+            print("Profiling: rules are converted sequentially without cache", file=sys.stderr)
+        cmdargs.jobs = 1
+        cmdargs.cache_dir = None
+
     if cmdargs.lists:
         print("Backends (Targets):")
         list_backends(cmdargs.debug)
@@ -223,45 +517,12 @@ def main():
             print("Parse error in Sigma rule filter expression: %s" % str(e), file=sys.stderr)
             sys.exit(ERR_RULE_FILTER_PARSING)
 
-    sigmaconfigs = SigmaConfigurationChain()
-    backend_class = backends.getBackend(cmdargs.target)
-    if cmdargs.config is None:
-        if backend_class.config_required and not cmdargs.shoot_yourself_in_the_foot:
-            print("The backend you want to use usually requires a configuration to generate valid results. Please provide one with --config/-c.", file=sys.stderr)
-            print("Available choices for this backend (get complete list with --lists/-l):")
-            list_configurations(backend=cmdargs.target, scm=scm)
-            sys.exit(ERR_CONFIG_REQUIRED)
-        if backend_class.default_config is not None:
-            cmdargs.config = backend_class.default_config
-
-    if cmdargs.config:
-        order = 0
-        for conf_name in cmdargs.config:
-            try:
-                sigmaconfig = scm.get(conf_name)
-                if sigmaconfig.order is not None:
-                    if sigmaconfig.order <= order and not cmdargs.shoot_yourself_in_the_foot:
-                        print("The configurations were provided in the wrong order (order key check in config file)", file=sys.stderr)
-                        sys.exit(ERR_CONFIG_ORDER)
-                    order = sigmaconfig.order
+    conversions = get_conversions(cmdargs.conversions)
+    if len(conversions) > 1:
+        convert_multi_target(cmdargs, conversions, scm, rulefilter)
 
-                try:
-                    if cmdargs.target not in sigmaconfig.config["backends"]:
-                        print("The configuration '{}' is not valid for backend '{}'. Valid choices are: {}".format(conf_name, cmdargs.target, ", ".join(sigmaconfig.config["backends"])), file=sys.stderr)
-                        sys.exit(ERR_CONFIG_ORDER)
-                except KeyError:
-                    pass
-
-                sigmaconfigs.append(sigmaconfig)
-            except OSError as e:
-                print("Failed to open Sigma configuration file %s: %s" % (conf_name, str(e)), file=sys.stderr)
-                exit(ERR_OPEN_CONFIG_FILE)
-            except (yaml.parser.ParserError, yaml.scanner.ScannerError) as e:
-                print("Sigma configuration file %s is no valid YAML: %s" % (conf_name, str(e)), file=sys.stderr)
-                exit(ERR_CONFIG_INVALID_YAML)
-            except SigmaConfigParseError as e:
-                print("Sigma configuration parse error in %s: %s" % (conf_name, str(e)), file=sys.stderr)
-                exit(ERR_CONFIG_PARSING)
+    backend_class = backends.getBackend(cmdargs.target)
+    sigmaconfigs, cmdargs.config = get_configuration_chain(scm, cmdargs.target, cmdargs.config, cmdargs)
 
     if cmdargs.output_fields:
         if cmdargs.output_format: 
@@ -303,26 +564,75 @@ def main():
 
     error = 0
     output_array = []
+    if isinstance(backend, MultiRuleOutputMixin) and fileprefix is None:     # output of all rules is written while it is generated
+        backend.setOutputStream(out)
     result = backend.initialize()
     if result:
         print(result, file=out)
 
-    for sigmafile in get_inputs(cmdargs.inputs, cmdargs.recurse):
+    inputs = get_inputs(cmdargs.inputs, cmdargs.recurse)
+    cache = None
+    if cmdargs.cache_dir and cmdargs.inputs != ['-']:
+        if supports_parallel(backend_class):
+            try:
+                cache = SigmaConversionCache(cmdargs.cache_dir, cmdargs.cache_size * 1024 * 1024, sigmaconfigs, cmdargs.target, backend_options, cmdargs.filter)
+            except OSError as e:
+                print("Failed to open cache directory '%s': %s" % (cmdargs.cache_dir, str(e)), file=sys.stderr)
+                exit(ERR_OUTPUT)
+        elif cmdargs.verbose:
+            print("Backend '%s' generates one output from all rules, conversion results are not cached" % (cmdargs.target), file=sys.stderr)
+
+    if cache is not None:
+        cache_keys = [ cache.key(sigmafile) for sigmafile in inputs ]
+        cached = [ cache.get(cache_key) for cache_key in cache_keys ]
+    else:
+        cache_keys = [ None ] * len(inputs)
+        cached = [ None ] * len(inputs)
+
+    pool = None
+    converted = None
+    if cmdargs.jobs > 1 and cmdargs.inputs != ['-']:
+        if supports_parallel(backend_class):
+            pending = [ sigmafile for sigmafile, cached_results in zip(inputs, cached) if cached_results is None ]
+            logger.debug("* Converting with %d worker processes" % (cmdargs.jobs))
+            pool = multiprocessing.Pool(cmdargs.jobs, init_worker, (cmdargs.target, cmdargs.config, cmdargs.backend_option, cmdargs.backend_config, cmdargs.filter))
+            converted = pool.imap(convert_worker, pending, max(1, len(pending) // (cmdargs.jobs * 4)))  # results are delivered in input order
+        elif cmdargs.verbose:
+            print("Backend '%s' generates one output from all rules, converting sequentially" % (cmdargs.target), file=sys.stderr)
+
+    newline_separator = '\0' if cmdargs.print0 else '\n'
+    for sigmafile, cache_key, cached_results in zip(inputs, cache_keys, cached):
         logger.debug("* Processing Sigma input %s" % (sigmafile))
         success = True
+        f = None
         try:
-            if cmdargs.inputs == ['-']:
-                f = sigmafile
+            if cached_results is not None:
+                results = cached_results
+            elif converted is not None:      # errors raised in worker processes are re-raised here
+                results, e = next(converted)
+                if e is not None:
+                    raise e
             else:
-                f = sigmafile.open(encoding='utf-8')
-            parser = SigmaCollectionParser(f, sigmaconfigs, rulefilter, sigmafile)
-            backend.setYmlFileName(str(sigmafile))
-            results = parser.generate(backend)
+                if cmdargs.inputs == ['-']:
+                    f = sigmafile
+                else:
+                    f = sigmafile.open(encoding='utf-8')
+                # Rules from stdin are parsed lazily and printed while they are converted, so that streams with
+                # any number of rules are converted in constant memory.
+                streaming = cmdargs.inputs == ['-'] and fileprefix is None and not cmdargs.output_fields
+                parser = SigmaCollectionParser(f, sigmaconfigs, rulefilter, sigmafile, lazy=streaming)
+                backend.setYmlFileName(str(sigmafile))
+                results = parser.generate(backend)
+                if streaming:
+                    for result in results:
+                        print(result, file=out, end=newline_separator)
+                    results = list()
+            if cache_key is not None and cached_results is None:
+                results = list(results)
+                cache.put(cache_key, results)
 
             nb_result = len(list(copy.deepcopy(results)))
             inc_filenane = None if nb_result < 2 else 0
-            
-            newline_separator = '\0' if cmdargs.print0 else '\n'
 
             results = list(results) # Since results is an iterator and used twice we convert it a list
             for result in results:
@@ -348,6 +658,8 @@ def main():
 
             if cmdargs.output_fields: # Handle output fields
                 output={}
+                if f is None:       # results from cache or worker process
+                    f = sigmafile.open(encoding='utf-8')
                 f.seek(0)
                 docs = yaml.load_all(f, Loader=yaml.FullLoader)
                 for doc in docs:
@@ -370,75 +682,28 @@ def main():
                         print("Failed to open output file '%s': %s" % (filename, str(e)), file=sys.stderr)
                         exit(ERR_OUTPUT) 
 
-        except OSError as e:
-            print("Failed to open Sigma file %s: %s" % (sigmafile, str(e)), file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            error = ERR_OPEN_SIGMA_RULE
-        except (yaml.parser.ParserError, yaml.scanner.ScannerError) as e:
-            print("Error: Sigma file %s is no valid YAML: %s" % (sigmafile, str(e)), file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            error = ERR_INVALID_YAML
-            if not cmdargs.defer_abort:
-                sys.exit(error)
-        except (SigmaParseError, SigmaCollectionParseError) as e:
-            print("Error: Sigma parse error in %s: %s" % (sigmafile, str(e)), file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            error = ERR_SIGMA_PARSING
-            if not cmdargs.defer_abort:
-                sys.exit(error)
-        except NotSupportedError as e:
-            print("Error: The Sigma rule requires a feature that is not supported by the target system: " + str(e), file=sys.stderr)
+        except conversion_errors as e:
             logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
             success = False
-            if not cmdargs.ignore_backend_errors:
-                error = ERR_NOT_SUPPORTED
-                if not cmdargs.defer_abort:
-                    sys.exit(error)
-        except BackendError as e:
-            print("Error: Backend error in %s: %s" % (sigmafile, str(e)), file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            if not cmdargs.ignore_backend_errors:
-                error = ERR_BACKEND
-                if not cmdargs.defer_abort:
-                    sys.exit(error)
-        except (NotImplementedError, TypeError) as e:
-            print("An unsupported feature is required for this Sigma rule (%s): " % (sigmafile) + str(e), file=sys.stderr)
-            # traceback.print_exc()
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            if not cmdargs.ignore_backend_errors:
-                error = ERR_NOT_IMPLEMENTED
-                if not cmdargs.defer_abort:
-                    sys.exit(error)
-        except PartialMatchError as e:
-            print("Error: Partial field match error: %s" % str(e), file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            if not cmdargs.ignore_backend_errors:
-                error = ERR_PARTIAL_FIELD_MATCH
-                if not cmdargs.defer_abort:
-                    sys.exit(error)
-        except FullMatchError as e:
-            print("Error: Full field match error", file=sys.stderr)
-            logger.debug("* Convertion Sigma input %s FAILURE" % (sigmafile))
-            success = False
-            if not cmdargs.ignore_backend_errors:
-                error = ERR_FULL_FIELD_MATCH
-                if not cmdargs.defer_abort:
-                    sys.exit(error)                
+            error = report_conversion_error(e, sigmafile, cmdargs, error)
         finally:
-            try:
-                f.close()
-            except:
-                pass
+            if f is not None:
+                try:
+                    f.close()
+                except:
+                    pass
         
         if success :
             logger.debug("* Convertion Sigma input %s SUCCESS" % (sigmafile)) 
- 
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if cache is not None:
+        cache.evict()
+        print(cache.stats(), file=sys.stderr)
+
     result = backend.finalize()
     if result:
         print(result, file=out)
@@ -451,6 +716,7 @@ def main():
 
     out.close()
 
+    write_profile(cmdargs)
     sys.exit(error)
 
 if __name__ == "__main__":
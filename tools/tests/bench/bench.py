@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# Benchmark: parse the Sigma rule corpus and convert it with all backend/configuration pairs used by the test-sigmac target of the Makefile.
+# Copyright 2016-2022 Thomas Patzke, Florian Roth
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Each benchmark case runs in its own Python process, so that the peak memory (maximum resident set size)
+and the imported modules are not influenced by other cases. The rule files are read into memory before
+the time is measured, the time contains YAML loading, parsing and query generation. The best time of
+all repetitions is reported.
+
+Results are written as JSON and compared against a stored baseline. A case is reported as regression if
+its rules/second drop or its peak memory grows by more than the tolerance. The baseline is only meaningful
+for the machine it was recorded on, record a new one with --save-baseline before comparing changes.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import re
+import resource
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_path = pathlib.Path(__file__).resolve().parent
+repo_path = bench_path.parents[2]
+tools_path = repo_path / "tools"
+sys.path.insert(0, str(tools_path))
+
+ERR_REGRESSION = 1
+
+def get_cases(makefile):
+    """Return benchmark cases as sigmac argument strings from successful sigmac runs over the rule corpus in the test-sigmac Makefile target."""
+    from sigma.sigmac import set_argparser, get_conversions
+    argparser = set_argparser()
+    cases = [ "parse" ]
+    in_target = False
+    for line in makefile.read_text().splitlines():
+        if line.startswith("test-sigmac:"):
+            in_target = True
+            continue
+        elif not line.startswith("\t"):
+            in_target = False
+        if not in_target or line.strip().startswith("!") or "tools/sigmac" not in line:
+            continue
+
+        args = shlex.split(re.sub(r"\s+[<>]\s*\S+", "", line.split("tools/sigmac", 1)[1]))     # without redirections
+        if "-t" not in args:        # help and list invocations
+            continue
+        cmdargs = argparser.parse_args(args)
+        if cmdargs.target is None or not any(pathlib.Path(path).parts[:1] == ("rules",) for path in cmdargs.inputs):
+            continue
+
+        for target, config_names in get_conversions(cmdargs.conversions):
+            case = [ "-t", target ]
+            for config_name in config_names:
+                case += [ "-c", config_name ]
+            for option in cmdargs.backend_option or list():
+                case += [ "-O", option ]
+            if cmdargs.backend_config:
+                case += [ "--backend-config", cmdargs.backend_config ]
+            if cmdargs.filter:
+                case += [ "-f", cmdargs.filter ]
+            if cmdargs.shoot_yourself_in_the_foot:
+                case += [ "--shoot-yourself-in-the-foot" ]
+            case = shlex.join(case)
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+def load_corpus(rules_path):
+    return [ (path, path.read_text(encoding="utf-8")) for path in sorted(rules_path.glob("**/*.yml")) ]
+
+def run_case(case, rules_path, repeat):
+    """
+    Run one benchmark case in this process and return the result. Backends run in a temporary working
+    directory, because some of them write files.
+    """
+    from sigma.parser.collection import SigmaCollectionParser
+    from sigma.configuration import SigmaConfiguration
+    from sigma.config.collection import SigmaConfigurationManager
+    from sigma.filter import SigmaRuleFilter
+    from sigma.backends.base import BackendOptions
+    import sigma.backends.discovery as backends
+    from sigma.sigmac import set_argparser, get_configuration_chain, conversion_errors
+
+    corpus = load_corpus(rules_path)
+    best = None
+    for i in range(repeat):
+        if case == "parse":
+            config = SigmaConfiguration()
+            start = time.perf_counter()
+            rules = errors = 0
+            for path, content in corpus:
+                try:
+                    rules += len(SigmaCollectionParser(content, config, None, path).parsers)
+                except conversion_errors:
+                    errors += 1
+        else:
+            cmdargs = set_argparser().parse_args(shlex.split(case))
+            scm = SigmaConfigurationManager([ str(tools_path / "config") ])
+            backend_class = backends.getBackend(cmdargs.target)
+            config, config_names = get_configuration_chain(scm, cmdargs.target, cmdargs.config, cmdargs)
+            rulefilter = SigmaRuleFilter(cmdargs.filter) if cmdargs.filter else None
+
+            backend_options = BackendOptions(cmdargs.backend_option, cmdargs.backend_config)
+            cwd = os.getcwd()
+            workdir = tempfile.TemporaryDirectory()
+            os.chdir(workdir.name)
+
+            start = time.perf_counter()
+            backend = backend_class(config, backend_options)
+            backend.initialize()
+            rules = errors = 0
+            for path, content in corpus:
+                try:
+                    parser = SigmaCollectionParser(content, config, rulefilter, path)
+                    backend.setYmlFileName(str(path))
+                    rules += len(parser.parsers)
+                    for result in parser.generate(backend):
+                        pass
+                except conversion_errors:
+                    errors += 1
+            backend.finalize()
+            os.chdir(cwd)
+            workdir.cleanup()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+
+    return {
+            "files": len(corpus),
+            "rules": rules,
+            "errors": errors,
+            "seconds": best,
+            "rules_per_second": rules / best,
+            "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            }
+
+def compare(results, baseline, tolerance):
+    """Print comparison of results with baseline and return list of regressed cases."""
+    regressions = list()
+    print("{:<90} {:>12} {:>12} {:>8} {:>10}".format("Case", "Rules/s", "Baseline", "Change", "Peak MB"))
+    for case, result in results["cases"].items():
+        base = baseline["cases"].get(case)
+        if base is None:
+            print("{:<90} {:>12.1f} {:>12} {:>8} {:>10.1f}".format(case, result["rules_per_second"], "-", "-", result["peak_memory"] / 2**20))
+            continue
+        change = result["rules_per_second"] / base["rules_per_second"] - 1
+        regressed = change < -tolerance or result["peak_memory"] > base["peak_memory"] * (1 + tolerance)
+        print("{:<90} {:>12.1f} {:>12.1f} {:>+7.1f}% {:>10.1f}{}".format(case, result["rules_per_second"], base["rules_per_second"], change * 100, result["peak_memory"] / 2**20, " REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(case)
+    return regressions
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark parsing and conversion of the Sigma rule corpus.")
+    argparser.add_argument("--rules", default=str(repo_path / "rules"), help="Rule corpus directory (default: rules/ of repository)")
+    argparser.add_argument("--makefile", default=str(repo_path / "Makefile"), help="Makefile with test-sigmac target from which conversion cases are taken")
+    argparser.add_argument("--case", "-k", action="append", help="Only run cases containing this string. Can be given multiple times.")
+    argparser.add_argument("--repeat", "-r", type=int, default=3, help="Repetitions of each case, the best time is reported (default: 3)")
+    argparser.add_argument("--output", "-o", default="bench-results.json", help="Result file (default: bench-results.json)")
+    argparser.add_argument("--baseline", "-b", default=str(bench_path / "baseline.json"), help="Baseline results to compare with")
+    argparser.add_argument("--save-baseline", action="store_true", help="Store results as new baseline")
+    argparser.add_argument("--tolerance", "-t", type=float, default=0.2, help="Allowed relative throughput decrease and memory increase (default: 0.2)")
+    argparser.add_argument("--run-case", help=argparse.SUPPRESS)      # internal: run case in this process and write result as JSON to output file
+    args = argparser.parse_args()
+
+    if args.run_case:
+        result = run_case(args.run_case, pathlib.Path(args.rules), args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return
+
+    cases = get_cases(pathlib.Path(args.makefile))
+    if args.case:
+        cases = [ case for case in cases if any(selected in case for selected in args.case) ]
+
+    results = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rules": args.rules,
+            "repeat": args.repeat,
+            "cases": dict(),
+            }
+    for case in cases:
+        print("Running " + case, file=sys.stderr)
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as case_output:
+            proc = subprocess.run(
+                    [ sys.executable, __file__, "--rules", args.rules, "--repeat", str(args.repeat), "--output", case_output.name, "--run-case=" + case ],
+                    cwd=repo_path,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    )
+            if proc.returncode != 0:
+                print("Case failed with exit code %d: %s" % (proc.returncode, case), file=sys.stderr)
+                continue
+            results["cases"][case] = json.load(case_output)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        print("No baseline found at %s, save one with --save-baseline" % (args.baseline), file=sys.stderr)
+        return
+    if compare(results, baseline, args.tolerance):
+        sys.exit(ERR_REGRESSION)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.base import RuleState
+from sigma.backends.ala import AzureLogAnalyticsBackend
+from sigma.backends.elasticsearch import ElasticsearchDSLBackend
+
+rule = """
+title: Test
+logsource:
+    product: windows
+    service: %s
+detection:
+    selection:
+        CommandLine: '*test*'
+    condition: selection
+"""
+
+class SynchronizedBackend(AzureLogAnalyticsBackend):
+    """Waits until all conversions determined their table before the query is generated"""
+    barrier = threading.Barrier(2, timeout=10)
+
+    def generateBefore(self, parsed):
+        self.barrier.wait()
+        return super().generateBefore(parsed)
+
+def parser(config, service):
+    return SigmaCollectionParser(rule % service, config, None).parsers[0]
+
+def test_rule_state():
+    backend = AzureLogAnalyticsBackend(SigmaConfiguration())
+    assert type(AzureLogAnalyticsBackend.table) is RuleState
+    assert backend.convert(parser(backend.sigmaconfig, "security")).startswith("SecurityEvent | ")
+    assert backend.convert(parser(backend.sigmaconfig, "system")).startswith("System | ")
+    assert backend.context is None
+    assert backend.table is None                # state of conversions is discarded
+    assert backend.generate(parser(backend.sigmaconfig, "security")).startswith("SecurityEvent | ")
+    assert backend.table == "SecurityEvent"
+
+def test_concurrent_conversion():
+    backend = SynchronizedBackend(SigmaConfiguration())
+    rules = [ parser(backend.sigmaconfig, service) for service in ("security", "system") ]
+    with ThreadPoolExecutor(2) as executor:
+        results = list(executor.map(backend.convert, rules))
+    assert results[0].startswith("SecurityEvent | ")
+    assert results[1].startswith("System | ")
+
+class SynchronizedDSLBackend(ElasticsearchDSLBackend):
+    """Waits until all conversions started their query before the search is generated"""
+    barrier = threading.Barrier(2, timeout=10)
+
+    def generateBefore(self, parsed):
+        super().generateBefore(parsed)
+        self.barrier.wait()
+
+def test_concurrent_conversion_dsl():
+    backend = SynchronizedDSLBackend(SigmaConfiguration())
+    rules = [ parser(backend.sigmaconfig, service) for service in ("security", "system") ]
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(backend.convert, rules))
+    assert len(json.loads(backend.finalize())) == 2
+
+def test_concurrent_conversion_dsl_output():
+    backend = ElasticsearchDSLBackend(SigmaConfiguration())
+    rules = [ SigmaCollectionParser(rule.replace("*test*", "*test%d*" % i) % "security", backend.sigmaconfig, None).parsers[0] for i in range(200) ]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(backend.convert, rules))
+    queries = json.loads(backend.finalize())
+    values = sorted(query["query"]["constant_score"]["filter"]["wildcard"]["CommandLine.keyword"] for query in queries)
+    assert values == sorted("*test%d*" % i for i in range(200))
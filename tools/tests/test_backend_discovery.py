@@ -0,0 +1,11 @@
+import json
+import sigma.backends.discovery as backends
+
+def test_backend_index_current():
+    """Regenerate with 'make backend-index' after adding or changing backends"""
+    with open(backends.index_path) as f:
+        assert json.load(f) == backends.generateBackendIndex()
+
+def test_backend_lookup():
+    for identifier, cls in backends.getBackendDict().items():
+        assert backends.getBackend(identifier) is cls
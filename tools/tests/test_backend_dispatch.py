@@ -0,0 +1,37 @@
+import pytest
+
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.parser.condition import ConditionAND
+from sigma.parser.modifiers.type import SigmaRegularExpressionModifier
+from sigma.backends.splunk import SplunkBackend
+
+rule = """
+title: Test
+logsource:
+    category: test
+detection:
+    selection:
+        field: value
+    keywords:
+        - keyword
+    condition: selection and keywords
+"""
+
+class AllSplunkBackend(SplunkBackend):
+    nodeHandlers = { **SplunkBackend.nodeHandlers, ConditionAND: "generateAllNode" }
+
+    def generateAllNode(self, node):
+        return "all(%s)" % ", ".join(self.generateNode(val) for val in node)
+
+def test_dispatch():
+    backend = SplunkBackend(SigmaConfiguration())
+    assert list(SigmaCollectionParser(rule, backend.sigmaconfig, None).generate(backend)) == [ '(field="value" "keyword")' ]
+    assert backend.getNodeHandler(SigmaRegularExpressionModifier)[0] == backend.generateTypedValueNode
+    assert backend.nodeDispatch[SigmaRegularExpressionModifier] == backend.getNodeHandler(SigmaRegularExpressionModifier)
+    with pytest.raises(TypeError):
+        backend.generateNode(True)
+
+def test_dispatch_registered_handler():
+    backend = AllSplunkBackend(SigmaConfiguration())
+    assert list(SigmaCollectionParser(rule, backend.sigmaconfig, None).generate(backend)) == [ '(all(field="value", "keyword"))' ]
@@ -1,6 +1,7 @@
-from sigma.backends.elasticsearch import ElasticsearchDSLBackend
+from sigma.backends.elasticsearch import ElasticsearchDSLBackend, ElasticsearchQuerystringBackend
 from sigma.configuration import SigmaConfiguration
 from sigma.parser.condition import SigmaAggregationParser
+from sigma.parser.collection import SigmaCollectionParser
 
 
 def test_backend_elastic():
@@ -63,3 +64,26 @@ def test_backend_elastic_count_nofield_agg():
     assert ("GroupedField_count" in backend.queries[0]["aggs"]), "GroupedField_count is the top aggregation key"
     assert ("params.count < 3" in bucket_selector["script"]), "bucket selector script must be 'params.count < 3'"
     assert "count" in bucket_selector["buckets_path"], "buckets_path must be 'count'"
+
+
+def test_backend_elastic_querystring_coalesce():
+    """
+    Values with and without wildcards are not merged into one value list, because exact values are
+    searched in the analyzed field and wildcard values in the keyword field.
+    """
+    rule = """
+title: Test
+logsource:
+    product: windows
+detection:
+    sel1:
+        Image: 'C:\\\\Windows\\\\x.exe'
+    sel2:
+        Image|endswith: '\\\\y.exe'
+    condition: sel1 or sel2
+"""
+    config = SigmaConfiguration("fieldmappings:\n  Image: winlog.event_data.Image\n")
+    backend = ElasticsearchQuerystringBackend(config)
+    assert list(SigmaCollectionParser(rule, config, None).generate(backend)) == [
+            '(winlog.event_data.Image:"C\\:\\\\Windows\\\\x.exe" OR winlog.event_data.Image.keyword:*\\\\y.exe)'
+            ]
@@ -0,0 +1,144 @@
+import io
+import shutil
+import subprocess
+
+import pytest
+
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.base import BackendOptions
+from sigma.backends.misc import GrepMultiRuleBackend
+
+rules = [
+        """
+title: Whoami
+id: rule-1
+logsource:
+    product: windows
+detection:
+    selection:
+        Image|endswith: '\\whoami.exe'
+    filter:
+        User: 'SYSTEM'
+    condition: selection and not filter
+""",
+        """
+title: Net User
+id: rule-2
+logsource:
+    product: windows
+detection:
+    selection:
+        CommandLine|contains|all:
+            - 'net'
+            - ' user '
+        CommandLine|re: '/add$'
+    condition: selection
+""",
+        """
+title: Keywords
+id: rule-3
+logsource:
+    product: windows
+detection:
+    keywords:
+        - "it's"
+        - 'pass?word'
+    condition: keywords
+""",
+        """
+title: No literal
+id: rule-4
+logsource:
+    product: windows
+detection:
+    selection:
+        ParentImage: null
+    condition: selection
+""",
+        ]
+
+def convert():
+    backend = GrepMultiRuleBackend(SigmaConfiguration("{}"), BackendOptions(None, None))
+    out = io.StringIO()
+    out.write(backend.initialize() or "")
+    for rule in rules:
+        for result in SigmaCollectionParser(rule, backend.sigmaconfig, None).generate(backend):
+            out.write(result or "")
+    out.write(backend.finalize())
+    return out.getvalue()
+
+def test_grep_multi_script():
+    script = convert()
+    assert "push @rules, sub { (index($lc, '\\\\whoami.exe') >= 0 && !(index($lc, 'system') >= 0)) };" in script
+    assert "push @rules, sub { index($lc, 'parentimage') < 0 };" in script
+    assert "push @{$literals{'\\\\whoami.exe'}}, 0;" in script
+    assert "push @p, qr'/add$';" in script
+    assert "push @unconditional, 3;" in script
+    assert "(?=.*" not in script
+
+@pytest.mark.skipif(shutil.which("perl") is None, reason="perl not installed")
+def test_grep_multi_scan(tmp_path):
+    (tmp_path / "scan.pl").write_text(convert())
+    (tmp_path / "log").write_text(
+            "Image=C:\\Tools\\WHOAMI.EXE User=admin\n"
+            "Image=C:\\Tools\\whoami.exe User=SYSTEM ParentImage=C:\\Windows\\explorer.exe\n"
+            "Image=C:\\Windows\\net.exe CommandLine=NET USER x /add\n"
+            "CommandLine=net user x /ADD it's my passXword\n"
+            )
+    result = subprocess.run([ "perl", str(tmp_path / "scan.pl"), str(tmp_path / "log") ], stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    assert [ line.split("\t")[0] for line in result.stdout.splitlines() ] == [ "rule-1,rule-4", "rule-2,rule-4", "rule-3,rule-4" ]
+    assert result.stdout.splitlines()[1].split("\t")[1].endswith("log:3:Image=C:\\Windows\\net.exe CommandLine=NET USER x /add")
+
+failing_rules = [
+        """
+title: Float value
+id: rule-bad
+logsource:
+    product: windows
+detection:
+    selection:
+        CommandLine: 'foo*bar*baz'
+        Value: 1.5
+    condition: selection
+""",
+        """
+title: Pattern
+id: rule-good
+logsource:
+    product: windows
+detection:
+    selection:
+        CommandLine: 'qux*quux*zap'
+    condition: selection
+""",
+        ]
+
+def test_grep_multi_failed_rule(tmp_path):
+    backend = GrepMultiRuleBackend(SigmaConfiguration("{}"), BackendOptions(None, None))
+    out = io.StringIO()
+    out.write(backend.initialize() or "")
+    with pytest.raises(TypeError):
+        list(SigmaCollectionParser(failing_rules[0], backend.sigmaconfig, None).generate(backend))
+    for result in SigmaCollectionParser(failing_rules[1], backend.sigmaconfig, None).generate(backend):
+        out.write(result or "")
+    out.write(backend.finalize())
+    script = out.getvalue()
+    assert "foo" not in script
+    assert "push @p, qr'qux.*quux.*zap';" in script
+    assert "push @rules, sub { $lc =~ $p[0] };" in script
+
+    if shutil.which("perl") is not None:
+        (tmp_path / "scan.pl").write_text(script)
+        (tmp_path / "log").write_text("quux only\nQux Quux Zap\n")
+        result = subprocess.run([ "perl", str(tmp_path / "scan.pl"), str(tmp_path / "log") ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, universal_newlines=True)
+        assert result.stderr == ""
+        assert [ line.split("\t")[0] for line in result.stdout.splitlines() ] == [ "rule-good" ]
+
+def test_grep_multi_empty_list():
+    backend = GrepMultiRuleBackend(SigmaConfiguration("{}"), BackendOptions(None, None))
+    empty = rules[0].replace("User: 'SYSTEM'", "User: []").replace("selection and not filter", "selection and filter")
+    list(SigmaCollectionParser(empty, backend.sigmaconfig, None).generate(backend))
+    result = backend.finalize()
+    assert "push @rules, sub { (index($lc, '\\\\whoami.exe') >= 0 && 0) };" in result
+    assert "push @{$literals" not in result and "push @unconditional" not in result
@@ -0,0 +1,69 @@
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.splunk import SplunkBackend
+
+config = """
+overrides:
+    - field: action
+      value: allowed
+      regexes:
+          - action="(accept|forward)"
+      literals:
+          - NOT (action="deny")
+"""
+
+rule = """
+title: Test
+logsource:
+    category: firewall
+detection:
+    selection:
+        action: %s
+    filter:
+        action: deny
+    condition: selection and not filter
+"""
+
+def convert(backend, action):
+    return list(SigmaCollectionParser(rule % action, backend.sigmaconfig, None).generate(backend))
+
+def test_overrides():
+    backend = SplunkBackend(SigmaConfiguration(config))
+    assert convert(backend, "accept") == [ '(action=allowed action=allowed)' ]
+    assert convert(backend, "drop") == [ '(action="drop" action=allowed)' ]
+    assert backend.getOverrides() is backend.getOverrides()
+
+def test_overrides_invalid():
+    backend = SplunkBackend(SigmaConfiguration(config.replace("accept|forward", "accept|forward(")))
+    assert backend.getOverrides() == list()
+    assert convert(backend, "accept") == [ '(action="accept" NOT (action="deny"))' ]
+
+class CountingRegex:
+    """Compiled regular expression that counts substitutions"""
+    def __init__(self, regex):
+        self.regex = regex
+        self.count = 0
+
+    def sub(self, replacement, query):
+        self.count += 1
+        return self.regex.sub(replacement, query)
+
+def count_overrides(backend):
+    backend.overrides = [ (CountingRegex(regex) if regex else None, literal, replacement) for regex, literal, replacement in backend.getOverrides() ]
+    return backend.overrides[0][0]
+
+def test_overrides_once_per_query():
+    backend = SplunkBackend(SigmaConfiguration(config))
+    regex = count_overrides(backend)
+    assert convert(backend, "accept") == [ '(action=allowed action=allowed)' ]
+    assert regex.count == 1
+    assert backend.nodeDepth == 0
+
+class PerNodeSplunkBackend(SplunkBackend):
+    overrides_per_node = True
+
+def test_overrides_per_node():
+    backend = PerNodeSplunkBackend(SigmaConfiguration(config))
+    regex = count_overrides(backend)
+    assert convert(backend, "accept") == [ '(action=allowed action=allowed)' ]
+    assert regex.count > 1
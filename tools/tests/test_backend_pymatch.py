@@ -0,0 +1,171 @@
+import pytest
+
+from sigma.backends.pymatch import parseWildcards
+from sigma.matcher import AhoCorasickAutomaton, SigmaRuleSet
+
+rule = """
+title: Test
+id: 3c2e9a5e-9c6b-4a57-9a39-43ef3b0c2e4d
+logsource:
+    product: windows
+detection:
+%s
+"""
+
+def ruleset(detection):
+    ruleset = SigmaRuleSet()
+    ruleset.add(rule % detection)
+    return ruleset
+
+def matches(detection, *events):
+    r = ruleset(detection)
+    return [ bool(r.match(event)) for event in events ]
+
+def test_parse_wildcards():
+    assert parseWildcards("a*b?c") == [ "a", None, "b", False, "c" ]
+    assert parseWildcards("a\\*b\\?c\\\\*") == [ "a*b?c\\", None ]
+    assert parseWildcards("C:\\Windows\\*") == [ "C:\\Windows*" ]
+    assert parseWildcards("C:\\Windows\\\\*") == [ "C:\\Windows\\", None ]
+
+def test_values():
+    detection = """
+    selection:
+        Image|endswith: '\\whoami.exe'
+        CommandLine:
+            - '*/all*'
+            - '*/user?'
+            - 'whoami /priv'
+        ParentImage|startswith: 'C:\\Windows\\'
+    condition: selection
+"""
+    assert matches(detection,
+            { "Image": "C:\\Windows\\System32\\WHOAMI.EXE", "CommandLine": "whoami /ALL", "ParentImage": "c:\\windows\\cmd.exe" },
+            { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "whoami /username", "ParentImage": "C:\\Windows\\cmd.exe" },
+            { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "whoami /user1", "ParentImage": "C:\\Windows\\cmd.exe" },
+            { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "Whoami /Priv", "ParentImage": "C:\\Windows\\cmd.exe" },
+            { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "whoami /priv", "ParentImage": "D:\\cmd.exe" },
+            { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "whoami /priv" },
+            ) == [ True, False, True, True, False, False ]
+
+def test_numbers_lists_nested():
+    detection = """
+    selection:
+        EventID: 4688
+        process.name: cmd.exe
+        Tags|all:
+            - a
+            - b
+    condition: selection
+"""
+    assert matches(detection,
+            { "EventID": "4688", "process": { "name": "cmd.exe" }, "Tags": [ "A", "b", "c" ] },
+            { "EventID": 4688, "process.name": "cmd.exe", "Tags": [ "a", "b" ] },
+            { "EventID": 4688, "process": { "name": "cmd.exe" }, "Tags": [ "a" ] },
+            { "EventID": 4689, "process": { "name": "cmd.exe" }, "Tags": [ "a", "b" ] },
+            ) == [ True, True, False, False ]
+
+def test_null_regex_keywords():
+    detection = """
+    selection:
+        CommandLine|re: 'net[0-9]? user'
+        User: null
+    keywords:
+        - 'add'
+    filter:
+        Image: '*'
+    condition: selection and keywords and not filter
+"""
+    assert matches(detection,
+            { "CommandLine": "net1 user x /add" },
+            { "CommandLine": "NET user x /add" },
+            { "CommandLine": "net user x /add", "User": "admin" },
+            { "CommandLine": "net user x /add", "User": None },
+            { "CommandLine": "net user x /add", "Image": "" },
+            { "CommandLine": "net user x" },
+            ) == [ True, False, False, True, False, False ]
+
+def test_aggregation_not_supported():
+    with pytest.raises(NotImplementedError):
+        ruleset("""
+    selection:
+        EventID: 4625
+    condition: selection | count() > 10
+""")
+
+def test_match_lines():
+    r = ruleset("""
+    selection:
+        EventID: 1
+    condition: selection
+""")
+    lines = [ '{"EventID": 1}', '', '{"EventID": 2}', '{"EventID": [1, 3]}' ]
+    assert [ (lineno, [ rule.id for rule in rules ]) for lineno, event, rules in r.match_lines(lines) ] == [
+            (1, [ "3c2e9a5e-9c6b-4a57-9a39-43ef3b0c2e4d" ]),
+            (3, []),
+            (4, [ "3c2e9a5e-9c6b-4a57-9a39-43ef3b0c2e4d" ]),
+            ]
+    with pytest.raises(ValueError):
+        list(r.match_lines([ "[1]" ]))
+
+def test_aho_corasick():
+    automaton = AhoCorasickAutomaton([ "cmd", "cmd.exe", "d.e", "he", "she", "hers" ])
+    found = set()
+    automaton.search("x cmd.exe ushers", found)
+    assert sorted(automaton.patterns[i] for i in found) == [ "cmd", "cmd.exe", "d.e", "he", "hers", "she" ]
+    found = set()
+    automaton.search("cm.exe", found)
+    assert found == set()
+
+def test_required_literals():
+    r = ruleset("""
+    selection:
+        Image|endswith: '\\whoami.exe'
+        EventID: 1
+    filter:
+        User: 'SYSTEM'
+    condition: selection and not filter
+""")
+    assert r.rules[0].literals == { ("Image", "\\whoami.exe", False) }
+    r = ruleset("""
+    filter:
+        User: 'SYSTEM'
+    condition: not filter
+""")
+    assert r.rules[0].literals is None
+
+def test_required_literals_empty_list():
+    detection = """
+    selection:
+        a: []
+        b: x
+    condition: selection
+"""
+    assert ruleset(detection).rules[0].literals == set()
+    assert matches(detection, { "a": "x", "b": "x" }, { "b": "x" }) == [ False, False ]
+
+def test_prefilter():
+    detections = [
+            "    selection:\n        Image|endswith: '\\\\whoami.exe'\n    condition: selection",
+            "    selection:\n        CommandLine|contains|all:\n            - 'net'\n            - ' user '\n    condition: selection",
+            "    selection:\n        EventID: 4688\n    condition: selection",
+            "    keywords:\n        - 'mimikatz'\n    condition: keywords",
+            "    filter:\n        User: 'SYSTEM'\n    condition: not filter",
+            ]
+    events = [
+            { "Image": "C:\\Windows\\whoami.exe", "User": "SYSTEM" },
+            { "CommandLine": "NET USER admin /add", "EventID": "4688" },
+            { "CommandLine": "mimikatz.exe", "User": "admin" },
+            { "EventID": [ 1, 4688 ], "User": "SYSTEM" },
+            ]
+    results = list()
+    for prefilter in (True, False):
+        r = SigmaRuleSet(prefilter=prefilter)
+        for i, detection in enumerate(detections):
+            r.add((rule % detection).replace("Test", "Test %d" % i))
+        results.append([ [ rule.title for rule in r.match(event) ] for event in events ])
+    assert results[0] == results[1] == [
+            [ "Test 0" ],
+            [ "Test 1", "Test 2", "Test 4" ],
+            [ "Test 3", "Test 4" ],
+            [ "Test 2" ],
+            ]
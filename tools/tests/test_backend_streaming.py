@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.base import BackendOptions
+from sigma.backends.elasticsearch import ElasticsearchDSLBackend, KibanaBackend, KibanaNdjsonBackend, XPackWatcherBackend
+from sigma.backends.splunk import SplunkXMLBackend
+
+rule = """
+title: Test %d
+logsource:
+    product: windows
+detection:
+    selection:
+        EventID: %d
+    condition: selection
+"""
+
+def convert(backend, rules, stream=None):
+    """Convert rules like sigmac and return the printed output"""
+    out = io.StringIO()
+    if stream:
+        backend.setOutputStream(out)
+    result = backend.initialize()
+    if result:
+        print(result, file=out)
+    for i in range(rules):
+        for result in SigmaCollectionParser(rule % (i, i), backend.sigmaconfig, None).generate(backend):
+            print(result, file=out)
+    result = backend.finalize()
+    if result:
+        print(result, file=out)
+    return out.getvalue()
+
+@pytest.mark.parametrize("backend_class", [ SplunkXMLBackend, KibanaBackend, KibanaNdjsonBackend, XPackWatcherBackend, ElasticsearchDSLBackend ])
+@pytest.mark.parametrize("rules", [ 0, 1, 3 ])
+def test_streaming_output(backend_class, rules):
+    collected = convert(backend_class(SigmaConfiguration("{}"), BackendOptions(None, None)), rules)
+    streamed = convert(backend_class(SigmaConfiguration("{}"), BackendOptions(None, None)), rules, stream=True)
+    assert streamed == collected
+
+def test_streaming_kibana():
+    output = convert(KibanaBackend(SigmaConfiguration("{}"), BackendOptions(None, None)), 3, stream=True)
+    assert [ item["_id"] for item in json.loads(output) ] == [ "00000000-0000-0000-0000-000000000000-Test-%d" % i for i in range(3) ]
@@ -0,0 +1,94 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from sigma.matcher import SigmaRuleSet
+from sigma.batchmatcher import SigmaBatchRuleSet, SigmaEventBatch
+
+rule = """
+title: Test %d
+logsource:
+    product: windows
+detection:
+%s
+"""
+
+detections = [
+        """
+    selection:
+        Image|endswith: '\\whoami.exe'
+        CommandLine:
+            - '*/all*'
+            - '*/user?'
+            - 'whoami /priv'
+        ParentImage|startswith: 'C:\\Windows\\'
+    condition: selection
+""",
+        """
+    selection:
+        CommandLine|re: 'net[0-9]? user'
+        User: null
+    keywords:
+        - 'add'
+    filter:
+        Image: '*'
+    condition: selection and keywords and not filter
+""",
+        """
+    selection:
+        EventID: 4688
+        process.name: cmd.exe
+        Tags|all:
+            - a
+            - b
+    condition: selection
+""",
+        ]
+
+events = [
+        { "Image": "C:\\Windows\\System32\\WHOAMI.EXE", "CommandLine": "whoami /ALL", "ParentImage": "c:\\windows\\cmd.exe" },
+        { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "whoami /username", "ParentImage": "C:\\Windows\\cmd.exe" },
+        { "Image": "C:\\Windows\\System32\\whoami.exe", "CommandLine": "Whoami /Priv", "ParentImage": "C:\\Windows\\cmd.exe" },
+        { "CommandLine": "net1 user x /add" },
+        { "CommandLine": "NET user x /add" },
+        { "CommandLine": "net user x /add", "User": "admin" },
+        { "CommandLine": "net user x /add", "Image": "" },
+        { "EventID": "4688", "process": { "name": "cmd.exe" }, "Tags": [ "A", "b", "c" ] },
+        { "EventID": 4688, "process": { "name": "cmd.exe" }, "Tags": [ "a" ] },
+        { "EventID": 4689, "process": { "name": "cmd.exe" }, "Tags": [ "a", "b" ] },
+        ]
+
+def ruleset(cls):
+    ruleset = cls()
+    for i, detection in enumerate(detections):
+        ruleset.add(rule % (i, detection))
+    return ruleset
+
+def test_batch_equals_events():
+    expected = [ [ rule.title for rule in ruleset(SigmaRuleSet).match(event) ] for event in events ]
+    assert [ [ rule.title for rule in rules ] for rules in ruleset(SigmaBatchRuleSet).match_events(events) ] == expected
+    assert expected == [ [ "Test 0" ], [], [ "Test 0" ], [ "Test 1" ], [], [], [], [ "Test 2" ], [], [] ]
+
+def test_columns():
+    r = ruleset(SigmaBatchRuleSet)
+    columns = {
+            "EventID": numpy.array([ 4688.0, numpy.nan, 4688.0, 4688.0 ]),
+            "process.name": numpy.array([ "CMD.exe", "cmd.exe", "cmd.exe", "x.exe" ]),
+            "Tags": [ [ "a", "b" ], [ "a", "b" ], [ "a", "b" ], [ "a", "b" ] ],
+            }
+    assert [ (rule.title, list(indices)) for rule, indices in r.match_batch(columns) ] == [ ("Test 2", [ 0, 2 ]) ]
+    assert list(r.rules[2].matches(columns)) == [ 0, 2 ]
+
+def test_column_length():
+    with pytest.raises(ValueError):
+        SigmaEventBatch({ "a": [ 1, 2 ], "b": [ 1 ] })
+
+def test_match_lines():
+    r = ruleset(SigmaBatchRuleSet)
+    r.batch_size = 2
+    lines = [ '{"EventID": 4688, "process": {"name": "cmd.exe"}, "Tags": ["a", "b"]}', '', '{"CommandLine": "net user /add"}', '{}' ]
+    assert [ (lineno, [ rule.title for rule in rules ]) for lineno, event, rules in r.match_lines(lines) ] == [
+            (1, [ "Test 2" ]),
+            (3, [ "Test 1" ]),
+            (4, []),
+            ]
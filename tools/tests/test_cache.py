@@ -0,0 +1,36 @@
+import os
+from sigma.cache import SigmaConversionCache
+from sigma.configuration import SigmaConfigurationChain
+
+def get_cache(path, max_size=1024*1024, options=dict()):
+    return SigmaConversionCache(path / "cache", max_size, SigmaConfigurationChain(), "splunk", options)
+
+def test_cache_roundtrip(tmp_path):
+    rule = tmp_path / "rule.yml"
+    rule.write_text("title: test")
+    cache = get_cache(tmp_path)
+    key = cache.key(rule)
+    assert cache.get(key) is None
+    cache.put(key, ["query"])
+    assert cache.get(key) == ["query"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_cache_key(tmp_path):
+    rule = tmp_path / "rule.yml"
+    rule.write_text("title: test")
+    key = get_cache(tmp_path).key(rule)
+    assert get_cache(tmp_path, options={"rulecomment": True}).key(rule) != key
+    rule.write_text("title: changed")
+    assert get_cache(tmp_path).key(rule) != key
+    assert get_cache(tmp_path).key(tmp_path / "missing.yml") is None
+
+def test_cache_eviction(tmp_path):
+    cache = get_cache(tmp_path, max_size=100)
+    for i in range(10):
+        rule = tmp_path / ("rule%d.yml" % i)
+        rule.write_text("title: test %d" % i)
+        key = cache.key(rule)
+        cache.put(key, ["x" * 30])
+        os.utime(cache.entry_path(key), (i, i))
+    assert cache.evict() <= 100
+    assert cache.get(cache.key(tmp_path / "rule9.yml")) is not None
@@ -0,0 +1,232 @@
+import pytest
+from sigma.configuration import SigmaConfiguration
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.parser.condition import SigmaConditionToken, SigmaConditionTokenizer, ConditionAND, ConditionOR, ConditionNOT, NodeSubexpression
+from sigma.parser.exceptions import SigmaParseError
+
+rule = """
+title: Test
+logsource:
+    product: windows
+detection:
+%s
+    condition: %s
+"""
+
+definitions = """
+    sel1:
+        a: 1
+    sel2:
+        b: 2
+    sel3:
+        c: 3
+"""
+
+def tokens(condition):
+    return [ (token.type, token.matched, token.pos) for token in SigmaConditionTokenizer(condition) ]
+
+def test_tokenizer():
+    assert tokens("1 of sel* and not (filter1 OR filter2) | count(User) by Host >= 5") == [
+            (SigmaConditionToken.TOKEN_ONE, "1 of", 1),
+            (SigmaConditionToken.TOKEN_ID, "sel*", 6),
+            (SigmaConditionToken.TOKEN_AND, "and", 11),
+            (SigmaConditionToken.TOKEN_NOT, "not", 15),
+            (SigmaConditionToken.TOKEN_LPAR, "(", 19),
+            (SigmaConditionToken.TOKEN_ID, "filter1", 20),
+            (SigmaConditionToken.TOKEN_OR, "OR", 28),
+            (SigmaConditionToken.TOKEN_ID, "filter2", 31),
+            (SigmaConditionToken.TOKEN_RPAR, ")", 38),
+            (SigmaConditionToken.TOKEN_PIPE, "|", 40),
+            (SigmaConditionToken.TOKEN_AGG, "count", 42),
+            (SigmaConditionToken.TOKEN_LPAR, "(", 47),
+            (SigmaConditionToken.TOKEN_ID, "User", 48),
+            (SigmaConditionToken.TOKEN_RPAR, ")", 52),
+            (SigmaConditionToken.TOKEN_BY, "by", 54),
+            (SigmaConditionToken.TOKEN_ID, "Host", 57),
+            (SigmaConditionToken.TOKEN_GTE, ">=", 62),
+            (SigmaConditionToken.TOKEN_ID, "5", 65),
+            ]
+
+def test_tokenizer_cache():
+    first = SigmaConditionTokenizer("selection and not filter")
+    second = SigmaConditionTokenizer("selection and not filter")
+    assert first.tokens is not second.tokens
+    assert all(a is b for a, b in zip(first.tokens, second.tokens))
+
+def test_tokenizer_invalid():
+    with pytest.raises(SigmaParseError, match="at position #2"):
+        SigmaConditionTokenizer("selection #2")
+
+
+def tree(node):
+    """Simplified representation of parse tree"""
+    if isinstance(node, NodeSubexpression):
+        return tree(node.items)
+    elif isinstance(node, (ConditionAND, ConditionOR)) and len(node) == 1:
+        return tree(node.items[0])
+    elif isinstance(node, ConditionAND):
+        return ("and", [ tree(item) for item in node ])
+    elif isinstance(node, ConditionOR):
+        return ("or", [ tree(item) for item in node ])
+    elif isinstance(node, ConditionNOT):
+        return ("not", tree(node.item))
+    else:
+        return node
+
+class ListBackend:
+    """Backend that supports value lists"""
+    index_field = None
+    coalesce_value_lists = True
+
+class KeywordListBackend(ListBackend):
+    """Backend that supports value lists, but not of values with and without wildcards"""
+    coalesce_mixed_wildcards = False
+
+def parse(condition, detection=definitions, backend=None):
+    config = SigmaConfiguration()
+    config.set_backend(backend)
+    parser = SigmaCollectionParser(rule % (detection, condition), config, None)
+    return tree(parser.parsers[0].condparsed[0].parsedSearch)
+
+def test_parser_precedence():
+    assert parse("sel1 or sel2 and not sel3") == ("or", [ ("a", 1), ("and", [ ("b", 2), ("not", ("c", 3)) ]) ])
+    assert parse("not sel1 and sel2 or sel3") == ("or", [ ("and", [ ("not", ("a", 1)), ("b", 2) ]), ("c", 3) ])
+
+def test_parser_parentheses():
+    assert parse("(sel1 or sel2) and not (sel3)") == ("and", [ ("or", [ ("a", 1), ("b", 2) ]), ("not", ("c", 3)) ])
+    assert parse("((sel1 or (sel2)))") == ("or", [ ("a", 1), ("b", 2) ])
+
+def test_parser_x_of():
+    assert parse("1 of sel* and not sel3") == ("and", [ ("or", [ ("a", 1), ("b", 2), ("c", 3) ]), ("not", ("c", 3)) ])
+
+@pytest.mark.parametrize("condition", [
+    "sel1 and",
+    "sel1 sel2",
+    "(sel1 or sel2",
+    "sel1)",
+    "()",
+    "not not sel1",
+    "1 of",
+    "sel1 or and sel2",
+    ])
+def test_parser_invalid(condition):
+    with pytest.raises(SigmaParseError):
+        parse(condition)
+
+def test_optimizer_duplicates():
+    assert parse("(sel1 and sel2) or (sel2 and sel1)") == ("and", [ ("a", 1), ("b", 2) ])
+    assert parse("sel1 and (sel2 and (sel3 and sel1))") == ("and", [ ("a", 1), ("b", 2), ("c", 3) ])
+
+def test_optimizer_many_operands():
+    count = 2000
+    detection = "".join("    sel%d:\n        f%d: %d\n" % (i, i % 10, i) for i in range(count))
+    condition = " or ".join("sel%d" % i for i in range(count))
+    assert parse(condition, detection) == ("or", [ ("f%d" % (i % 10), i) for i in range(count) ])
+    assert parse(condition, detection, ListBackend()) == ("or", [ ("f%d" % (i), list(range(i, count, 10))) for i in range(10) ])
+
+def test_optimizer_coalesce():
+    detection = """
+    sel1:
+        a: 1
+    sel2:
+        b: 2
+    sel3:
+        a:
+            - 3
+            - 1
+    sel4:
+        a: x
+    """
+    assert parse("1 of sel*", detection, ListBackend()) == ("or", [ ("a", [ 1, 3 ]), ("b", 2), ("a", "x") ])
+    assert parse("sel1 or sel3", detection, ListBackend()) == ("a", [ 1, 3 ])
+    assert parse("sel1 or sel3", detection) == ("or", [ ("a", 1), ("a", [ 3, 1 ]) ])
+
+def test_optimizer_coalesce_wildcards():
+    detection = """
+    sel1:
+        a: x
+    sel2:
+        a|endswith: y
+    sel3:
+        a:
+            - z
+            - w
+    sel4:
+        a|contains: v
+    sel5:
+        a:
+            - u
+            - t*
+    """
+    assert parse("1 of sel*", detection, ListBackend()) == ("a", [ "x", "*y", "z", "w", "*v*", "u", "t*" ])
+    assert parse("1 of sel*", detection, KeywordListBackend()) == ("or", [ ("a", [ "x", "z", "w" ]), ("a", [ "*y", "*v*" ]), ("a", [ "u", "t*" ]) ])
+
+def test_optimizer_subsumption():
+    detection = """
+    sel1:
+        a|contains:
+            - foo.exe
+            - bar
+            - foo
+            - Foo.dll
+    sel2:
+        a:
+            - 'foo.exe'
+            - 'foo*.exe'
+            - '*.exe'
+            - 'x?.exe'
+            - 'x\\*.exe'
+            - 'cmd'
+            - 'cmd*'
+    """
+    assert parse("sel1", detection) == ("a", [ "*bar*", "*foo*", "*Foo.dll*" ])
+    assert parse("sel2", detection) == ("a", [ "*.exe", "x?.exe", "x\\*.exe", "cmd*" ])
+
+def test_optimizer_factoring():
+    detection = """
+    sel1:
+        a: 1
+        b: 2
+    sel2:
+        a: 1
+        c: 3
+    sel3:
+        d: 4
+        e: 5
+    sel4:
+        a: 1
+        d: 4
+    """
+    assert parse("1 of sel*", detection) == ("or", [ ("and", [ ("a", 1), ("or", [ ("b", 2), ("c", 3), ("d", 4) ]) ]), ("and", [ ("d", 4), ("e", 5) ]) ])
+    assert parse("sel1 or sel3", detection) == ("or", [ ("and", [ ("a", 1), ("b", 2) ]), ("and", [ ("d", 4), ("e", 5) ]) ])
+
+def test_parse_tree_slots():
+    node = ConditionAND(None, None, ("a", 1))
+    assert not hasattr(node, "__dict__")
+    assert not hasattr(NodeSubexpression(node), "__dict__")
+
+def test_interning():
+    detection = """
+    sel1:
+        CommandLine|contains: foo
+    sel2:
+        CommandLine|contains: foo
+    """
+    parsed = [ SigmaCollectionParser(rule % (detection, "1 of sel*"), SigmaConfiguration(), None).parsers[0] for i in range(2) ]
+    items = [ parser.parse_definition_byname(name).items[0] for parser in parsed for name in ("sel1", "sel2") ]
+    assert all(item == ("CommandLine", "*foo*") for item in items)
+    assert all(item[0] is items[0][0] and item[1] is items[0][1] for item in items)
+
+def test_definition_memoization(monkeypatch):
+    from sigma.parser.rule import SigmaParser
+    calls = list()
+    parse_definition = SigmaParser.parse_definition
+    def count_calls(self, definition, condOverride=None):
+        calls.append(definition)
+        return parse_definition(self, definition, condOverride)
+    monkeypatch.setattr(SigmaParser, "parse_definition", count_calls)
+    assert parse("1 of sel* and not sel3 or sel3 and sel1") == ("or", [
+        ("and", [ ("or", [ ("a", 1), ("b", 2), ("c", 3) ]), ("not", ("c", 3)) ]),
+        ("and", [ ("c", 3), ("a", 1) ]),
+        ])
+    assert len(calls) == 3
@@ -0,0 +1,40 @@
+import json
+from sigma.config.collection import SigmaConfigurationManager
+
+def write_config(path, title):
+    path.write_text("title: %s\nbackends:\n  - splunk\nfieldmappings:\n  EventID: EventCode\n" % title)
+
+def test_config_index(tmp_path):
+    confdir = tmp_path / "config"
+    confdir.mkdir()
+    write_config(confdir / "test.yml", "Test")
+    (confdir / "broken.yml").write_text("- no map")
+    index_path = tmp_path / "index.json"
+    scm = SigmaConfigurationManager([ str(confdir) ], index_path)
+    assert scm.list() == [ ("test", "Test", [ "splunk" ]) ]
+    assert [ path.name for path, error in scm.errors ] == [ "broken.yml" ]
+    assert scm.configs == dict()
+    assert scm.get("test").fieldmappings["EventID"].target == "EventCode"
+    assert scm.get("test") is scm.get("test")
+
+    # persisted index is used for unchanged files
+    index = json.loads(index_path.read_text())
+    entry = index["configs"][str((confdir / "test.yml").resolve())]
+    entry["title"] = "From index"
+    index_path.write_text(json.dumps(index))
+    assert SigmaConfigurationManager([ str(confdir) ], index_path).list() == [ ("test", "From index", [ "splunk" ]) ]
+
+    # changed files are indexed again
+    write_config(confdir / "test.yml", "Changed title")
+    assert SigmaConfigurationManager([ str(confdir) ], index_path).list() == [ ("test", "Changed title", [ "splunk" ]) ]
+
+def test_config_index_not_persisted(tmp_path, monkeypatch):
+    confdir = tmp_path / "config"
+    confdir.mkdir()
+    write_config(confdir / "test.yml", "Test")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    scm = SigmaConfigurationManager([ str(confdir) ])
+    assert scm.index_path is None
+    assert scm.list() == [ ("test", "Test", [ "splunk" ]) ]
+    assert not (tmp_path / "cache").exists() and not (tmp_path / "home").exists()
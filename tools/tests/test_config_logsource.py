@@ -0,0 +1,67 @@
+from sigma.configuration import SigmaConfiguration, SigmaConfigurationChain
+from sigma.parser.collection import SigmaCollectionParser
+
+generic = """
+logsources:
+    process_creation:
+        category: process_creation
+        product: windows
+        rewrite:
+            product: windows
+            service: sysmon
+        conditions:
+            EventID: 1
+    windows:
+        product: windows
+        index: windows-*
+"""
+
+backend_config = """
+logsources:
+    sysmon:
+        product: windows
+        service: sysmon
+        conditions:
+            Channel: Microsoft-Windows-Sysmon/Operational
+    security:
+        product: windows
+        service: security
+        index: security-*
+"""
+
+rule = """
+title: Test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    selection:
+        Image: test.exe
+    condition: selection
+"""
+
+class IndexBackend:
+    index_field = "index"
+    coalesce_value_lists = False
+
+def test_logsource_rewrite():
+    chain = SigmaConfigurationChain([ SigmaConfiguration(generic), SigmaConfiguration(backend_config) ])
+    chain.set_backend(IndexBackend())
+    logsource = chain.get_logsource("process_creation", "windows", None)
+    assert logsource.conditions == [ [ ("EventID", 1) ], [ ("Channel", "Microsoft-Windows-Sysmon/Operational") ] ]
+    assert logsource.index == [ "windows-*" ]
+    assert chain.get_logsource("process_creation", "windows", None) is logsource
+    assert sorted(chain.get_logsource(None, "windows", "security").index) == [ "security-*", "windows-*" ]
+    assert chain.get_logsource("process_creation", None, None).conditions == []
+
+def test_logsource_condition():
+    chain = SigmaConfigurationChain([ SigmaConfiguration(generic), SigmaConfiguration(backend_config) ])
+    chain.set_backend(IndexBackend())
+    trees = [ SigmaCollectionParser(rule, chain, None).parsers[0].condparsed[0].parsedSearch.items for i in range(2) ]
+    assert trees[0] is not trees[1]
+    assert trees[0].items == trees[1].items == [
+            ("EventID", 1),
+            ("Channel", "Microsoft-Windows-Sysmon/Operational"),
+            ("index", "windows-*"),
+            ("Image", "test.exe"),
+            ]
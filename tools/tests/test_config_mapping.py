@@ -0,0 +1,34 @@
+from sigma.configuration import SigmaConfiguration, SigmaConfigurationChain
+from sigma.parser.collection import SigmaCollectionParser
+
+config = """
+fieldmappings:
+    Image: process.executable
+    FileVersion:
+        category=process_creation: process.pe.file_version
+        category=image_load: file.pe.file_version
+        default: winlog.event_data.FileVersion
+"""
+
+rule = """
+title: Test
+logsource:
+    category: %s
+detection:
+    selection:
+        FileVersion: 1
+    condition: selection
+"""
+
+def mapped_field(chain, category):
+    parser = SigmaCollectionParser(rule % category, chain, None).parsers[0]
+    return parser.condparsed[0].parsedSearch[0]
+
+def test_fieldmapping_chain():
+    chain = SigmaConfigurationChain([ SigmaConfiguration(config) ])
+    assert chain.get_fieldmapping("Image") is chain.get_fieldmapping("Image")
+    assert chain.get_fieldmapping("Image").resolve_fieldname("Image") == "process.executable"
+    assert mapped_field(chain, "image_load") == "file.pe.file_version"
+    assert mapped_field(chain, "registry_event") == "winlog.event_data.FileVersion"        # default isn't changed by previous rules
+    assert mapped_field(chain, "process_creation") == "process.pe.file_version"
+    assert mapped_field(chain, "image_load") == "file.pe.file_version"
@@ -0,0 +1,113 @@
+import pytest
+
+from sigma.correlation import SigmaCorrelationEngine, parseTime, parseTimeframe
+from sigma.matcher import SigmaRuleSet
+from sigma.parser.exceptions import SigmaParseError
+
+rule = """
+title: Test
+logsource:
+    product: windows
+detection:
+    selection:
+        EventID: 4625
+    login:
+        EventID: 4624
+    logoff:
+        EventID: 4634
+    timeframe: 1m
+    condition: %s
+"""
+
+def engine(condition):
+    engine = SigmaCorrelationEngine(timefield="time")
+    engine.add(rule % condition)
+    return engine
+
+def alerts(engine, *events):
+    """Process events given as (time, EventID, fields) and return (time, group, value) of all alerts"""
+    result = list()
+    for time, eventid, fields in events:
+        result.extend(engine.process(dict(time=time, EventID=eventid, **fields)))
+    result.extend(engine.flush())
+    return [ (alert.time, alert.group, alert.value) for alert in result ]
+
+def test_parse_time():
+    assert parseTimeframe("30s") == 30
+    assert parseTimeframe("7d") == 604800
+    assert parseTimeframe(None) is None
+    with pytest.raises(SigmaParseError):
+        parseTimeframe("1y")
+    assert parseTime("2022-01-01T00:01:00Z") == parseTime("2022-01-01 01:01:00+01:00") == 1640995260
+    assert parseTime("2022-01-01T00:01:00") == 1640995260
+    assert parseTime("1640995260.5") == parseTime(1640995260.5)
+    with pytest.raises(ValueError):
+        parseTime("yesterday")
+
+def test_count():
+    assert alerts(engine("selection | count() by ip > 2"),
+            (0, 4625, { "ip": "a" }),
+            (10, 4625, { "ip": "b" }),
+            (20, 4625, { "ip": "a" }),
+            (30, 4625, { "ip": "a" }),
+            (40, 4625, { "ip": "a" }),
+            (50, 4624, { "ip": "b" }),
+            (60, 4625, { "ip": "b" }),
+            (200, 4625, { "ip": "a" }),
+            (210, 4625, { "ip": "a" }),
+            (220, 4625, { "ip": "a" }),
+            (230, 4625, {}),
+            ) == [ (30, "a", 3), (220, "a", 3) ]
+
+def test_count_distinct():
+    assert alerts(engine("selection | count(user) by ip > 2"),
+            (0, 4625, { "ip": "a", "user": "x" }),
+            (10, 4625, { "ip": "a", "user": "x" }),
+            (20, 4625, { "ip": "a", "user": "y" }),
+            (30, 4625, { "ip": "a" }),
+            (70, 4625, { "ip": "a", "user": "z" }),
+            (80, 4625, { "ip": "a", "user": "x" }),
+            ) == [ (70, "a", 3) ]
+
+def test_numeric():
+    events = [
+            (0, 4625, { "ip": "a", "size": 50 }),
+            (10, 4625, { "ip": "a", "size": "40" }),
+            (20, 4625, { "ip": "a", "size": "x" }),
+            (65, 4625, { "ip": "a", "size": 70 }),
+            (70, 4625, { "ip": "a", "size": 10 }),
+            ]
+    assert alerts(engine("selection | sum(size) by ip > 100"), *events) == [ (65, "a", 110) ]
+    assert alerts(engine("selection | avg(size) by ip >= 50"), *events) == [ (0, "a", 50), (65, "a", 55) ]
+    assert alerts(engine("selection | max(size) > 60"), *events) == [ (65, None, 70) ]
+    assert alerts(engine("selection | min(size) < 20"), *events) == [ (70, None, 10) ]
+
+def test_count_less():
+    assert alerts(engine("selection | count() by ip < 2"),
+            (0, 4625, { "ip": "a" }),
+            (10, 4625, { "ip": "b" }),
+            (20, 4625, { "ip": "b" }),
+            (100, 4625, { "ip": "c" }),
+            ) == [ (0, "a", 1), (100, "c", 1) ]
+
+def test_near():
+    assert alerts(engine("selection | near login and not logoff"),
+            (0, 4625, {}),
+            (10, 4624, {}),
+            (20, 4624, {}),
+            (30, 4625, {}),
+            (40, 4634, {}),
+            (50, 4625, {}),
+            (55, 4624, {}),
+            (120, 4624, {}),
+            (130, 4625, {}),
+            ) == [ (10, None, 2), (30, None, 2), (130, None, 2) ]
+
+def test_ruleset():
+    correlation = SigmaCorrelationEngine()
+    ruleset = SigmaRuleSet(correlation=correlation)
+    ruleset.add(rule % "selection")
+    ruleset.add(rule % "selection | count() > 1")
+    assert len(ruleset.rules) == 1 and len(correlation.aggregations) == 1
+    with pytest.raises(NotImplementedError):
+        SigmaRuleSet().add(rule % "selection | count() > 1")
@@ -1,3 +1,45 @@
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.splunk import SplunkBackend
+from sigma.configuration import SigmaConfiguration
+
+rules = """
+action: global
+title: Test
+detection:
+    selection:
+        EventID: 1
+    condition: selection
+---
+logsource:
+    product: windows
+    service: security
+---
+action: repeat
+logsource:
+    service: system
+---
+action: repeat
+detection:
+    selection:
+        EventID: 2
+"""
 
 def test_collection():
-    pass
+    parser = SigmaCollectionParser(rules)
+    assert [ rule["logsource"] for rule in parser ] == [
+            { "product": "windows", "service": "security" },
+            { "product": "windows", "service": "system" },
+            { "product": "windows", "service": "system" },
+            ]
+    assert [ rule["detection"]["selection"]["EventID"] for rule in parser ] == [ 1, 1, 2 ]
+    first, second, third = [ rule.parsedyaml for rule in parser.parsers ]
+    assert first["detection"] is second["detection"]            # unchanged parts of repeated rules are shared
+    assert second["logsource"] is third["logsource"]
+    assert second["detection"] is not third["detection"]
+
+def test_collection_lazy():
+    config = SigmaConfiguration()
+    parser = SigmaCollectionParser(rules, config, None, None, lazy=True)
+    assert parser.parsers is None
+    assert list(parser.generate(SplunkBackend(config))) == [ 'EventID="1"', 'EventID="1"', 'EventID="2"' ]
+    assert list(parser.generate(SplunkBackend(config))) == []       # rules can only be consumed once
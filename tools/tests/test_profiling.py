@@ -0,0 +1,41 @@
+from sigma import profiling
+from sigma.parser.collection import SigmaCollectionParser
+from sigma.backends.splunk import SplunkBackend
+from sigma.configuration import SigmaConfiguration
+
+rules = """
+title: First
+logsource:
+    product: windows
+detection:
+    selection:
+        EventID: 1
+    condition: selection
+---
+title: Second
+logsource:
+    product: windows
+detection:
+    selection:
+        EventID: 2
+    filter:
+        User: test
+    condition: selection and not filter
+"""
+
+def test_profiling():
+    profiler = profiling.enable()
+    try:
+        config = SigmaConfiguration()
+        parser = SigmaCollectionParser(rules, config, None, None)
+        list(parser.generate(SplunkBackend(config)))
+    finally:
+        profiling.profiler = None
+
+    results = profiler.results(slowest=1)
+    assert set(results["phases"]) == set(profiling.PHASES)
+    assert results["phases"]["yaml_load"]["rules"] == 1
+    assert results["phases"]["generate"]["rules"] == 2
+    assert len(results["phases"]["parse_sigma"]["slowest"]) == 1
+    assert set(results["rules"]) == { "<rule>", "<rule>#2" }
+    assert set(results["rules"]["<rule>#2"]) == { "rule_filter", "parse_sigma", "tokenization", "parse_search", "optimize_tree", "generate" }